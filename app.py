@@ -3,28 +3,52 @@ CRONOGRAMA UTB — app.py v2
 Con módulo de finanzas, roles y exportación Excel
 """
 
-from flask import Flask, render_template, request, jsonify, send_file
+from flask import Flask, render_template, request, jsonify, send_file, g, make_response, has_request_context
 from werkzeug.security import generate_password_hash, check_password_hash
+from itsdangerous import URLSafeTimedSerializer, BadSignature
 import psycopg2
-from psycopg2.extras import RealDictCursor
+import psycopg2.extensions
+from psycopg2.extras import RealDictCursor, execute_values
+from psycopg2.pool import ThreadedConnectionPool, PoolError
 import os
-from datetime import datetime
+import threading
+import time
+import json
+import base64
+import bisect
+import functools
+import hashlib
+import importlib.util
+import logging
+import logging.handlers
+import random
+import re
+import shutil
+import tempfile
+import uuid
 import io
-
-# Para exportar a Excel
-try:
-    import openpyxl
-    from openpyxl.styles import Font, PatternFill, Alignment, Border, Side
-    from openpyxl.utils import get_column_letter
-    EXCEL_AVAILABLE = True
-except ImportError:
-    EXCEL_AVAILABLE = False
+import csv
+import unicodedata
+import queue
+import select
+import sqlite3
+from concurrent.futures import ThreadPoolExecutor
+from collections import OrderedDict
+from datetime import datetime, date, timedelta, timezone
+from decimal import Decimal
+
+# Para exportar a Excel. openpyxl tarda más en importarse que Flask: sólo se
+# comprueba que esté instalado y se carga en el primer uso (cargar_openpyxl)
+EXCEL_AVAILABLE = importlib.util.find_spec("openpyxl") is not None
 
 app = Flask(__name__)
 
 DATABASE_URL = os.environ.get('DATABASE_URL')
 if DATABASE_URL and DATABASE_URL.startswith("postgres://"):
     DATABASE_URL = DATABASE_URL.replace("postgres://", "postgresql://", 1)
+# sqlite:///archivo.db usa SQLite embebido (ver ALMACENAMIENTO SQLITE)
+ES_SQLITE = bool(DATABASE_URL) and DATABASE_URL.startswith("sqlite:")
+SQLITE_RUTA = DATABASE_URL[len("sqlite:///"):] if ES_SQLITE else None
 
 SCHEMA = "cronograma"
 MAX_USUARIOS = 5
@@ -38,6 +62,19 @@ CARGOS_VALIDOS = [
     "Director Financiero"
 ]
 
+# Estado de una actividad según fecha_completado vs fecha_limite
+# (misma lógica que la leyenda de la app; columna actividades.estado,
+# ver migraciones/0002):
+#   default   → no completada (en ejecución)
+#   prematuro → más de 7 días antes del límite
+#   tiempo    → hasta el día límite
+#   leve      → hasta 7 días de retraso
+#   tarde     → más de 7 días de retraso
+ESTADOS = ("default", "prematuro", "tiempo", "leve", "tarde")
+
+# Tablas cuya versión de datos se lleva en la tabla `versiones`
+TABLAS_VERSIONADAS = ("actividades", "finanzas", "usuarios")
+
 def cargo_a_rol(cargo):
     """Deriva el rol del sistema a partir del cargo."""
     if cargo == "Director Financiero":
@@ -48,90 +85,1514 @@ def cargo_a_rol(cargo):
         return "miembro"
 
 
-def get_db():
-    conn = psycopg2.connect(DATABASE_URL)
-    cursor = conn.cursor()
-    cursor.execute(f"SET search_path TO {SCHEMA}, public")
-    cursor.close()
+# ============================================================
+# MÉTRICAS
+# ============================================================
+# Histogramas y contadores en memoria, expuestos en formato de texto de
+# Prometheus en /metrics. Registrar una observación es un bisect y una suma
+# bajo un lock; el texto sólo se arma cuando alguien consulta /metrics.
+# Cada worker de gunicorn lleva sus propios valores (el scrape ve los del
+# worker que responde; con varios workers conviene un scrape por proceso).
+BUCKETS_SEGUNDOS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+BUCKETS_CONSULTAS = (0, 1, 2, 3, 5, 8, 13, 21, 50, 100)
+BUCKETS_EXPORT = (0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+
+
+def _escapar_etiqueta(valor):
+    return str(valor).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _etiquetas(nombres, valores, **extra):
+    pares = [f'{n}="{_escapar_etiqueta(v)}"' for n, v in [*zip(nombres, valores), *extra.items()]]
+    return "{" + ",".join(pares) + "}" if pares else ""
+
+
+class Contador:
+    """Contador monotónico por combinación de etiquetas."""
+
+    def __init__(self, nombre, ayuda, etiquetas=()):
+        self.nombre = nombre
+        self.ayuda = ayuda
+        self.etiquetas = etiquetas
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *valores, n=1):
+        with self._lock:
+            self._series[valores] = self._series.get(valores, 0) + n
+
+    def exponer(self):
+        with self._lock:
+            series = sorted(self._series.items())
+        lineas = [f"# HELP {self.nombre} {self.ayuda}", f"# TYPE {self.nombre} counter"]
+        lineas += [f"{self.nombre}{_etiquetas(self.etiquetas, v)} {n}" for v, n in series]
+        return lineas
+
+
+class Histograma:
+    """Histograma acumulativo (cubetas `le`, _sum y _count) por etiquetas."""
+
+    def __init__(self, nombre, ayuda, etiquetas=(), limites=BUCKETS_SEGUNDOS):
+        self.nombre = nombre
+        self.ayuda = ayuda
+        self.etiquetas = etiquetas
+        self.limites = limites
+        self._series = {}   # valores de etiquetas → [n por cubeta..., n sobre el último límite, suma]
+        self._lock = threading.Lock()
+
+    def observar(self, valor, *valores):
+        i = bisect.bisect_left(self.limites, valor)
+        with self._lock:
+            serie = self._series.get(valores)
+            if serie is None:
+                serie = self._series[valores] = [0] * (len(self.limites) + 1) + [0.0]
+            serie[i] += 1
+            serie[-1] += valor
+
+    def suma(self):
+        """Suma de las observaciones de todas las series."""
+        with self._lock:
+            return sum(serie[-1] for serie in self._series.values())
+
+    def exponer(self):
+        with self._lock:
+            series = sorted((v, list(s)) for v, s in self._series.items())
+        lineas = [f"# HELP {self.nombre} {self.ayuda}", f"# TYPE {self.nombre} histogram"]
+        for valores, serie in series:
+            acumulado = 0
+            for limite, n in zip(self.limites + ("+Inf",), serie):
+                acumulado += n
+                lineas.append(f"{self.nombre}_bucket"
+                              f"{_etiquetas(self.etiquetas, valores, le=limite)} {acumulado}")
+            lineas.append(f"{self.nombre}_sum{_etiquetas(self.etiquetas, valores)} {serie[-1]:.6f}")
+            lineas.append(f"{self.nombre}_count{_etiquetas(self.etiquetas, valores)} {acumulado}")
+        return lineas
+
+
+metricas_http = Histograma("cronograma_http_duracion_segundos",
+                           "Duración de la petición hasta armar la respuesta", ("endpoint", "metodo"))
+metricas_respuestas = Contador("cronograma_http_respuestas_total",
+                               "Respuestas por endpoint y código de estado", ("endpoint", "metodo", "estado"))
+metricas_db_adquisicion = Histograma("cronograma_db_adquisicion_segundos",
+                                     "Espera para obtener una conexión del pool")
+metricas_db_consultas = Histograma("cronograma_db_consultas_por_peticion",
+                                   "Sentencias SQL ejecutadas por petición", ("endpoint",),
+                                   BUCKETS_CONSULTAS)
+metricas_db_tiempo = Histograma("cronograma_db_tiempo_por_peticion_segundos",
+                                "Tiempo total en sentencias SQL por petición", ("endpoint",))
+metricas_export = Histograma("cronograma_export_excel_segundos",
+                             "Generación del libro Excel (sin los aciertos de caché)", ("origen",),
+                             BUCKETS_EXPORT)
+METRICAS = (metricas_http, metricas_respuestas, metricas_db_adquisicion,
+            metricas_db_consultas, metricas_db_tiempo, metricas_export)
+
+
+def registrar_consulta(segundos, sql=None, params=None, explicar=None):
+    """Suma una sentencia a la petición en curso (fuera de una petición no
+    cuenta) y la anota en el log de consultas lentas si superó el umbral."""
+    if has_request_context():
+        g.db_consultas = g.get("db_consultas", 0) + 1
+        g.db_segundos = g.get("db_segundos", 0.0) + segundos
+    if sql is not None and segundos * 1000 >= CONSULTA_LENTA_MS:
+        consulta_lenta(sql, params, segundos, explicar)
+
+
+_CURSORES_MEDIDOS = {}
+
+
+def cursor_medido(base):
+    """Subclase de la clase de cursor `base` que mide cada sentencia."""
+    clase = _CURSORES_MEDIDOS.get(base)
+    if clase is None:
+        class CursorMedido(base):
+            def execute(self, query, vars=None):
+                t0 = time.perf_counter()
+                try:
+                    return super().execute(query, vars)
+                finally:
+                    registrar_consulta(time.perf_counter() - t0, query, vars,
+                                       lambda: explicar_pg(self.connection, query, vars))
+
+            def executemany(self, query, vars_list):
+                t0 = time.perf_counter()
+                try:
+                    return super().executemany(query, vars_list)
+                finally:
+                    registrar_consulta(time.perf_counter() - t0, query)
+
+            def copy_expert(self, sql, file, size=8192):
+                t0 = time.perf_counter()
+                try:
+                    return super().copy_expert(sql, file, size)
+                finally:
+                    registrar_consulta(time.perf_counter() - t0, sql)
+
+        clase = _CURSORES_MEDIDOS[base] = CursorMedido
+    return clase
+
+
+class ConexionMedida(psycopg2.extensions.connection):
+    """Conexión del pool cuyos cursores (de cualquier cursor_factory) se miden."""
+
+    def cursor(self, *args, **kwargs):
+        base = kwargs.pop("cursor_factory", None) or self.cursor_factory or psycopg2.extensions.cursor
+        return super().cursor(*args, cursor_factory=cursor_medido(base), **kwargs)
+
+
+@app.before_request
+def iniciar_medicion():
+    g.t_inicio = time.perf_counter()
+    g.db_consultas = 0
+    g.db_segundos = 0.0
+
+
+@app.after_request
+def registrar_medicion(response):
+    # Registrado antes que los demás hooks: corre al final de los after_request
+    t_inicio = g.get("t_inicio")
+    if t_inicio is not None:
+        endpoint = request.endpoint or "sin_ruta"
+        metricas_http.observar(time.perf_counter() - t_inicio, endpoint, request.method)
+        metricas_respuestas.inc(endpoint, request.method, response.status_code)
+        metricas_db_consultas.observar(g.db_consultas, endpoint)
+        metricas_db_tiempo.observar(g.db_segundos, endpoint)
+    return response
+
+
+# ============================================================
+# CONSULTAS LENTAS
+# ============================================================
+# Toda sentencia que tarde CONSULTA_LENTA_MS o más se anota (una línea JSON)
+# en un log rotativo: SQL normalizado, forma de los parámetros (tipos, no
+# valores), duración y endpoint. A una muestra se le agrega el plan: en
+# PostgreSQL EXPLAIN (ANALYZE, BUFFERS) para las lecturas y EXPLAIN sin
+# ANALYZE para lo demás (no se reejecutan escrituras), dentro de un
+# SAVEPOINT para no tocar la transacción de la petición; en SQLite EXPLAIN
+# QUERY PLAN. Cada SQL normalizado se explica como mucho una vez cada
+# EXPLAIN_INTERVALO segundos por worker.
+CONSULTA_LENTA_MS     = float(os.environ.get("CONSULTA_LENTA_MS", 200))
+CONSULTAS_LENTAS_LOG  = os.environ.get("CONSULTAS_LENTAS_LOG",
+                                       os.path.join(tempfile.gettempdir(), "cronograma_consultas_lentas.log"))
+CONSULTAS_LENTAS_MB   = float(os.environ.get("CONSULTAS_LENTAS_MB", 10))     # tamaño antes de rotar
+CONSULTAS_LENTAS_COPIAS = int(os.environ.get("CONSULTAS_LENTAS_COPIAS", 5))  # archivos rotados que se guardan
+EXPLAIN_MUESTREO      = float(os.environ.get("EXPLAIN_MUESTREO", 0.2))       # fracción de consultas lentas
+EXPLAIN_INTERVALO     = float(os.environ.get("EXPLAIN_INTERVALO", 300))
+EXPLAIN_TIMEOUT_MS    = int(os.environ.get("EXPLAIN_TIMEOUT_MS", 5000))      # statement_timeout del EXPLAIN ANALYZE
+SQL_MAX_LOG           = 4000                                                 # caracteres de SQL por entrada
+
+_LITERAL_RE = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b")
+_ESPACIOS_RE = re.compile(r"\s+")
+# Las filas de VALUES que arma execute_values: (?, ?), (?, ?), ... → (?, ?), ...
+_FILAS_RE = re.compile(r"(\([^()]*\))(?:, ?\1)+")
+# Sólo éstas tienen plan (un CREATE o un SET ya no se pueden repetir)
+_EXPLICABLES = ("SELECT ", "WITH ", "INSERT ", "UPDATE ", "DELETE ")
+
+_log_lentas = None
+_log_lentas_pid = None
+_ultimo_explain = {}
+_lentas_lock = threading.Lock()
+
+
+def normalizar_sql(sql):
+    """SQL en una línea, con los literales reemplazados por ?."""
+    if isinstance(sql, bytes):
+        sql = sql.decode("utf-8", "replace")
+    sql = _ESPACIOS_RE.sub(" ", str(sql)).strip()
+    return _FILAS_RE.sub(r"\1, ...", _LITERAL_RE.sub("?", sql))[:SQL_MAX_LOG]
+
+
+def forma_parametros(params):
+    """Tipos de los parámetros (nunca sus valores)."""
+    if isinstance(params, dict):
+        return {k: forma_parametros(v) for k, v in params.items()}
+    if isinstance(params, (list, tuple)):
+        if len(params) > 10:
+            return f"{type(params).__name__}[{len(params)}]"
+        return [forma_parametros(v) for v in params]
+    return type(params).__name__
+
+
+def log_consultas_lentas():
+    """Logger del proceso actual; el archivo se abre en la primera consulta lenta."""
+    global _log_lentas, _log_lentas_pid
+    if _log_lentas_pid != os.getpid():
+        with _lentas_lock:
+            if _log_lentas_pid != os.getpid():
+                log = logging.getLogger("cronograma.consultas_lentas")
+                log.propagate = False
+                log.setLevel(logging.INFO)
+                for handler in list(log.handlers):
+                    log.removeHandler(handler)
+                handler = logging.handlers.RotatingFileHandler(
+                    CONSULTAS_LENTAS_LOG, maxBytes=int(CONSULTAS_LENTAS_MB * 2**20),
+                    backupCount=CONSULTAS_LENTAS_COPIAS, encoding="utf-8", delay=True)
+                handler.setFormatter(logging.Formatter("%(message)s"))
+                log.addHandler(handler)
+                _log_lentas, _log_lentas_pid = log, os.getpid()
+    return _log_lentas
+
+
+def toca_explicar(normalizada):
+    if random.random() >= EXPLAIN_MUESTREO:
+        return False
+    ahora = time.monotonic()
+    with _lentas_lock:
+        if ahora - _ultimo_explain.get(normalizada, -EXPLAIN_INTERVALO) < EXPLAIN_INTERVALO:
+            return False
+        _ultimo_explain[normalizada] = ahora
+    return True
+
+
+def consulta_lenta(sql, params, segundos, explicar=None):
+    normalizada = normalizar_sql(sql)
+    entrada = {
+        "ts": datetime.now(timezone.utc).isoformat(timespec="milliseconds"),
+        "pid": os.getpid(),
+        "endpoint": request.endpoint if has_request_context() else None,
+        "ms": round(segundos * 1000, 1),
+        "sql": normalizada,
+        "parametros": None if params is None else forma_parametros(params),
+    }
+    if explicar is not None and normalizada.upper().startswith(_EXPLICABLES) and toca_explicar(normalizada):
+        entrada["plan"] = explicar()
+    try:
+        log_consultas_lentas().info(json.dumps(entrada, ensure_ascii=False, default=str))
+    except OSError as e:
+        app.logger.warning("No se pudo escribir el log de consultas lentas: %s", e)
+
+
+def es_lectura(sql):
+    texto = normalizar_sql(sql).upper()
+    return texto.startswith("SELECT ") and " FOR UPDATE" not in texto and "PG_NOTIFY" not in texto
+
+
+def explicar_pg(conn, sql, params):
+    """Plan de `sql` en la transacción de `conn`, sin alterarla (SAVEPOINT)."""
+    if conn.info.transaction_status != psycopg2.extensions.TRANSACTION_STATUS_INTRANS:
+        return "(sin plan: la conexión no está en una transacción válida)"
+    if isinstance(sql, bytes):
+        sql = sql.decode()
+    opciones = "ANALYZE, BUFFERS" if es_lectura(sql) else "COSTS"
+    # Cursor base: la sentencia del EXPLAIN no se mide ni se cuenta
+    c = psycopg2.extensions.cursor(conn)
+    try:
+        c.execute("SAVEPOINT explicar_consulta")
+        try:
+            c.execute(f"SET LOCAL statement_timeout = {EXPLAIN_TIMEOUT_MS}")
+            c.execute(f"EXPLAIN ({opciones}) {sql}", params)
+            return "\n".join(fila[0] for fila in c.fetchall())
+        except psycopg2.Error as e:
+            return f"(sin plan: {str(e).splitlines()[0]})"
+        finally:
+            # Deshace también la ejecución del ANALYZE y el SET LOCAL
+            c.execute("ROLLBACK TO SAVEPOINT explicar_consulta")
+            c.execute("RELEASE SAVEPOINT explicar_consulta")
+    except psycopg2.Error as e:
+        return f"(sin plan: {str(e).splitlines()[0]})"
+    finally:
+        c.close()
+
+
+def explicar_sqlite(conn, sql, params):
+    try:
+        filas = conn.execute("EXPLAIN QUERY PLAN " + sql, params if params is not None else ()).fetchall()
+    except sqlite3.Error as e:
+        return f"(sin plan: {e})"
+    # (id, padre, -, detalle) → árbol indentado
+    niveles = {0: 0}
+    lineas = []
+    for id_, padre, _, detalle in filas:
+        niveles[id_] = niveles.get(padre, 0) + 1
+        lineas.append("  " * (niveles[id_] - 1) + detalle)
+    return "\n".join(lineas)
+
+
+# ============================================================
+# POOL DE CONEXIONES
+# ============================================================
+# Un pool por proceso worker de gunicorn. El search_path se fija en el
+# arranque de cada conexión física (opción -c del protocolo), así que no
+# cuesta ningún round trip adicional por petición.
+DB_POOL_MIN     = int(os.environ.get("DB_POOL_MIN", 1))
+DB_POOL_MAX     = int(os.environ.get("DB_POOL_MAX", 5))
+DB_POOL_TIMEOUT = float(os.environ.get("DB_POOL_TIMEOUT", 10))   # seg. esperando conexión libre
+DB_POOL_PING    = float(os.environ.get("DB_POOL_PING", 30))      # seg. de inactividad antes de verificar
+
+
+class PoolDB:
+    """Pool de conexiones PostgreSQL consciente del fork de gunicorn.
+
+    `conexion` se pasa tal cual a psycopg2.connect (p. ej. connection_factory).
+    """
+
+    def __init__(self, dsn, minconn, maxconn, timeout, ping, **conexion):
+        self.dsn = dsn
+        self.conexion = conexion
+        self.minconn = minconn
+        self.maxconn = maxconn
+        self.timeout = timeout
+        self.ping = ping
+        self._pid = None
+        self._pool = None
+        self._lock = threading.Lock()
+        self._libres = None
+        self._ultimo_uso = {}
+        self._ociosas = set()
+        self._sin_entregar = 0
+        self._stats = {}
+
+    def _asegurar_pool(self):
+        """Crea el pool la primera vez y de nuevo si el proceso fue forkeado."""
+        pid = os.getpid()
+        if self._pid == pid:
+            return
+        with self._lock:
+            if self._pid == pid:
+                return
+            # Tras un fork NO se cierran las conexiones heredadas: pertenecen al
+            # proceso padre. Solo se descartan las referencias.
+            self._pool = ThreadedConnectionPool(
+                self.minconn, self.maxconn, self.dsn,
+                options=f"-c search_path={SCHEMA},public", **self.conexion
+            )
+            self._libres = threading.BoundedSemaphore(self.maxconn)
+            self._ultimo_uso = {}
+            # Conexiones abiertas sin prestar: las devueltas (por id) y las que
+            # el pool abrió al crearse y todavía no entregó
+            self._ociosas = set()
+            self._sin_entregar = self.minconn
+            self._stats = {
+                "checkouts": 0, "esperas": 0, "timeouts": 0,
+                "descartadas": 0, "espera_total_ms": 0.0, "en_uso": 0,
+            }
+            self._pid = pid
+
+    def _sana(self, conn):
+        """Verifica la conexión solo si lleva inactiva más de `ping` segundos."""
+        if conn.closed:
+            return False
+        if time.monotonic() - self._ultimo_uso.get(id(conn), 0) < self.ping:
+            return True
+        try:
+            # Cursor sin medir: el ping del pool no es una consulta de la petición
+            c = psycopg2.extensions.cursor(conn)
+            c.execute("SELECT 1")
+            c.close()
+            conn.rollback()
+            return True
+        except psycopg2.Error:
+            return False
+
+    def _contar(self, **incrementos):
+        """Suma a los contadores de stats(); varios hilos los actualizan a la vez."""
+        with self._lock:
+            for clave, n in incrementos.items():
+                self._stats[clave] += n
+
+    def _tomar(self):
+        """getconn del pool interno, llevando la cuenta de las ociosas.
+
+        El pool entrega primero una ociosa y sólo abre otra si no queda
+        ninguna: una conexión desconocida es de las abiertas al crearlo
+        mientras quede alguna de ellas.
+        """
+        conn = self._pool.getconn()
+        with self._lock:
+            if id(conn) in self._ociosas:
+                self._ociosas.discard(id(conn))
+            elif self._sin_entregar:
+                self._sin_entregar -= 1
+        return conn
+
+    def getconn(self):
+        self._asegurar_pool()
+        t0 = time.monotonic()
+        if not self._libres.acquire(blocking=False):
+            self._contar(esperas=1)
+            if not self._libres.acquire(timeout=self.timeout):
+                self._contar(timeouts=1)
+                raise PoolError("No hay conexiones libres en el pool")
+        try:
+            conn = self._tomar()
+            while not self._sana(conn):
+                self._contar(descartadas=1)
+                self._ultimo_uso.pop(id(conn), None)
+                self._pool.putconn(conn, close=True)
+                conn = self._tomar()
+        except Exception:
+            self._libres.release()
+            raise
+        self._contar(checkouts=1, en_uso=1, espera_total_ms=(time.monotonic() - t0) * 1000)
+        return conn
+
+    def putconn(self, conn):
+        if self._pid != os.getpid():
+            return
+        # putconn hace rollback de cualquier transacción abierta
+        self._ultimo_uso[id(conn)] = time.monotonic()
+        # Se anota como ociosa antes de devolverla: otro hilo puede tomarla
+        # en cuanto vuelve al pool
+        with self._lock:
+            self._stats["en_uso"] -= 1
+            self._ociosas.add(id(conn))
+        try:
+            self._pool.putconn(conn, close=conn.closed)
+        finally:
+            # Por encima de minconn ociosas el pool cierra la devuelta
+            if conn.closed:
+                with self._lock:
+                    self._ociosas.discard(id(conn))
+                self._ultimo_uso.pop(id(conn), None)
+            self._libres.release()
+
+    def stats(self):
+        self._asegurar_pool()
+        with self._lock:
+            contadores = dict(self._stats)
+            libres = len(self._ociosas) + self._sin_entregar
+        checkouts = contadores["checkouts"]
+        en_uso = contadores["en_uso"]
+        return {
+            "pid": self._pid,
+            "min": self.minconn,
+            "max": self.maxconn,
+            "en_uso": en_uso,
+            "libres": libres,
+            "abiertas": en_uso + libres,
+            "checkouts": checkouts,
+            "esperas": contadores["esperas"],
+            "timeouts": contadores["timeouts"],
+            "descartadas": contadores["descartadas"],
+            "espera_media_ms": round(contadores["espera_total_ms"] / checkouts, 3) if checkouts else 0.0,
+        }
+
+
+# ============================================================
+# ALMACENAMIENTO SQLITE
+# ============================================================
+# Para un solo nodo con pocos usuarios: DATABASE_URL=sqlite:///cronograma.db
+# (ruta relativa) o sqlite:////ruta/absoluta.db. Las rutas usan el mismo
+# código que con PostgreSQL: ConexionSQLite imita lo que la app usa de
+# psycopg2 (placeholders %s y %(nombre)s, RealDictCursor, commit/rollback) y
+# las sentencias propias de cada motor están en SQL_MOTOR. Cada hilo abre
+# su conexión una sola vez, en modo WAL: los lectores no bloquean al
+# escritor ni entre sí, y no hay ningún round trip de red.
+SQLITE_VERSION_MIN = (3, 39, 0)   # RETURNING, UPDATE ... FROM, IS NOT DISTINCT FROM
+SQLITE_SENTENCIAS_CACHE = 256     # sentencias preparadas que conserva cada conexión
+SQLITE_PRAGMAS = (
+    "PRAGMA journal_mode = WAL",
+    "PRAGMA synchronous = NORMAL",    # con WAL sólo arriesga la última transacción ante un corte de luz
+    "PRAGMA busy_timeout = 5000",     # ms esperando al escritor de turno
+    "PRAGMA cache_size = -65536",     # 64 MB de páginas en memoria por conexión
+    "PRAGMA mmap_size = 268435456",   # lecturas sin copiar páginas al espacio del proceso
+    "PRAGMA temp_store = MEMORY",
+)
+SCHEMA_SQLITE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "schema.sql")
+
+# Tipos declarados en schema.sql → objetos Python (los mismos que da psycopg2)
+sqlite3.register_adapter(date, date.isoformat)
+sqlite3.register_adapter(datetime, lambda d: d.isoformat(" "))
+sqlite3.register_converter("DATE", lambda b: date.fromisoformat(b.decode()))
+sqlite3.register_converter("TIMESTAMP", lambda b: datetime.fromisoformat(b.decode()))
+sqlite3.register_converter("BOOLEAN", lambda b: b not in (b"0", b""))
+sqlite3.register_converter("DECIMAL", lambda b: Decimal(b.decode()))
+
+_PARAMETRO_RE = re.compile(r"%\((\w+)\)s|%s|%%")
+
+
+@functools.lru_cache(maxsize=512)
+def traducir_sql(sql):
+    """Placeholders de psycopg2 (%s, %(nombre)s, %%) a los de sqlite3."""
+    return _PARAMETRO_RE.sub(
+        lambda m: f":{m.group(1)}" if m.group(1) else ("?" if m.group(0) == "%s" else "%"), sql)
+
+
+def _fila_dict(cursor, fila):
+    return {col[0]: valor for col, valor in zip(cursor.description, fila)}
+
+
+class CursorSQLite:
+    """Cursor de sqlite3 con la parte de la interfaz de psycopg2 que usa la app."""
+
+    def __init__(self, conn, como_dict):
+        self._c = conn.cursor()
+        if como_dict:
+            self._c.row_factory = _fila_dict
+
+    def execute(self, sql, params=None):
+        # Como psycopg2: sin parámetros el texto va tal cual (un % es un %)
+        texto = sql if params is None else traducir_sql(sql)
+        t0 = time.perf_counter()
+        try:
+            if params is None:
+                self._c.execute(texto)
+            else:
+                self._c.execute(texto, params)
+        finally:
+            registrar_consulta(time.perf_counter() - t0, sql, params,
+                               lambda: explicar_sqlite(self._c.connection, texto, params))
+
+    def executemany(self, sql, filas):
+        t0 = time.perf_counter()
+        try:
+            self._c.executemany(traducir_sql(sql), filas)
+        finally:
+            registrar_consulta(time.perf_counter() - t0, sql)
+
+    def fetchone(self):
+        return self._c.fetchone()
+
+    def fetchall(self):
+        return self._c.fetchall()
+
+    def fetchmany(self, n):
+        return self._c.fetchmany(n)
+
+    def __iter__(self):
+        return iter(self._c)
+
+    @property
+    def rowcount(self):
+        return self._c.rowcount
+
+    @property
+    def description(self):
+        return self._c.description
+
+    def close(self):
+        self._c.close()
+
+
+def conexion_directa():
+    """Conexión fuera del pool (migraciones, canal de eventos); en SQLite en
+    modo autocommit, las transacciones se abren a mano."""
+    if not ES_SQLITE:
+        return psycopg2.connect(DATABASE_URL)
+    if sqlite3.sqlite_version_info < SQLITE_VERSION_MIN:
+        raise RuntimeError(f"Se necesita SQLite {'.'.join(map(str, SQLITE_VERSION_MIN))} o superior "
+                           f"(instalado: {sqlite3.sqlite_version})")
+    conn = sqlite3.connect(SQLITE_RUTA, detect_types=sqlite3.PARSE_DECLTYPES, isolation_level=None,
+                           cached_statements=SQLITE_SENTENCIAS_CACHE)
+    for pragma in SQLITE_PRAGMAS:
+        conn.execute(pragma)
     return conn
 
 
-def init_db():
-    conn = psycopg2.connect(DATABASE_URL)
-    c = conn.cursor()
+class ConexionSQLite:
+    """Conexión SQLite de un hilo con la interfaz de una conexión psycopg2."""
+
+    def __init__(self):
+        self._conn = conexion_directa()
+        # Como psycopg2: la primera escritura abre una transacción que dura hasta commit/rollback
+        self._conn.isolation_level = "DEFERRED"
+        self.closed = False
+
+    def cursor(self, name=None, cursor_factory=None):
+        # `name` (cursor de servidor en PostgreSQL) no hace falta: sqlite3 ya
+        # entrega las filas a medida que se leen
+        return CursorSQLite(self._conn, cursor_factory is not None)
+
+    def commit(self):
+        self._conn.commit()
+
+    def rollback(self):
+        self._conn.rollback()
+
+    def close(self):
+        self._conn.close()
+        self.closed = True
+
+
+class PoolSQLite:
+    """Una conexión por hilo y por proceso, abierta en el primer uso y reutilizada."""
+
+    def __init__(self):
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._stats = {"abiertas": 0, "checkouts": 0}
+
+    def getconn(self):
+        conn = getattr(self._local, "conn", None)
+        abierta = conn is None or conn.closed or self._local.pid != os.getpid()
+        if abierta:
+            conn = ConexionSQLite()
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        with self._lock:
+            self._stats["abiertas"] += abierta
+            self._stats["checkouts"] += 1
+        return conn
+
+    def putconn(self, conn):
+        # Igual que el pool de PostgreSQL: lo que no se confirmó se descarta
+        if not conn.closed:
+            conn.rollback()
+
+    def stats(self):
+        with self._lock:
+            return {"motor": "sqlite", "pid": os.getpid(), "ruta": SQLITE_RUTA, **self._stats}
+
+
+def sentencias_sqlite(script):
+    """Divide un script SQL en sentencias (respeta los BEGIN ... END de los triggers)."""
+    sentencias, actual = [], ""
+    for linea in script.splitlines(keepends=True):
+        actual += linea
+        if sqlite3.complete_statement(actual):
+            sentencias.append(actual)
+            actual = ""
+    return sentencias
+
+
+def ejecutar_valores(c, sql, filas, plantilla=None):
+    """execute_values(fetch=True) de psycopg2: una sola sentencia multi-fila.
+
+    En SQLite el `VALUES %s` se expande a (%s, ...), (%s, ...) y la plantilla
+    (casts de PostgreSQL) no se usa.
+    """
+    if not ES_SQLITE:
+        return execute_values(c, sql, filas, template=plantilla, page_size=len(filas), fetch=True)
+    grupo = "(" + ", ".join(["%s"] * len(filas[0])) + ")"
+    c.execute(sql.replace("VALUES %s", "VALUES " + ", ".join([grupo] * len(filas)), 1),
+              [v for fila in filas for v in fila])
+    return c.fetchall()
+
+
+# Sentencias que cambian entre motores. En SQLite cambio_xid no es un xid
+# sino un contador global (tabla secuencia_cambios) que los triggers asignan
+# en orden de commit, porque hay un solo escritor a la vez.
+SQL_MOTOR = {
+    "postgres": {
+        "instantanea": "SELECT pg_snapshot_xmin(pg_current_snapshot())::text AS xmin, "
+                       "EXTRACT(EPOCH FROM CURRENT_TIMESTAMP) AS epoch",
+        "desde_token": "cambio_xid >= %s::text::xid8",
+        "purgar_lapidas": "DELETE FROM eliminados WHERE eliminado_en < CURRENT_TIMESTAMP - %s * INTERVAL '1 day'",
+        "lectura_consistente": "SET TRANSACTION ISOLATION LEVEL REPEATABLE READ READ ONLY",
+        "ids_en": "id = ANY(%s)",
+    },
+    "sqlite": {
+        "instantanea": "SELECT valor + 1 AS xmin, CAST(strftime('%s', 'now') AS INTEGER) AS epoch "
+                       "FROM secuencia_cambios",
+        "desde_token": "cambio_xid >= %s",
+        "purgar_lapidas": "DELETE FROM eliminados WHERE eliminado_en < datetime('now', '-' || %s || ' days')",
+        # En WAL una transacción de lectura ve una sola instantánea
+        "lectura_consistente": "BEGIN",
+        # La lista de ids llega como arreglo JSON
+        "ids_en": "id IN (SELECT value FROM json_each(%s))",
+    },
+}["sqlite" if ES_SQLITE else "postgres"]
+
+# Errores de datos (tipos, NOT NULL, UNIQUE) de cualquiera de los dos motores
+ERRORES_DATOS = (psycopg2.DataError, psycopg2.IntegrityError, sqlite3.IntegrityError)
+
+
+def lista_ids(ids):
+    """Parámetro para SQL_MOTOR["ids_en"]."""
+    return json.dumps(list(ids)) if ES_SQLITE else list(ids)
+
+
+# PostgreSQL rechaza una fecha o un número mal escrito con DataError, pero
+# SQLite lo guardaría tal cual (tipos por afinidad): las rutas de escritura
+# validan antes para que ambos motores respondan el mismo error.
+def fecha_valida(valor, campo):
+    """`valor` si es una fecha AAAA-MM-DD; si no, ValueError."""
+    try:
+        date.fromisoformat(str(valor))
+    except ValueError:
+        raise ValueError(f"Fecha no válida en {campo}: {valor}")
+    return valor
+
+
+def importes(valor_unitario, cantidad):
+    """(valor_unitario, cantidad, valor_total) numéricos; si no, ValueError."""
+    try:
+        valor_unitario, cantidad = float(valor_unitario), int(cantidad)
+    except (TypeError, ValueError):
+        raise ValueError("Valor unitario o cantidad no válidos")
+    return valor_unitario, cantidad, valor_unitario * cantidad
+
+
+db_pool = PoolSQLite() if ES_SQLITE else PoolDB(DATABASE_URL, DB_POOL_MIN, DB_POOL_MAX,
+                                                DB_POOL_TIMEOUT, DB_POOL_PING,
+                                                connection_factory=ConexionMedida)
+
+
+def get_db():
+    """Conexión de la petición actual; se toma del pool una sola vez y se
+    devuelve en el teardown de Flask."""
+    if "db" not in g:
+        t0 = time.perf_counter()
+        g.db = db_pool.getconn()
+        metricas_db_adquisicion.observar(time.perf_counter() - t0)
+    return g.db
+
+
+@app.teardown_appcontext
+def liberar_db(exc):
+    conn = g.pop("db", None)
+    if conn is not None:
+        db_pool.putconn(conn)
 
+
+# ============================================================
+# MIGRACIONES DE ESQUEMA
+# ============================================================
+# El esquema se construye con los scripts ordenados de migraciones/
+# (NNNN_nombre.sql). La tabla schema_version registra cuáles ya se
+# aplicaron; cada script corre en su propia transacción y un advisory lock
+# evita que dos workers (o un worker y `flask migrar`) migren a la vez.
+# Al arrancar el servidor sólo se comparan versiones: un SELECT.
+# En SQLite la versión 1 es schema.sql y las siguientes van en
+# migraciones/sqlite/ (desde 0002).
+MIGRACIONES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "migraciones")
+MIGRACIONES_SQLITE_DIR = os.path.join(MIGRACIONES_DIR, "sqlite")
+MIGRACION_RE = re.compile(r"^(\d{4})_([a-z0-9_]+)\.sql$")
+MIGRAR_AL_INICIAR = os.environ.get("MIGRAR_AL_INICIAR", "1") == "1"
+# Clave del pg_advisory_lock de las migraciones (arbitraria, fija)
+MIGRACIONES_LOCK = 72_0518
+
+
+def migraciones_disponibles():
+    """Lista ordenada de (version, nombre, ruta) de migraciones/ (o de SQLite)."""
+    migraciones = [(1, "esquema_sqlite", SCHEMA_SQLITE)] if ES_SQLITE else []
+    directorio = MIGRACIONES_SQLITE_DIR if ES_SQLITE else MIGRACIONES_DIR
+    for archivo in sorted(os.listdir(directorio)) if os.path.isdir(directorio) else []:
+        m = MIGRACION_RE.match(archivo)
+        if m:
+            migraciones.append((int(m.group(1)), m.group(2), os.path.join(directorio, archivo)))
+    return migraciones
+
+
+def conectar_migraciones():
+    conn = conexion_directa()
+    if ES_SQLITE:
+        return conn
+    c = conn.cursor()
     c.execute(f"CREATE SCHEMA IF NOT EXISTS {SCHEMA}")
     c.execute(f"SET search_path TO {SCHEMA}, public")
+    conn.commit()
+    return conn
 
-    # Tabla usuarios CON ROL
-    c.execute("""
-        CREATE TABLE IF NOT EXISTS usuarios (
-            id        SERIAL PRIMARY KEY,
-            username  VARCHAR(100) UNIQUE NOT NULL,
-            nombre    VARCHAR(200) NOT NULL,
-            cargo     VARCHAR(100) NOT NULL,
-            rol       VARCHAR(50) DEFAULT 'miembro',
-            password  VARCHAR(255) NOT NULL,
-            creado_en TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-        )
-    """)
-
-    # Tabla actividades CON detalles y observaciones
-    c.execute("""
-        CREATE TABLE IF NOT EXISTS actividades (
-            id                 SERIAL PRIMARY KEY,
-            nombre             VARCHAR(300) NOT NULL,
-            descripcion        TEXT,
-            detalles           TEXT,
-            responsable        VARCHAR(200) NOT NULL,
-            fecha_inicio       DATE NOT NULL,
-            fecha_limite       DATE NOT NULL,
-            prioridad          VARCHAR(20) DEFAULT 'media',
-            completada         BOOLEAN DEFAULT FALSE,
-            fecha_completado   DATE,
-            observaciones      TEXT,
-            completada_por     VARCHAR(100),
-            creada_por         VARCHAR(100),
-            creada_en          TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-        )
-    """)
-
-    # Tabla FINANZAS
-    c.execute("""
-        CREATE TABLE IF NOT EXISTS finanzas (
-            id              SERIAL PRIMARY KEY,
-            fecha_compra    DATE NOT NULL,
-            concepto        VARCHAR(300) NOT NULL,
-            categoria       VARCHAR(100),
-            proveedor       VARCHAR(200),
-            cantidad        INTEGER DEFAULT 1,
-            valor_unitario  DECIMAL(12,2) NOT NULL,
-            valor_total     DECIMAL(12,2) NOT NULL,
-            metodo_pago     VARCHAR(50),
-            responsable     VARCHAR(100),
-            observaciones   TEXT,
-            factura         VARCHAR(100),
-            creado_por      VARCHAR(100),
-            creado_en       TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            modificado_por  VARCHAR(100),
-            modificado_en   TIMESTAMP
-        )
-    """)
 
-    c.execute("CREATE INDEX IF NOT EXISTS idx_act_fecha_limite ON actividades(fecha_limite)")
-    c.execute("CREATE INDEX IF NOT EXISTS idx_act_completada ON actividades(completada)")
-    c.execute("CREATE INDEX IF NOT EXISTS idx_usuarios_user ON usuarios(username)")
-    c.execute("CREATE INDEX IF NOT EXISTS idx_finanzas_fecha ON finanzas(fecha_compra)")
+def version_esquema(c):
+    """Última versión aplicada (0 si la base nunca se migró)."""
+    if ES_SQLITE:
+        tabla = "schema_version"
+        c.execute("SELECT COUNT(*) > 0 FROM sqlite_master WHERE type = 'table' AND name = 'schema_version'")
+    else:
+        # Calificada: la conexión del chequeo de arranque no fija search_path
+        tabla = f"{SCHEMA}.schema_version"
+        c.execute(f"SELECT to_regclass('{tabla}') IS NOT NULL")
+    if not c.fetchone()[0]:
+        return 0
+    c.execute(f"SELECT COALESCE(MAX(version), 0) FROM {tabla}")
+    return c.fetchone()[0]
+
+
+def migrar():
+    """Aplica las migraciones pendientes; devuelve la lista de aplicadas."""
+    if ES_SQLITE:
+        return migrar_sqlite()
+    conn = conectar_migraciones()
+    c = conn.cursor()
+    aplicadas = []
+    try:
+        c.execute("SELECT pg_advisory_lock(%s)", (MIGRACIONES_LOCK,))
+        c.execute("""
+            CREATE TABLE IF NOT EXISTS schema_version (
+                version     INTEGER PRIMARY KEY,
+                nombre      VARCHAR(100) NOT NULL,
+                aplicada_en TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+            )
+        """)
+        conn.commit()
+        # Se relee con el lock tomado: otro proceso pudo migrar mientras esperábamos
+        actual = version_esquema(c)
+        for version, nombre, ruta in migraciones_disponibles():
+            if version <= actual:
+                continue
+            with open(ruta, encoding="utf-8") as f:
+                sql = f.read()
+            try:
+                c.execute(sql)
+                c.execute("INSERT INTO schema_version (version, nombre) VALUES (%s, %s)",
+                          (version, nombre))
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
+            aplicadas.append(f"{version:04d}_{nombre}")
+    finally:
+        try:
+            c.execute("SELECT pg_advisory_unlock(%s)", (MIGRACIONES_LOCK,))
+            conn.commit()
+        finally:
+            conn.close()
+    return aplicadas
+
+
+def migrar_sqlite():
+    """migrar() en SQLite: BEGIN IMMEDIATE toma el lock de escritura del
+    archivo y hace de advisory lock; la versión se relee ya con el lock."""
+    conn = conectar_migraciones()
+    aplicadas = []
+    try:
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS schema_version (
+                version     INTEGER PRIMARY KEY,
+                nombre      TEXT NOT NULL,
+                aplicada_en TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+            )
+        """)
+        for version, nombre, ruta in migraciones_disponibles():
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                if version <= version_esquema(conn.cursor()):
+                    conn.execute("ROLLBACK")
+                    continue
+                with open(ruta, encoding="utf-8") as f:
+                    for sentencia in sentencias_sqlite(f.read()):
+                        conn.execute(sentencia)
+                conn.execute("INSERT INTO schema_version (version, nombre) VALUES (?, ?)", (version, nombre))
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+            aplicadas.append(f"{version:04d}_{nombre}")
+    finally:
+        conn.close()
+    return aplicadas
+
+
+def verificar_esquema():
+    """Chequeo de arranque: migra sólo si la base está atrasada."""
+    disponible = max((v for v, _, _ in migraciones_disponibles()), default=0)
+    conn = conexion_directa()
+    try:
+        actual = version_esquema(conn.cursor())
+    finally:
+        conn.close()
+    if actual >= disponible:
+        return
+    if not MIGRAR_AL_INICIAR:
+        print(f"⚠️ Esquema en versión {actual}, hay migraciones hasta {disponible}: ejecuta `flask migrar`")
+        return
+    for nombre in migrar():
+        print(f"✅ Migración aplicada: {nombre}")
+
+
+@app.cli.command("migrar")
+def migrar_comando():
+    """Aplica las migraciones de esquema pendientes."""
+    aplicadas = migrar()
+    for nombre in aplicadas:
+        print(f"✅ {nombre}")
+    if not aplicadas:
+        print("Esquema al día")
+
+
+@app.cli.command("estado-esquema")
+def estado_esquema_comando():
+    """Muestra las migraciones aplicadas y las pendientes."""
+    conn = conectar_migraciones()
+    try:
+        c = conn.cursor()
+        actual = version_esquema(c)
+        aplicadas = {}
+        if actual:
+            c.execute("SELECT version, aplicada_en FROM schema_version")
+            aplicadas = dict(c.fetchall())
+    finally:
+        conn.close()
+    for version, nombre, _ in migraciones_disponibles():
+        marca = aplicadas[version].strftime("%Y-%m-%d %H:%M") if version in aplicadas else "pendiente"
+        print(f"{version:04d}_{nombre:<30} {marca}")
+
+
+def preparar_bd():
+    """Chequeo de esquema fuera del import: lo llaman gunicorn (on_starting,
+    una sola vez en el proceso maestro, ver gunicorn.conf.py) y `python app.py`."""
+    try:
+        verificar_esquema()
+    except Exception as e:
+        print(f"⚠️ Error BD: {e}")
+
+
+# ============================================================
+# CACHÉ EN PROCESO
+# ============================================================
+class CacheTTL:
+    """Caché clave → valor con expiración, local a cada worker.
+
+    Las rutas de mutación la invalidan en su propio worker; el TTL acota lo
+    desactualizados que pueden quedar los demás workers.
+    """
+
+    def __init__(self, ttl):
+        self.ttl = ttl
+        self._datos = {}
+        self._lock = threading.Lock()
+
+    def get(self, clave):
+        with self._lock:
+            item = self._datos.get(clave)
+            if item is None:
+                return None
+            expira, valor = item
+            if expira < time.monotonic():
+                del self._datos[clave]
+                return None
+            return valor
+
+    def set(self, clave, valor):
+        with self._lock:
+            self._datos[clave] = (time.monotonic() + self.ttl, valor)
+
+    def clear(self):
+        with self._lock:
+            self._datos.clear()
+
+
+STATS_TTL = float(os.environ.get("STATS_TTL", 10))
+cache_stats = CacheTTL(STATS_TTL)
+
+
+class CacheBytes:
+    """LRU de blobs binarios acotada por tamaño total (bytes)."""
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self._datos = OrderedDict()
+        self._total = 0
+        self._lock = threading.Lock()
+
+    def get(self, clave):
+        with self._lock:
+            blob = self._datos.get(clave)
+            if blob is not None:
+                self._datos.move_to_end(clave)
+            return blob
+
+    def set(self, clave, blob):
+        if len(blob) > self.max_bytes:
+            return
+        with self._lock:
+            viejo = self._datos.pop(clave, None)
+            if viejo is not None:
+                self._total -= len(viejo)
+            self._datos[clave] = blob
+            self._total += len(blob)
+            while self._total > self.max_bytes:
+                _, expulsado = self._datos.popitem(last=False)
+                self._total -= len(expulsado)
+
+    def clear(self):
+        with self._lock:
+            self._datos.clear()
+            self._total = 0
+
+
+def actividades_cambiaron():
+    """Se llama después de cada commit que modifica actividades."""
+    cache_stats.clear()
+
+
+# ============================================================
+# SESIONES
+# ============================================================
+# login entrega un token firmado con username y rol; el navegador lo envía
+# en "Authorization: Bearer ..." y un hook lo resuelve en g.usuario. El rol
+# vigente sale de una caché por worker, así que las rutas de escritura no
+# consultan `usuarios`. registrar/delete_user la invalidan (y los demás
+# workers vía el canal de eventos o al vencer ROLES_TTL).
+SESION_TTL = int(os.environ.get("SESION_TTL", 12 * 3600))     # segundos
+ROLES_TTL  = float(os.environ.get("ROLES_TTL", 300))
+
+# La clave de firma sale de SECRET_KEY. En producción (PRODUCCION=1, lo que
+# gunicorn.conf.py fija por defecto) no se arranca sin ella. Fuera de
+# producción se genera una clave aleatoria al importar: gunicorn.conf.py la
+# crea en el maestro para que todos los workers firmen igual, y los tokens
+# dejan de valer al reiniciar.
+PRODUCCION = os.environ.get("PRODUCCION", "0") == "1"
+if not os.environ.get("SECRET_KEY"):
+    if PRODUCCION:
+        raise RuntimeError("Falta SECRET_KEY: es obligatoria con PRODUCCION=1")
+    print("⚠️ SECRET_KEY no definida: se usa una clave aleatoria; "
+          "las sesiones se pierden al reiniciar. Defina SECRET_KEY en producción.")
+app.secret_key = os.environ.get("SECRET_KEY") or os.urandom(32)
+firmador_sesion = URLSafeTimedSerializer(app.secret_key, salt="sesion")
+cache_roles = CacheTTL(ROLES_TTL)
+
+
+def emitir_token(username, rol):
+    return firmador_sesion.dumps({"u": username, "r": rol})
+
+
+def rol_de(username):
+    """Rol actual de `username` ("" si ya no existe)."""
+    rol = cache_roles.get(username)
+    if rol is None:
+        c = get_db().cursor()
+        c.execute("SELECT rol FROM usuarios WHERE username = %s", (username,))
+        row = c.fetchone()
+        rol = row[0] if row else ""
+        cache_roles.set(username, rol)
+    return rol
+
+
+def usuarios_cambiaron():
+    """Se llama después de cada commit que agrega o elimina usuarios."""
+    cache_roles.clear()
+
+
+@app.before_request
+def resolver_sesion():
+    """g.usuario = {"user", "rol"} si la petición trae un token válido."""
+    g.usuario = None
+    auth = request.headers.get("Authorization", "")
+    if not auth.startswith("Bearer "):
+        return
+    try:
+        datos = firmador_sesion.loads(auth[7:], max_age=SESION_TTL)
+    except BadSignature:
+        return
+    rol = rol_de(datos["u"])
+    if rol:
+        g.usuario = {"user": datos["u"], "rol": rol}
+
+
+SIN_SESION = "Sesión no válida: vuelva a iniciar sesión"
+
+
+def autor():
+    """Usuario de la sesión, o None sin token válido.
+
+    El autor nunca sale del cuerpo de la petición: se podría suplantar.
+    """
+    return g.usuario["user"] if g.usuario else None
+
+
+# ============================================================
+# VERSIONES DE DATOS
+# ============================================================
+def leer_versiones(conn, tablas=TABLAS_VERSIONADAS):
+    """{tabla: (version, modificado_en)} en una sola consulta sobre `versiones`."""
+    c = conn.cursor()
+    c.execute(f"SELECT tabla, version, modificado_en FROM versiones "
+              f"WHERE tabla IN ({', '.join(['%s'] * len(tablas))})", tuple(tablas))
+    return {tabla: (version, modificado) for tabla, version, modificado in c.fetchall()}
+
+
+def condicional(*tablas):
+    """GET condicional (ETag / Last-Modified) según la versión de `tablas`.
+
+    Si el cliente ya tiene la versión actual se responde 304 sin ejecutar la
+    vista, es decir, sin tocar las filas. El ETag incluye la query string
+    porque fields/limit/cursor/estado cambian el cuerpo.
+    """
+    def decorador(vista):
+        @functools.wraps(vista)
+        def envoltura(*args, **kwargs):
+            versiones = g.versiones = leer_versiones(get_db(), tablas)
+            etag = "-".join(f"{t}{versiones.get(t, (0,))[0]}" for t in tablas)
+            if request.query_string:
+                etag += "-" + hashlib.sha1(request.query_string).hexdigest()[:16]
+            modificado = max((v[1] for v in versiones.values()), default=None)
+            if modificado is not None:
+                modificado = modificado.replace(tzinfo=timezone.utc, microsecond=0)
+
+            if request.if_none_match:
+                no_modificado = request.if_none_match.contains(etag)
+            else:
+                ims = request.if_modified_since
+                no_modificado = bool(ims and modificado and modificado <= ims)
+
+            if no_modificado:
+                response = app.response_class(status=304)
+            else:
+                response = make_response(vista(*args, **kwargs))
+                if response.status_code != 200:
+                    return response
+            response.set_etag(etag)
+            response.last_modified = modificado
+            response.cache_control.no_cache = True
+            return response
+        return envoltura
+    return decorador
+
+
+# ============================================================
+# PAGINACIÓN Y PROYECCIÓN
+# ============================================================
+CAMPOS_ACTIVIDAD = (
+    "id", "nombre", "descripcion", "detalles", "responsable",
+    "fecha_inicio", "fecha_limite", "prioridad", "completada",
+    "fecha_completado", "observaciones", "completada_por",
+    "creada_por", "creada_en", "estado",
+)
+CAMPOS_FINANZA = (
+    "id", "fecha_compra", "concepto", "categoria", "proveedor",
+    "cantidad", "valor_unitario", "valor_total", "metodo_pago",
+    "responsable", "observaciones", "factura", "creado_por",
+    "creado_en", "modificado_por", "modificado_en",
+)
+PAGE_LIMIT_DEFAULT = 50
+PAGE_LIMIT_MAX     = 500
+
+
+def parse_fields(raw, permitidos, obligatorios):
+    """Columnas pedidas en ?fields=; las de `obligatorios` siempre se incluyen
+    porque forman el keyset del cursor."""
+    if not raw:
+        return list(permitidos)
+    pedidos = [f.strip() for f in raw.split(",") if f.strip()]
+    for f in pedidos:
+        if f not in permitidos:
+            raise ValueError(f"Campo no válido: {f}")
+    cols = list(obligatorios)
+    cols += [f for f in pedidos if f not in cols]
+    return cols
+
+
+def parse_paginacion():
+    """Lee ?limit= y ?cursor=. Devuelve (limit, [fecha, id]) o (None, None)
+    si la petición no pide paginación."""
+    raw_limit = request.args.get("limit")
+    raw_cursor = request.args.get("cursor")
+    if raw_limit is None and raw_cursor is None:
+        return None, None
+    try:
+        limit = int(raw_limit) if raw_limit is not None else PAGE_LIMIT_DEFAULT
+    except ValueError:
+        raise ValueError("limit debe ser un entero")
+    limit = max(1, min(limit, PAGE_LIMIT_MAX))
+    cursor = decodificar_cursor(raw_cursor) if raw_cursor else None
+    return limit, cursor
+
+
+def codificar_cursor(fecha, row_id):
+    raw = json.dumps([fecha, row_id], separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decodificar_cursor(token):
+    try:
+        raw = base64.urlsafe_b64decode(token + "=" * (-len(token) % 4))
+        fecha, row_id = json.loads(raw)
+        date.fromisoformat(fecha)
+        return [fecha, int(row_id)]
+    except (ValueError, TypeError):
+        raise ValueError("cursor no válido")
+
+
+def pagina(items, limit, campo_fecha):
+    """Recorta la fila extra pedida con LIMIT n+1 y genera el siguiente cursor."""
+    next_cursor = None
+    if len(items) > limit:
+        items = items[:limit]
+        ultimo = items[-1]
+        next_cursor = codificar_cursor(ultimo[campo_fecha], ultimo["id"])
+    return {"items": items, "next_cursor": next_cursor, "limit": limit}
+
+
+def serializar_actividad(row):
+    row_dict = dict(row)
+    row_dict.pop('cambio_xid', None)
+    row_dict.pop('_evento', None)
+    for campo in ['fecha_inicio', 'fecha_limite', 'fecha_completado']:
+        if row_dict.get(campo):
+            row_dict[campo] = str(row_dict[campo])
+    return row_dict
+
+
+def serializar_finanza(row):
+    row_dict = dict(row)
+    row_dict.pop('cambio_xid', None)
+    row_dict.pop('_evento', None)
+    if row_dict.get('fecha_compra'):
+        row_dict['fecha_compra'] = str(row_dict['fecha_compra'])
+    for campo in ['valor_unitario', 'valor_total']:
+        if row_dict.get(campo):
+            row_dict[campo] = float(row_dict[campo])
+    return row_dict
+
+
+# ============================================================
+# JSON ARMADO EN POSTGRESQL
+# ============================================================
+# En las listas completas PostgreSQL arma el arreglo JSON (json_agg) y Flask
+# envía ese texto tal cual: no se crea un dict ni se convierte ningún valor
+# por fila en Python. El formato coincide con el de jsonify: fechas
+# 'YYYY-MM-DD', numeric como número y timestamps como fecha HTTP.
+# RENDER_JSON=py (o ?render=py en la petición) usa el camino Python.
+RENDER_JSON = os.environ.get("RENDER_JSON", "bd")
+COLUMNAS_TIMESTAMP = {"creada_en", "creado_en", "modificado_en"}
+FORMATO_FECHA_HTTP = 'Dy, DD Mon YYYY HH24:MI:SS "GMT"'
+
+
+def render_en_bd():
+    # SQLite no tiene json_agg ni to_char: siempre el camino Python
+    return not ES_SQLITE and request.args.get("render", RENDER_JSON) != "py"
+
+
+def sql_json(cols, sql_filas, orden):
+    """Envuelve `sql_filas` para que devuelva sus filas como un solo texto JSON."""
+    select = ", ".join(
+        f"to_char(f.{col}, '{FORMATO_FECHA_HTTP}') AS {col}" if col in COLUMNAS_TIMESTAMP else f"f.{col}"
+        for col in cols
+    )
+    # ::text evita que psycopg2 vuelva a parsear el JSON
+    return (f"SELECT COALESCE(json_agg(t ORDER BY {orden}), '[]')::text "
+            f"FROM (SELECT {select} FROM ({sql_filas}) f) t")
+
+
+def lista_json(conn, sql, params, cols, orden, serializar, en_bd=True):
+    """Texto JSON con el arreglo de filas de `sql`, armado en PostgreSQL o en Python."""
+    if en_bd:
+        c = conn.cursor()
+        c.execute(sql_json(cols, sql, orden), params)
+        return c.fetchone()[0]
+    c = conn.cursor(cursor_factory=RealDictCursor)
+    c.execute(sql, params)
+    return app.json.dumps([serializar(r) for r in c.fetchall()])
+
+
+def respuesta_json(texto):
+    return app.response_class(texto, mimetype="application/json")
+
+
+# ============================================================
+# EVENTOS EN VIVO (LISTEN/NOTIFY + SSE)
+# ============================================================
+# Las rutas que modifican datos emiten pg_notify dentro de su transacción, así
+# que PostgreSQL sólo entrega el evento si el commit se hizo. Cada worker abre
+# UNA conexión dedicada con LISTEN (sólo cuando hay navegadores conectados) y
+# reparte los eventos en memoria a las conexiones SSE de /api/eventos.
+# Cada conexión SSE ocupa un hilo: gunicorn.conf.py usa workers gthread con
+# hilos para EVENTOS_MAX_CLIENTES conexiones más las peticiones normales.
+# SQLite no tiene LISTEN: el hilo consulta la tabla `versiones` cada
+# EVENTOS_SONDEO segundos y emite un evento por tabla que cambió.
+CANAL_EVENTOS        = "cronograma_eventos"
+EVENTOS_LATIDO       = int(os.environ.get("EVENTOS_LATIDO", 25))    # segundos entre comentarios keep-alive
+EVENTOS_SONDEO       = float(os.environ.get("EVENTOS_SONDEO", 1))   # segundos entre consultas (SQLite)
+EVENTOS_MAX_CLIENTES = int(os.environ.get("EVENTOS_MAX_CLIENTES", 50))
+EVENTOS_COLA         = 100                                          # eventos pendientes por cliente
+
+
+def emitir_evento(c, tabla, accion, id=None):
+    """Encola un evento en la transacción actual; se publica con el commit."""
+    if ES_SQLITE:
+        return
+    payload = json.dumps({"tabla": tabla, "accion": accion, "id": id}, separators=(",", ":"))
+    c.execute("SELECT pg_notify(%s, %s)", (CANAL_EVENTOS, payload))
+
+
+def con_evento(sql, tabla, accion):
+    """Envuelve un INSERT/UPDATE/DELETE ... RETURNING para que la misma
+    sentencia emita el evento de cada fila afectada (un solo round trip)."""
+    if ES_SQLITE:
+        return sql
+    return f"""
+        WITH fila AS ({sql})
+        SELECT fila.*, pg_notify('{CANAL_EVENTOS}', json_build_object(
+            'tabla', '{tabla}', 'accion', '{accion}', 'id', fila.id)::text) AS _evento
+        FROM fila
+    """
+
+
+class Suscripcion:
+    """Cola de eventos de una conexión SSE."""
+
+    def __init__(self):
+        self.cola = queue.Queue(maxsize=EVENTOS_COLA)
+        # Si el cliente no consume a tiempo se corta la conexión; al
+        # reconectarse el navegador vuelve a sincronizar por deltas
+        self.desbordada = False
+
+
+class CanalEventos:
+    """Un hilo LISTEN por worker que reparte las notificaciones."""
+
+    def __init__(self, dsn, canal):
+        self.dsn = dsn
+        self.canal = canal
+        self._pid = None
+        self._lock = threading.Lock()
+        self._suscripciones = set()
+
+    def suscribir(self):
+        """Registra un cliente; None si ya se alcanzó EVENTOS_MAX_CLIENTES."""
+        with self._lock:
+            if self._pid != os.getpid():
+                # Tras un fork el hilo del padre no existe en el hijo
+                self._suscripciones = set()
+                escuchar = self._sondear if ES_SQLITE else self._escuchar
+                threading.Thread(target=escuchar, name="eventos", daemon=True).start()
+                self._pid = os.getpid()
+            if len(self._suscripciones) >= EVENTOS_MAX_CLIENTES:
+                return None
+            s = Suscripcion()
+            self._suscripciones.add(s)
+            return s
+
+    def desuscribir(self, s):
+        with self._lock:
+            self._suscripciones.discard(s)
+
+    def clientes(self):
+        with self._lock:
+            return len(self._suscripciones) if self._pid == os.getpid() else 0
+
+    def _repartir(self, evento):
+        # Los cambios hechos en otros workers también invalidan las cachés locales
+        if evento.get("tabla") == "actividades":
+            actividades_cambiaron()
+        elif evento.get("tabla") == "usuarios":
+            usuarios_cambiaron()
+        elif evento.get("accion") == "resync":
+            actividades_cambiaron()
+            usuarios_cambiaron()
+        with self._lock:
+            suscripciones = list(self._suscripciones)
+        for s in suscripciones:
+            try:
+                s.cola.put_nowait(evento)
+            except queue.Full:
+                s.desbordada = True
+                self.desuscribir(s)
+
+    def _escuchar(self):
+        espera = 1
+        while True:
+            conn = None
+            try:
+                conn = psycopg2.connect(self.dsn)
+                conn.autocommit = True
+                conn.cursor().execute(f"LISTEN {self.canal}")
+                espera = 1
+                # Lo ocurrido mientras no había conexión se recupera con deltas
+                self._repartir({"tabla": None, "accion": "resync", "id": None})
+                while True:
+                    if select.select([conn], [], [], EVENTOS_LATIDO) == ([], [], []):
+                        continue
+                    conn.poll()
+                    while conn.notifies:
+                        n = conn.notifies.pop(0)
+                        try:
+                            self._repartir(json.loads(n.payload))
+                        except ValueError:
+                            app.logger.warning("Evento con payload no válido: %r", n.payload)
+            except psycopg2.Error as e:
+                app.logger.warning("Canal de eventos desconectado (%s); reintento en %ss", e, espera)
+            finally:
+                if conn is not None and not conn.closed:
+                    conn.close()
+            time.sleep(espera)
+            espera = min(espera * 2, 60)
+
+    def _sondear(self):
+        conn = None
+        anteriores = None
+        while True:
+            try:
+                if conn is None:
+                    conn = conexion_directa()
+                actuales = dict(conn.execute("SELECT tabla, version FROM versiones").fetchall())
+                if anteriores is None:
+                    self._repartir({"tabla": None, "accion": "resync", "id": None})
+                else:
+                    for tabla, version in actuales.items():
+                        if anteriores.get(tabla) != version:
+                            self._repartir({"tabla": tabla, "accion": "cambio", "id": None})
+                anteriores = actuales
+            except sqlite3.Error as e:
+                app.logger.warning("Sondeo de eventos falló (%s)", e)
+                if conn is not None:
+                    conn.close()
+                conn, anteriores = None, None
+            time.sleep(EVENTOS_SONDEO)
+
+
+canal_eventos = CanalEventos(DATABASE_URL, CANAL_EVENTOS)
+
 
+# ============================================================
+# SINCRONIZACIÓN POR DELTAS
+# ============================================================
+# El token es el xmin de la instantánea en que se leyó: toda transacción con
+# xid menor ya había terminado, así que sus cambios ya se entregaron. Los
+# cambios de transacciones >= xmin pueden volver a llegar en el siguiente
+# delta; el cliente aplica los cambios de forma idempotente.
+DELTA_RETENCION_DIAS = int(os.environ.get("DELTA_RETENCION_DIAS", 30))
+_ultima_purga_lapidas = 0.0
+
+
+def codificar_token(xmin, epoch):
+    raw = json.dumps([str(xmin), int(epoch)], separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decodificar_token(token):
+    """Devuelve (xmin, epoch); el token "0" pide la carga completa."""
+    if token == "0":
+        return None, None
+    try:
+        raw = base64.urlsafe_b64decode(token + "=" * (-len(token) % 4))
+        xmin, epoch = json.loads(raw)
+        return int(xmin), int(epoch)
+    except (ValueError, TypeError):
+        raise ValueError("token no válido")
+
+
+def purgar_lapidas(conn):
+    """Borra lápidas más viejas que la retención (como mucho una vez por hora)."""
+    global _ultima_purga_lapidas
+    if time.monotonic() - _ultima_purga_lapidas < 3600:
+        return
+    _ultima_purga_lapidas = time.monotonic()
+    c = conn.cursor()
+    c.execute(SQL_MOTOR["purgar_lapidas"], (DELTA_RETENCION_DIAS,))
     conn.commit()
-    conn.close()
-    print(f"✅ BD inicializada con finanzas y roles")
 
 
-try:
-    init_db()
-except Exception as e:
-    print(f"⚠️ Error BD: {e}")
+def respuesta_delta(tabla, cols, orden, serializar):
+    """Filas cambiadas y IDs eliminados desde el token ?since=.
+
+    Respuesta: {"items": [...], "eliminados": [ids], "token": "...", "completo": bool}.
+    Con since=0, o con un token más viejo que la retención de lápidas, se
+    devuelve la tabla completa ("completo": true) y el cliente reemplaza su copia.
+    """
+    try:
+        xmin, epoch = decodificar_token(request.args["since"])
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    conn = get_db()
+    purgar_lapidas(conn)
+    c = conn.cursor(cursor_factory=RealDictCursor)
+    # El token nuevo se toma ANTES de leer las filas
+    c.execute(SQL_MOTOR["instantanea"])
+    snap = c.fetchone()
+    token = codificar_token(snap["xmin"], snap["epoch"])
+
+    completo = xmin is None or epoch < time.time() - DELTA_RETENCION_DIAS * 86400
+    sql = f"SELECT {', '.join(cols)} FROM {tabla}"
+    params = []
+    if not completo:
+        sql += " WHERE " + SQL_MOTOR["desde_token"]
+        params.append(xmin)
+    items = lista_json(conn, sql + f" ORDER BY {orden}", params, cols, orden, serializar,
+                       en_bd=render_en_bd())
+
+    eliminados = []
+    if not completo:
+        c.execute("SELECT id FROM eliminados WHERE tabla = %s AND " + SQL_MOTOR["desde_token"],
+                  (tabla, xmin))
+        eliminados = [r["id"] for r in c.fetchall()]
+
+    # Los items ya vienen como texto JSON: se insertan sin volver a parsearlos
+    resto = json.dumps({"eliminados": eliminados, "token": token, "completo": completo})
+    return respuesta_json('{"items": ' + items + ", " + resto[1:])
 
 
 # ============================================================
@@ -151,18 +1612,17 @@ def count_usuarios():
     c = conn.cursor()
     c.execute("SELECT COUNT(*) FROM usuarios")
     count = c.fetchone()[0]
-    conn.close()
     return jsonify({"count": count})
 
 
 @app.route("/api/usuarios/listar")
+@condicional("usuarios")
 def listar_usuarios():
     """Devuelve lista de usuarios con nombre y cargo para los selects de responsable."""
     conn = get_db()
     c = conn.cursor(cursor_factory=RealDictCursor)
     c.execute("SELECT username, nombre, cargo FROM usuarios ORDER BY nombre ASC")
     rows = c.fetchall()
-    conn.close()
     return jsonify([dict(r) for r in rows])
 
 
@@ -191,18 +1651,15 @@ def registrar():
 
     c.execute("SELECT COUNT(*) FROM usuarios")
     if c.fetchone()[0] >= MAX_USUARIOS:
-        conn.close()
         return jsonify({"ok": False, "error": f"Límite de {MAX_USUARIOS} usuarios"})
 
     # Verificar que el cargo no esté ya registrado (1 usuario por cargo)
     c.execute("SELECT id FROM usuarios WHERE cargo = %s", (cargo,))
     if c.fetchone():
-        conn.close()
         return jsonify({"ok": False, "error": f"Ya existe un usuario con el cargo '{cargo}'"})
 
     c.execute("SELECT id FROM usuarios WHERE username = %s", (user,))
     if c.fetchone():
-        conn.close()
         return jsonify({"ok": False, "error": "Usuario ya existe"})
 
     # El rol se deriva automáticamente del cargo
@@ -213,8 +1670,9 @@ def registrar():
         "INSERT INTO usuarios (username, nombre, cargo, rol, password) VALUES (%s, %s, %s, %s, %s)",
         (user, nombre, cargo, rol, hashed)
     )
+    emitir_evento(c, "usuarios", "crear")
     conn.commit()
-    conn.close()
+    usuarios_cambiaron()
     return jsonify({"ok": True})
 
 
@@ -228,9 +1686,9 @@ def login():
     c = conn.cursor(cursor_factory=RealDictCursor)
     c.execute("SELECT * FROM usuarios WHERE username = %s", (user,))
     row = c.fetchone()
-    conn.close()
 
     if row and check_password_hash(row["password"], pwd):
+        cache_roles.set(row["username"], row["rol"])
         return jsonify({
             "ok": True,
             "usuario": {
@@ -238,7 +1696,8 @@ def login():
                 "user": row["username"],
                 "nombre": row["nombre"],
                 "cargo": row["cargo"],
-                "rol": row["rol"]
+                "rol": row["rol"],
+                "token": emitir_token(row["username"], row["rol"])
             }
         })
 
@@ -249,42 +1708,118 @@ def login():
 # API — ACTIVIDADES
 # ============================================================
 @app.route("/api/actividades", methods=["GET"])
+@condicional("actividades")
 def listar_actividades():
+    """Lista de actividades ordenada por fecha límite.
+
+    Parámetros opcionales:
+      estado=tiempo          filtra por estado (usa idx_act_estado)
+      fields=id,nombre,...   proyección de columnas
+      limit=N / cursor=...   paginación por keyset sobre (fecha_limite, id)
+      since=<token>          solo cambios y eliminaciones desde el token
+      render=py              arma el JSON en Python en vez de en PostgreSQL
+    Sin limit ni cursor devuelve la lista completa (comportamiento original).
+    """
+    try:
+        cols = parse_fields(request.args.get("fields"), CAMPOS_ACTIVIDAD, ("id", "fecha_limite"))
+        limit, cursor = parse_paginacion()
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    if "since" in request.args:
+        return respuesta_delta("actividades", cols, "fecha_limite ASC, id ASC", serializar_actividad)
+
+    estado = request.args.get("estado")
+    if estado and estado not in ESTADOS:
+        return jsonify({"error": f"Estado no válido: {estado}"}), 400
+
+    sql = f"SELECT {', '.join(cols)} FROM actividades"
+    where, params = [], []
+    if estado:
+        where.append("estado = %s")
+        params.append(estado)
+    if cursor:
+        where.append("(fecha_limite, id) > (%s, %s)")
+        params += cursor
+    if where:
+        sql += " WHERE " + " AND ".join(where)
+    sql += " ORDER BY fecha_limite ASC, id ASC"
     conn = get_db()
-    c = conn.cursor(cursor_factory=RealDictCursor)
-    c.execute("SELECT * FROM actividades ORDER BY fecha_limite ASC")
-    rows = c.fetchall()
-    conn.close()
+    if limit is None:
+        return respuesta_json(lista_json(conn, sql, params, cols, "fecha_limite ASC, id ASC",
+                                         serializar_actividad, en_bd=render_en_bd()))
 
-    result = []
-    for r in rows:
-        row_dict = dict(r)
-        for campo in ['fecha_inicio', 'fecha_limite', 'fecha_completado']:
-            if row_dict.get(campo):
-                row_dict[campo] = str(row_dict[campo])
-        result.append(row_dict)
-
-    return jsonify(result)
+    sql += " LIMIT %s"
+    params.append(limit + 1)
+    c = conn.cursor(cursor_factory=RealDictCursor)
+    c.execute(sql, params)
+    result = [serializar_actividad(r) for r in c.fetchall()]
+    return jsonify(pagina(result, limit, "fecha_limite"))
+
+
+@app.route("/api/actividades/stats")
+@condicional("actividades")
+def estadisticas_actividades():
+    """Conteo total y por estado en una sola consulta agrupada.
+
+    ?responsable=X     limita el conteo a un responsable
+    ?agrupar=responsable  añade el desglose por responsable
+    """
+    responsable = request.args.get("responsable")
+    por_resp = request.args.get("agrupar") == "responsable"
+    clave = (responsable, por_resp)
+
+    stats = cache_stats.get(clave)
+    if stats is None:
+        sql = "SELECT responsable, estado, COUNT(*) FROM actividades"
+        params = []
+        if responsable:
+            sql += " WHERE responsable = %s"
+            params.append(responsable)
+        sql += " GROUP BY responsable, estado"
+
+        conn = get_db()
+        c = conn.cursor()
+        c.execute(sql, params)
+
+        def vacio():
+            return dict({"total": 0}, **{e: 0 for e in ESTADOS})
+
+        stats = vacio()
+        desglose = {}
+        for resp, estado, n in c.fetchall():
+            stats["total"] += n
+            stats[estado] += n
+            if por_resp:
+                d = desglose.setdefault(resp, vacio())
+                d["total"] += n
+                d[estado] += n
+        if por_resp:
+            stats["por_responsable"] = desglose
+        cache_stats.set(clave, stats)
+
+    return jsonify(stats)
 
 
 @app.route("/api/actividades/<int:act_id>", methods=["GET"])
 def obtener_actividad(act_id):
     conn = get_db()
     c = conn.cursor(cursor_factory=RealDictCursor)
-    c.execute("SELECT * FROM actividades WHERE id = %s", (act_id,))
+    c.execute(f"SELECT {', '.join(CAMPOS_ACTIVIDAD)} FROM actividades WHERE id = %s", (act_id,))
     row = c.fetchone()
-    conn.close()
 
     if row:
-        row_dict = dict(row)
-        for campo in ['fecha_inicio', 'fecha_limite', 'fecha_completado']:
-            if row_dict.get(campo):
-                row_dict[campo] = str(row_dict[campo])
-        return jsonify(row_dict)
+        return jsonify(serializar_actividad(row))
 
     return jsonify({"error": "No encontrada"}), 404
 
 
+def motivo_sin_cambio(c, act_id, si_completada):
+    """Mensaje cuando un UPDATE condicional no afectó filas (sólo en el camino de error)."""
+    c.execute("SELECT 1 FROM actividades WHERE id = %s", (act_id,))
+    return si_completada if c.fetchone() else "Actividad no encontrada"
+
+
 @app.route("/api/actividades", methods=["POST"])
 def crear_actividad():
     data = request.get_json()
@@ -296,24 +1831,24 @@ def crear_actividad():
 
     if not all([nombre, responsable, fecha_inicio, fecha_limite]):
         return jsonify({"ok": False, "error": "Faltan campos obligatorios"})
+    try:
+        fecha_valida(fecha_inicio, "fecha_inicio")
+        fecha_valida(fecha_limite, "fecha_limite")
+    except ValueError as e:
+        return jsonify({"ok": False, "error": str(e)})
 
     # Solo Director de Proyecto puede crear actividades
-    creada_por = data.get("creada_por", "")
-    conn_v = get_db()
-    c_v = conn_v.cursor()
-    c_v.execute("SELECT rol FROM usuarios WHERE username = %s", (creada_por,))
-    row_v = c_v.fetchone()
-    conn_v.close()
-    if not row_v or row_v[0] != 'coordinador':
+    if not g.usuario or g.usuario["rol"] != 'coordinador':
         return jsonify({"ok": False, "error": "Solo el Director de Proyecto puede crear actividades"})
 
     conn = get_db()
-    c = conn.cursor()
-    c.execute("""
+    c = conn.cursor(cursor_factory=RealDictCursor)
+    c.execute(con_evento(f"""
         INSERT INTO actividades
             (nombre, descripcion, detalles, responsable, fecha_inicio, fecha_limite, prioridad, creada_por)
         VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
-    """, (
+        RETURNING {', '.join(CAMPOS_ACTIVIDAD)}
+    """, "actividades", "crear"), (
         nombre,
         data.get("descripcion", ""),
         data.get("detalles", ""),
@@ -321,44 +1856,38 @@ def crear_actividad():
         fecha_inicio,
         fecha_limite,
         data.get("prioridad", "media"),
-        data.get("creada_por", "")
+        g.usuario["user"]
     ))
+    actividad = serializar_actividad(c.fetchone())
     conn.commit()
-    conn.close()
-    return jsonify({"ok": True})
+    actividades_cambiaron()
+    return jsonify({"ok": True, "actividad": actividad})
 
 
 @app.route("/api/actividades/<int:act_id>", methods=["PUT"])
 def editar_actividad(act_id):
-    conn = get_db()
-    c = conn.cursor()
-    c.execute("SELECT completada FROM actividades WHERE id = %s", (act_id,))
-    row = c.fetchone()
-
-    if not row:
-        conn.close()
-        return jsonify({"ok": False, "error": "Actividad no encontrada"})
-
-    if row[0]:
-        conn.close()
-        return jsonify({"ok": False, "error": "No se puede editar actividad completada"})
-
-    data = request.get_json()
-
     # Solo Director de Proyecto puede editar actividades
-    editor = data.get("creada_por", "")
-    c.execute("SELECT rol FROM usuarios WHERE username = %s", (editor,))
-    row_v = c.fetchone()
-    if not row_v or row_v[0] != 'coordinador':
-        conn.close()
+    if not g.usuario or g.usuario["rol"] != 'coordinador':
         return jsonify({"ok": False, "error": "Solo el Director de Proyecto puede editar actividades"})
 
-    c.execute("""
+    data = request.get_json()
+    try:
+        fecha_valida(data.get("fecha_inicio"), "fecha_inicio")
+        fecha_valida(data.get("fecha_limite"), "fecha_limite")
+    except ValueError as e:
+        return jsonify({"ok": False, "error": str(e)})
+
+    # La condición va en el propio UPDATE: sin lectura previa y sin carrera
+    # con otro worker que la complete entre medias
+    conn = get_db()
+    c = conn.cursor(cursor_factory=RealDictCursor)
+    c.execute(con_evento(f"""
         UPDATE actividades
         SET nombre = %s, descripcion = %s, detalles = %s, responsable = %s,
             fecha_inicio = %s, fecha_limite = %s, prioridad = %s
-        WHERE id = %s
-    """, (
+        WHERE id = %s AND NOT COALESCE(completada, FALSE)
+        RETURNING {', '.join(CAMPOS_ACTIVIDAD)}
+    """, "actividades", "editar"), (
         data.get("nombre"),
         data.get("descripcion", ""),
         data.get("detalles", ""),
@@ -368,9 +1897,12 @@ def editar_actividad(act_id):
         data.get("prioridad", "media"),
         act_id
     ))
+    row = c.fetchone()
+    if not row:
+        return jsonify({"ok": False, "error": motivo_sin_cambio(c, act_id, "No se puede editar actividad completada")})
     conn.commit()
-    conn.close()
-    return jsonify({"ok": True})
+    actividades_cambiaron()
+    return jsonify({"ok": True, "actividad": serializar_actividad(row)})
 
 
 @app.route("/api/actividades/<int:act_id>/completar", methods=["PUT"])
@@ -378,66 +1910,96 @@ def completar_actividad(act_id):
     data = request.get_json()
     fecha_comp = data.get("fecha_completado", "")
     observaciones = data.get("observaciones", "")
-    completada_por = data.get("completada_por", "")
+    completada_por = autor()
 
+    if completada_por is None:
+        return jsonify({"ok": False, "error": SIN_SESION})
     if not fecha_comp:
         return jsonify({"ok": False, "error": "Falta fecha de completado"})
+    try:
+        fecha_valida(fecha_comp, "fecha_completado")
+    except ValueError as e:
+        return jsonify({"ok": False, "error": str(e)})
 
     conn = get_db()
-    c = conn.cursor()
-    c.execute("SELECT completada FROM actividades WHERE id = %s", (act_id,))
-    row = c.fetchone()
-
-    if not row:
-        conn.close()
-        return jsonify({"ok": False, "error": "Actividad no encontrada"})
-
-    if row[0]:
-        conn.close()
-        return jsonify({"ok": False, "error": "Ya está completada"})
-
-    c.execute("""
+    c = conn.cursor(cursor_factory=RealDictCursor)
+    c.execute(con_evento(f"""
         UPDATE actividades
         SET completada = TRUE, fecha_completado = %s, observaciones = %s, completada_por = %s
-        WHERE id = %s
-    """, (fecha_comp, observaciones, completada_por, act_id))
+        WHERE id = %s AND NOT COALESCE(completada, FALSE)
+        RETURNING {', '.join(CAMPOS_ACTIVIDAD)}
+    """, "actividades", "completar"), (fecha_comp, observaciones, completada_por, act_id))
+    row = c.fetchone()
+    if not row:
+        return jsonify({"ok": False, "error": motivo_sin_cambio(c, act_id, "Ya está completada")})
     conn.commit()
-    conn.close()
-    return jsonify({"ok": True})
+    actividades_cambiaron()
+    return jsonify({"ok": True, "actividad": serializar_actividad(row)})
 
 
 @app.route("/api/actividades/<int:act_id>", methods=["DELETE"])
 def eliminar_actividad(act_id):
     conn = get_db()
     c = conn.cursor()
-    c.execute("DELETE FROM actividades WHERE id = %s", (act_id,))
+    c.execute(con_evento("DELETE FROM actividades WHERE id = %s RETURNING id",
+                         "actividades", "eliminar"), (act_id,))
+    if not c.fetchone():
+        return jsonify({"ok": False, "error": "Actividad no encontrada"})
     conn.commit()
-    conn.close()
-    return jsonify({"ok": True})
+    actividades_cambiaron()
+    return jsonify({"ok": True, "id": act_id})
 
 
 # ============================================================
 # API — FINANZAS
 # ============================================================
 @app.route("/api/finanzas", methods=["GET"])
+@condicional("finanzas")
 def listar_finanzas():
+    """Lista de gastos, más recientes primero.
+
+    Acepta los mismos parámetros fields/limit/cursor/since que
+    /api/actividades; el keyset es (fecha_compra, id) en orden descendente.
+    """
+    try:
+        cols = parse_fields(request.args.get("fields"), CAMPOS_FINANZA, ("id", "fecha_compra"))
+        limit, cursor = parse_paginacion()
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    if "since" in request.args:
+        return respuesta_delta("finanzas", cols, "fecha_compra DESC, id DESC", serializar_finanza)
+
+    sql = f"SELECT {', '.join(cols)} FROM finanzas"
+    params = []
+    if cursor:
+        sql += " WHERE (fecha_compra, id) < (%s, %s)"
+        params += cursor
+    sql += " ORDER BY fecha_compra DESC, id DESC"
     conn = get_db()
+    if limit is None:
+        return respuesta_json(lista_json(conn, sql, params, cols, "fecha_compra DESC, id DESC",
+                                         serializar_finanza, en_bd=render_en_bd()))
+
+    sql += " LIMIT %s"
+    params.append(limit + 1)
     c = conn.cursor(cursor_factory=RealDictCursor)
-    c.execute("SELECT * FROM finanzas ORDER BY fecha_compra DESC")
-    rows = c.fetchall()
-    conn.close()
-
-    result = []
-    for r in rows:
-        row_dict = dict(r)
-        if row_dict.get('fecha_compra'):
-            row_dict['fecha_compra'] = str(row_dict['fecha_compra'])
-        for campo in ['valor_unitario', 'valor_total']:
-            if row_dict.get(campo):
-                row_dict[campo] = float(row_dict[campo])
-        result.append(row_dict)
+    c.execute(sql, params)
+    result = [serializar_finanza(r) for r in c.fetchall()]
+    return jsonify(pagina(result, limit, "fecha_compra"))
 
-    return jsonify(result)
+
+@app.route("/api/finanzas/<int:fin_id>", methods=["GET"])
+def obtener_finanza(fin_id):
+    conn = get_db()
+    c = conn.cursor(cursor_factory=RealDictCursor)
+    c.execute(f"SELECT {', '.join(CAMPOS_FINANZA)} FROM finanzas WHERE id = %s", (fin_id,))
+    row = c.fetchone()
+
+    if row:
+        return jsonify(serializar_finanza(row))
+
+    return jsonify({"error": "No encontrado"}), 404
 
 
 @app.route("/api/finanzas", methods=["POST"])
@@ -449,19 +2011,26 @@ def crear_finanza():
     valor_unitario = data.get("valor_unitario", 0)
     cantidad = data.get("cantidad", 1)
 
+    creado_por = autor()
+    if creado_por is None:
+        return jsonify({"ok": False, "error": SIN_SESION})
     if not all([fecha, concepto, valor_unitario]):
         return jsonify({"ok": False, "error": "Faltan campos obligatorios"})
-
-    valor_total = float(valor_unitario) * int(cantidad)
+    try:
+        fecha_valida(fecha, "fecha_compra")
+        valor_unitario, cantidad, valor_total = importes(valor_unitario, cantidad)
+    except ValueError as e:
+        return jsonify({"ok": False, "error": str(e)})
 
     conn = get_db()
-    c = conn.cursor()
-    c.execute("""
+    c = conn.cursor(cursor_factory=RealDictCursor)
+    c.execute(con_evento(f"""
         INSERT INTO finanzas
             (fecha_compra, concepto, categoria, proveedor, cantidad, valor_unitario, 
              valor_total, metodo_pago, responsable, observaciones, factura, creado_por)
         VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
-    """, (
+        RETURNING {', '.join(CAMPOS_FINANZA)}
+    """, "finanzas", "crear"), (
         fecha,
         concepto,
         data.get("categoria", ""),
@@ -473,31 +2042,38 @@ def crear_finanza():
         data.get("responsable", ""),
         data.get("observaciones", ""),
         data.get("factura", ""),
-        data.get("creado_por", "")
+        creado_por
     ))
+    finanza = serializar_finanza(c.fetchone())
     conn.commit()
-    conn.close()
-    return jsonify({"ok": True})
+    return jsonify({"ok": True, "finanza": finanza})
 
 
 @app.route("/api/finanzas/<int:fin_id>", methods=["PUT"])
 def editar_finanza(fin_id):
     data = request.get_json()
+    modificado_por = autor()
+    if modificado_por is None:
+        return jsonify({"ok": False, "error": SIN_SESION})
 
-    valor_unitario = data.get("valor_unitario", 0)
-    cantidad = data.get("cantidad", 1)
-    valor_total = float(valor_unitario) * int(cantidad)
+    try:
+        fecha_valida(data.get("fecha_compra"), "fecha_compra")
+        valor_unitario, cantidad, valor_total = importes(data.get("valor_unitario", 0),
+                                                         data.get("cantidad", 1))
+    except ValueError as e:
+        return jsonify({"ok": False, "error": str(e)})
 
     conn = get_db()
-    c = conn.cursor()
-    c.execute("""
+    c = conn.cursor(cursor_factory=RealDictCursor)
+    c.execute(con_evento(f"""
         UPDATE finanzas
         SET fecha_compra = %s, concepto = %s, categoria = %s, proveedor = %s,
             cantidad = %s, valor_unitario = %s, valor_total = %s,
             metodo_pago = %s, responsable = %s, observaciones = %s, factura = %s,
             modificado_por = %s, modificado_en = CURRENT_TIMESTAMP
         WHERE id = %s
-    """, (
+        RETURNING {', '.join(CAMPOS_FINANZA)}
+    """, "finanzas", "editar"), (
         data.get("fecha_compra"),
         data.get("concepto"),
         data.get("categoria", ""),
@@ -509,112 +2085,902 @@ def editar_finanza(fin_id):
         data.get("responsable", ""),
         data.get("observaciones", ""),
         data.get("factura", ""),
-        data.get("modificado_por", ""),
+        modificado_por,
         fin_id
     ))
+    row = c.fetchone()
+    if not row:
+        return jsonify({"ok": False, "error": "Gasto no encontrado"})
     conn.commit()
-    conn.close()
-    return jsonify({"ok": True})
+    return jsonify({"ok": True, "finanza": serializar_finanza(row)})
 
 
 @app.route("/api/finanzas/<int:fin_id>", methods=["DELETE"])
 def eliminar_finanza(fin_id):
     conn = get_db()
     c = conn.cursor()
-    c.execute("DELETE FROM finanzas WHERE id = %s", (fin_id,))
+    c.execute(con_evento("DELETE FROM finanzas WHERE id = %s RETURNING id",
+                         "finanzas", "eliminar"), (fin_id,))
+    if not c.fetchone():
+        return jsonify({"ok": False, "error": "Gasto no encontrado"})
     conn.commit()
-    conn.close()
-    return jsonify({"ok": True})
+    return jsonify({"ok": True, "id": fin_id})
 
 
 @app.route("/api/finanzas/total")
+@condicional("finanzas")
 def total_finanzas():
     conn = get_db()
     c = conn.cursor()
-    c.execute("SELECT SUM(valor_total) FROM finanzas")
-    total = c.fetchone()[0] or 0
-    conn.close()
+    c.execute("SELECT total FROM finanzas_resumen WHERE dimension = 'total'")
+    row = c.fetchone()
+    total = row[0] if row else 0
     return jsonify({"total": float(total)})
 
 
+DIMENSIONES_RESUMEN = ("mes", "categoria", "proveedor", "responsable")
+
+
+@app.route("/api/finanzas/resumen")
+@condicional("finanzas")
+def resumen_finanzas():
+    """Totales agrupados por mes, categoría, proveedor y responsable.
+
+    Se lee de finanzas_resumen (mantenida por trigger), así que el costo es
+    proporcional al número de grupos, no de gastos. ?dimension=mes limita la
+    respuesta a una sola agrupación.
+    """
+    dimension = request.args.get("dimension")
+    if dimension and dimension not in DIMENSIONES_RESUMEN:
+        return jsonify({"error": f"Dimensión no válida: {dimension}"}), 400
+
+    conn = get_db()
+    c = conn.cursor()
+    if dimension:
+        c.execute("""
+            SELECT dimension, clave, total, registros FROM finanzas_resumen
+            WHERE dimension IN ('total', %s) ORDER BY dimension, clave
+        """, (dimension,))
+    else:
+        c.execute("SELECT dimension, clave, total, registros FROM finanzas_resumen ORDER BY dimension, clave")
+
+    result = {"total": 0.0, "registros": 0}
+    for dim in ([dimension] if dimension else DIMENSIONES_RESUMEN):
+        result[f"por_{dim}"] = []
+    for dim, clave, total, registros in c.fetchall():
+        if dim == "total":
+            result["total"] = float(total)
+            result["registros"] = registros
+        else:
+            result[f"por_{dim}"].append({"clave": clave, "total": float(total), "registros": registros})
+    return jsonify(result)
+
+
 # ============================================================
-# EXPORTAR A EXCEL
+# API — BÚSQUEDA
 # ============================================================
-@app.route("/api/exportar/excel")
-def exportar_excel():
-    if not EXCEL_AVAILABLE:
-        return jsonify({"error": "openpyxl no instalado"}), 500
+# GET /api/buscar?q= busca en actividades (nombre, descripción, detalles,
+# observaciones) y gastos (concepto, proveedor, categoría, factura). En
+# PostgreSQL usa las columnas tsvector `busqueda` con índice GIN
+# (migraciones/0006) y ordena con ts_rank_cd; el fragmento resaltado
+# (ts_headline, lo más caro) se calcula sólo para la página pedida. En
+# SQLite usa los índices FTS5 de migraciones/sqlite/0002 y bm25.
+BUSQUEDA_LIMIT_DEFAULT = 20
+BUSQUEDA_LIMIT_MAX     = 100
+BUSQUEDA_MAX_CHARS     = 200
+# Marcas del término encontrado en `fragmento` (texto plano, no HTML)
+BUSQUEDA_MARCAS        = ("«", "»")
+
+BUSQUEDA_TABLAS = {
+    "actividades": """
+        SELECT 'actividad' AS tipo, a.id, a.nombre AS titulo, a.fecha_limite AS fecha,
+               concat_ws(' ', a.descripcion, a.detalles, a.observaciones) AS texto,
+               ts_rank_cd(a.busqueda, q.q) AS rango
+        FROM actividades a, q
+        WHERE a.busqueda @@ q.q
+    """,
+    "finanzas": """
+        SELECT 'finanza' AS tipo, f.id, f.concepto AS titulo, f.fecha_compra AS fecha,
+               concat_ws(' ', f.proveedor, f.categoria, f.factura) AS texto,
+               ts_rank_cd(f.busqueda, q.q) AS rango
+        FROM finanzas f, q
+        WHERE f.busqueda @@ q.q
+    """,
+}
+SQL_BUSCAR = f"""
+    WITH q AS (SELECT websearch_to_tsquery('spanish', %(q)s) AS q),
+    r AS (
+        {{partes}}
+        ORDER BY rango DESC, tipo, id
+        LIMIT %(limit)s OFFSET %(offset)s
+    )
+    SELECT r.tipo, r.id, r.titulo, r.fecha, r.rango,
+           ts_headline('spanish', r.texto, q.q,
+                       'StartSel={BUSQUEDA_MARCAS[0]}, StopSel={BUSQUEDA_MARCAS[1]}, MaxWords=20, MinWords=8')
+               AS fragmento
+    FROM r, q
+    ORDER BY r.rango DESC, r.tipo, r.id
+"""
+if ES_SQLITE:
+    # bm25 es menor cuanto más relevante: se invierte el signo. Los pesos
+    # siguen el orden de columnas del índice FTS5.
+    BUSQUEDA_TABLAS = {
+        "actividades": f"""
+            SELECT 'actividad' AS tipo, a.id, a.nombre AS titulo, a.fecha_limite AS fecha,
+                   -bm25(actividades_busqueda, 4.0, 2.0, 2.0, 1.0) AS rango,
+                   snippet(actividades_busqueda, -1, '{BUSQUEDA_MARCAS[0]}', '{BUSQUEDA_MARCAS[1]}', '…', 16)
+                       AS fragmento
+            FROM actividades_busqueda JOIN actividades a ON a.id = actividades_busqueda.rowid
+            WHERE actividades_busqueda MATCH %(q)s
+        """,
+        "finanzas": f"""
+            SELECT 'finanza' AS tipo, f.id, f.concepto AS titulo, f.fecha_compra AS fecha,
+                   -bm25(finanzas_busqueda, 4.0, 2.0, 2.0, 1.0) AS rango,
+                   snippet(finanzas_busqueda, -1, '{BUSQUEDA_MARCAS[0]}', '{BUSQUEDA_MARCAS[1]}', '…', 16)
+                       AS fragmento
+            FROM finanzas_busqueda JOIN finanzas f ON f.id = finanzas_busqueda.rowid
+            WHERE finanzas_busqueda MATCH %(q)s
+        """,
+    }
+    SQL_BUSCAR = """
+        SELECT * FROM ({partes})
+        ORDER BY rango DESC, tipo, id
+        LIMIT %(limit)s OFFSET %(offset)s
+    """
+
+
+def consulta_fts5(texto):
+    """Términos de la búsqueda como consulta FTS5: todos, cada uno por prefijo."""
+    return " ".join(f'"{termino}"*' for termino in re.findall(r"\w+", texto))
+
+
+@app.route("/api/buscar")
+def buscar():
+    """Búsqueda de texto completo en actividades y gastos, por relevancia.
+
+    Parámetros: q (obligatorio; admite "frase exacta", OR y -excluir en
+    PostgreSQL), tipo=actividades|finanzas (por defecto ambas), limit y
+    offset. Respuesta: {"items": [{tipo, id, titulo, fecha, rango,
+    fragmento}], "limit", "offset", "next_offset"}; next_offset es null en
+    la última página.
+    """
+    q = request.args.get("q", "").strip()
+    if len(q) < 2 or len(q) > BUSQUEDA_MAX_CHARS:
+        return jsonify({"error": f"q debe tener entre 2 y {BUSQUEDA_MAX_CHARS} caracteres"}), 400
+    tipo = request.args.get("tipo")
+    if tipo is not None and tipo not in BUSQUEDA_TABLAS:
+        return jsonify({"error": f"tipo no válido: {tipo}"}), 400
+    try:
+        limit = max(1, min(int(request.args.get("limit", BUSQUEDA_LIMIT_DEFAULT)), BUSQUEDA_LIMIT_MAX))
+        offset = max(0, int(request.args.get("offset", 0)))
+    except ValueError:
+        return jsonify({"error": "limit y offset deben ser enteros"}), 400
+    if ES_SQLITE:
+        q = consulta_fts5(q)
+        if not q:
+            return jsonify({"items": [], "limit": limit, "offset": offset, "next_offset": None})
+
+    partes = " UNION ALL ".join(BUSQUEDA_TABLAS[t] for t in ([tipo] if tipo else BUSQUEDA_TABLAS))
+    conn = get_db()
+    c = conn.cursor(cursor_factory=RealDictCursor)
+    # Una fila de más para saber si hay otra página
+    c.execute(SQL_BUSCAR.format(partes=partes), {"q": q, "limit": limit + 1, "offset": offset})
+    filas = c.fetchall()
+    items = [{
+        "tipo": r["tipo"],
+        "id": r["id"],
+        "titulo": r["titulo"],
+        "fecha": str(r["fecha"]) if r["fecha"] is not None else None,
+        # Sin redondear: bm25 (SQLite) da puntajes del orden de 1e-6 cuando el
+        # término aparece en casi todas las filas
+        "rango": float(r["rango"]),
+        "fragmento": r["fragmento"] or "",
+    } for r in filas[:limit]]
+    return jsonify({"items": items, "limit": limit, "offset": offset,
+                    "next_offset": offset + limit if len(filas) > limit else None})
 
-    wb = openpyxl.Workbook()
-    wb.remove(wb.active)
 
-    ws_act = wb.create_sheet("Actividades")
-    
-    header_fill = PatternFill(start_color="003B71", end_color="003B71", fill_type="solid")
-    header_font = Font(bold=True, color="FFFFFF", size=11)
-    border = Border(
-        left=Side(style='thin'),
-        right=Side(style='thin'),
-        top=Side(style='thin'),
-        bottom=Side(style='thin')
-    )
+# ============================================================
+# API — LOTES
+# ============================================================
+# POST /api/batch ejecuta una lista ordenada de operaciones en UNA
+# transacción. Las operaciones consecutivas del mismo tipo se agrupan en una
+# sola sentencia multi-fila (execute_values): 50 altas son un único INSERT.
+BATCH_MAX = int(os.environ.get("BATCH_MAX", 500))
 
-    headers = ["Actividad", "Responsable (Cargo)", "Fecha Inicio", "Fecha Límite", "Fecha Completado", "Estado", "Observaciones"]
-    for col_num, header in enumerate(headers, 1):
-        cell = ws_act.cell(row=1, column=col_num, value=header)
-        cell.fill = header_fill
-        cell.font = header_font
-        cell.alignment = Alignment(horizontal="center", vertical="center")
-        cell.border = border
+_COLS_ACT = ", ".join(CAMPOS_ACTIVIDAD)
+_COLS_FIN = ", ".join(CAMPOS_FINANZA)
+
+# (tabla, op) → (sentencia, plantilla de fila para execute_values)
+SQL_LOTE = {
+    ("actividades", "crear"): (f"""
+        INSERT INTO actividades
+            (nombre, descripcion, detalles, responsable, fecha_inicio, fecha_limite, prioridad, creada_por)
+        VALUES %s
+        RETURNING {_COLS_ACT}
+    """, None),
+    ("actividades", "editar"): (f"""
+        UPDATE actividades AS a
+        SET nombre = v.nombre, descripcion = v.descripcion, detalles = v.detalles,
+            responsable = v.responsable, fecha_inicio = v.fecha_inicio,
+            fecha_limite = v.fecha_limite, prioridad = v.prioridad
+        FROM (VALUES %s) AS v(id, nombre, descripcion, detalles, responsable,
+                              fecha_inicio, fecha_limite, prioridad)
+        WHERE a.id = v.id AND NOT COALESCE(a.completada, FALSE)
+        RETURNING {", ".join("a." + col for col in CAMPOS_ACTIVIDAD)}
+    """, "(%s::int, %s, %s, %s, %s, %s::date, %s::date, %s)"),
+    ("actividades", "completar"): (f"""
+        UPDATE actividades AS a
+        SET completada = TRUE, fecha_completado = v.fecha_completado,
+            observaciones = v.observaciones, completada_por = v.completada_por
+        FROM (VALUES %s) AS v(id, fecha_completado, observaciones, completada_por)
+        WHERE a.id = v.id AND NOT COALESCE(a.completada, FALSE)
+        RETURNING {", ".join("a." + col for col in CAMPOS_ACTIVIDAD)}
+    """, "(%s::int, %s::date, %s, %s)"),
+    ("finanzas", "crear"): (f"""
+        INSERT INTO finanzas
+            (fecha_compra, concepto, categoria, proveedor, cantidad, valor_unitario,
+             valor_total, metodo_pago, responsable, observaciones, factura, creado_por)
+        VALUES %s
+        RETURNING {_COLS_FIN}
+    """, None),
+    ("finanzas", "editar"): (f"""
+        UPDATE finanzas AS f
+        SET fecha_compra = v.fecha_compra, concepto = v.concepto, categoria = v.categoria,
+            proveedor = v.proveedor, cantidad = v.cantidad, valor_unitario = v.valor_unitario,
+            valor_total = v.valor_total, metodo_pago = v.metodo_pago,
+            responsable = v.responsable, observaciones = v.observaciones,
+            factura = v.factura, modificado_por = v.modificado_por,
+            modificado_en = CURRENT_TIMESTAMP
+        FROM (VALUES %s) AS v(id, fecha_compra, concepto, categoria, proveedor, cantidad,
+                              valor_unitario, valor_total, metodo_pago, responsable,
+                              observaciones, factura, modificado_por)
+        WHERE f.id = v.id
+        RETURNING {", ".join("f." + col for col in CAMPOS_FINANZA)}
+    """, "(%s::int, %s::date, %s, %s, %s, %s::int, %s::numeric, %s::numeric, %s, %s, %s, %s, %s)"),
+    ("actividades", "eliminar"): (f"DELETE FROM actividades WHERE {SQL_MOTOR['ids_en']} RETURNING id", None),
+    ("finanzas", "eliminar"): (f"DELETE FROM finanzas WHERE {SQL_MOTOR['ids_en']} RETURNING id", None),
+}
+if ES_SQLITE:
+    # SQLite no acepta alias en la tabla de un UPDATE ... FROM ni columnas
+    # calificadas en RETURNING: los valores van en un CTE y sin casts
+    SQL_LOTE.update({
+        ("actividades", "editar"): (f"""
+            WITH v(id, nombre, descripcion, detalles, responsable,
+                   fecha_inicio, fecha_limite, prioridad) AS (VALUES %s)
+            UPDATE actividades
+            SET nombre = v.nombre, descripcion = v.descripcion, detalles = v.detalles,
+                responsable = v.responsable, fecha_inicio = v.fecha_inicio,
+                fecha_limite = v.fecha_limite, prioridad = v.prioridad
+            FROM v
+            WHERE actividades.id = v.id AND NOT COALESCE(actividades.completada, FALSE)
+            RETURNING {_COLS_ACT}
+        """, None),
+        ("actividades", "completar"): (f"""
+            WITH v(id, fecha_completado, observaciones, completada_por) AS (VALUES %s)
+            UPDATE actividades
+            SET completada = TRUE, fecha_completado = v.fecha_completado,
+                observaciones = v.observaciones, completada_por = v.completada_por
+            FROM v
+            WHERE actividades.id = v.id AND NOT COALESCE(actividades.completada, FALSE)
+            RETURNING {_COLS_ACT}
+        """, None),
+        ("finanzas", "editar"): (f"""
+            WITH v(id, fecha_compra, concepto, categoria, proveedor, cantidad,
+                   valor_unitario, valor_total, metodo_pago, responsable,
+                   observaciones, factura, modificado_por) AS (VALUES %s)
+            UPDATE finanzas
+            SET fecha_compra = v.fecha_compra, concepto = v.concepto, categoria = v.categoria,
+                proveedor = v.proveedor, cantidad = v.cantidad, valor_unitario = v.valor_unitario,
+                valor_total = v.valor_total, metodo_pago = v.metodo_pago,
+                responsable = v.responsable, observaciones = v.observaciones,
+                factura = v.factura, modificado_por = v.modificado_por,
+                modificado_en = CURRENT_TIMESTAMP
+            FROM v
+            WHERE finanzas.id = v.id
+            RETURNING {_COLS_FIN}
+        """, None),
+    })
+
+
+def valores_lote(tabla, op, item):
+    """Valida una operación del lote y devuelve la tupla de valores de su fila."""
+    d = item.get("datos") or {}
+    id_ = item.get("id")
+    if op != "crear" and (not isinstance(id_, int) or isinstance(id_, bool)):
+        raise ValueError("Falta el id")
+
+    if tabla == "actividades":
+        if op in ("crear", "editar") and (not g.usuario or g.usuario["rol"] != 'coordinador'):
+            raise ValueError("Solo el Director de Proyecto puede crear o editar actividades")
+        if op == "crear":
+            nombre = str(d.get("nombre", "")).strip()
+            responsable = str(d.get("responsable", "")).strip()
+            if not all([nombre, responsable, d.get("fecha_inicio"), d.get("fecha_limite")]):
+                raise ValueError("Faltan campos obligatorios")
+            fecha_valida(d["fecha_inicio"], "fecha_inicio")
+            fecha_valida(d["fecha_limite"], "fecha_limite")
+            return (nombre, d.get("descripcion", ""), d.get("detalles", ""), responsable,
+                    d["fecha_inicio"], d["fecha_limite"], d.get("prioridad", "media"),
+                    g.usuario["user"])
+        if op == "editar":
+            fecha_valida(d.get("fecha_inicio"), "fecha_inicio")
+            fecha_valida(d.get("fecha_limite"), "fecha_limite")
+            return (id_, d.get("nombre"), d.get("descripcion", ""), d.get("detalles", ""),
+                    d.get("responsable"), d.get("fecha_inicio"), d.get("fecha_limite"),
+                    d.get("prioridad", "media"))
+        if op == "completar":
+            if not d.get("fecha_completado"):
+                raise ValueError("Falta fecha de completado")
+            fecha_valida(d["fecha_completado"], "fecha_completado")
+            if autor() is None:
+                raise ValueError(SIN_SESION)
+            return (id_, d["fecha_completado"], d.get("observaciones", ""), autor())
+        return (id_,)
+
+    if op == "eliminar":
+        return (id_,)
+    if autor() is None:
+        raise ValueError(SIN_SESION)
+    if op == "crear" and not all([d.get("fecha_compra"), str(d.get("concepto", "")).strip(),
+                                  d.get("valor_unitario")]):
+        raise ValueError("Faltan campos obligatorios")
+    fecha_valida(d.get("fecha_compra"), "fecha_compra")
+    valor_unitario, cantidad, valor_total = importes(d.get("valor_unitario", 0), d.get("cantidad", 1))
+    comunes = (d.get("fecha_compra"), str(d.get("concepto", "")).strip(),
+               d.get("categoria", ""), d.get("proveedor", ""), cantidad, valor_unitario,
+               valor_total, d.get("metodo_pago", ""), d.get("responsable", ""),
+               d.get("observaciones", ""), d.get("factura", ""))
+    if op == "crear":
+        return comunes + (autor(),)
+    return (id_,) + comunes + (autor(),)
+
+
+def tramos_lote(operaciones):
+    """Agrupa operaciones consecutivas con igual (tabla, op) en tramos.
+
+    Un id repetido abre un tramo nuevo para que dos cambios a la misma fila
+    se apliquen en orden y no dentro de un mismo UPDATE ... FROM.
+    """
+    tramos = []
+    for indice, (clave, valores) in enumerate(operaciones):
+        tramo = tramos[-1] if tramos else None
+        repetido = (tramo is not None and clave[1] != "crear"
+                    and valores[0] in {v[0] for _, v in tramo[1]})
+        if tramo is None or tramo[0] != clave or repetido:
+            tramo = (clave, [])
+            tramos.append(tramo)
+        tramo[1].append((indice, valores))
+    return tramos
+
+
+def ejecutar_tramo(c, clave, filas):
+    """Ejecuta un tramo con una sola sentencia. Devuelve {indice: fila o id}."""
+    tabla, op = clave
+    sql, plantilla = SQL_LOTE[clave]
+    if op == "eliminar":
+        c.execute(sql, (lista_ids(v[0] for _, v in filas),))
+        borrados = {r["id"] for r in c.fetchall()}
+        return {i: v[0] for i, v in filas if v[0] in borrados}
+
+    devueltas = ejecutar_valores(c, sql, [v for _, v in filas], plantilla)
+    if op == "crear":
+        # Los SERIAL se asignan en el orden de VALUES
+        return {i: fila for (i, _), fila in zip(filas, sorted(devueltas, key=lambda r: r["id"]))}
+    por_id = {r["id"]: r for r in devueltas}
+    return {i: por_id[v[0]] for i, v in filas if v[0] in por_id}
+
+
+@app.route("/api/batch", methods=["POST"])
+def lote():
+    """Lista ordenada de operaciones sobre actividades y finanzas, todo o nada.
+
+    Cuerpo: {"operaciones": [{"tabla": "actividades", "op": "crear"|"editar"|
+    "completar"|"eliminar", "id": 5, "datos": {...}}, ...]}. Respuesta:
+    {"ok": bool, "resultados": [...]} con un resultado por operación y en el
+    mismo orden. Si alguna falla no se aplica ninguna.
+    """
+    data = request.get_json(silent=True) or {}
+    operaciones = data.get("operaciones")
+    if not isinstance(operaciones, list) or not operaciones:
+        return jsonify({"error": "Se espera una lista 'operaciones'"}), 400
+    if len(operaciones) > BATCH_MAX:
+        return jsonify({"error": f"Máximo {BATCH_MAX} operaciones por lote"}), 400
+
+    resultados = [None] * len(operaciones)
+    validas = []
+    for i, item in enumerate(operaciones):
+        clave = (str(item.get("tabla")), str(item.get("op"))) if isinstance(item, dict) else None
+        if clave not in SQL_LOTE:
+            resultados[i] = {"ok": False, "error": "Operación no válida"}
+            continue
+        try:
+            validas.append((clave, valores_lote(*clave, item)))
+        except ValueError as e:
+            resultados[i] = {"ok": False, "error": str(e)}
+    if any(resultados):
+        return jsonify({"ok": False, "resultados": [
+            r or {"ok": False, "error": "Lote no aplicado"} for r in resultados]})
 
     conn = get_db()
     c = conn.cursor(cursor_factory=RealDictCursor)
-    c.execute("SELECT * FROM actividades ORDER BY fecha_limite ASC")
-    actividades = c.fetchall()
-
-    # Colores por estado (coinciden con leyenda de la app)
-    COLOR_ESTADO = {
-        'default':   'FFC107',   # Amarillo  — En ejecución
-        'prematuro': '2196F3',   # Azul      — Completado prematuro
-        'tiempo':    '4CAF50',   # Verde     — Completado a tiempo
-        'leve':      'FF9800',   # Naranja   — Retraso leve
-        'tarde':     'F44336',   # Rojo      — Retraso grave
-    }
+    for clave, filas in tramos_lote(validas):
+        try:
+            aplicadas = ejecutar_tramo(c, clave, filas)
+        except ERRORES_DATOS as e:
+            # La sentencia es una sola por tramo: el error se marca en todas
+            # sus operaciones y el resto del lote queda sin aplicar
+            conn.rollback()
+            error = {"ok": False, "error": f"Datos no válidos: {str(e).splitlines()[0]}"}
+            en_tramo = {i for i, _ in filas}
+            return jsonify({"ok": False, "resultados": [
+                error if i in en_tramo else {"ok": False, "error": "Lote no aplicado"}
+                for i in range(len(operaciones))]})
+        tabla, op = clave
+        for i, _ in filas:
+            if i not in aplicadas:
+                error = ("Actividad no encontrada o ya completada" if tabla == "actividades"
+                         and op in ("editar", "completar") else "Registro no encontrado")
+                resultados[i] = {"ok": False, "error": error}
+            elif op == "eliminar":
+                resultados[i] = {"ok": True, "id": aplicadas[i]}
+            elif tabla == "actividades":
+                resultados[i] = {"ok": True, "actividad": serializar_actividad(aplicadas[i])}
+            else:
+                resultados[i] = {"ok": True, "finanza": serializar_finanza(aplicadas[i])}
 
-    def calcular_estado(completada, fecha_limite, fecha_completado):
-        if not completada:
-            return 'default', '⏳ En ejecución'
-        from datetime import date
-        lim  = date.fromisoformat(str(fecha_limite))
-        comp = date.fromisoformat(str(fecha_completado))
-        diff = (comp - lim).days
-        if diff < -7:  return 'prematuro', '🔵 Prematuro'
-        if diff <= 0:  return 'tiempo',    '🟢 A tiempo'
-        if diff <= 7:  return 'leve',      '🟠 Retraso leve'
-        return 'tarde', '🔴 Retraso grave'
-
-    for row_num, act in enumerate(actividades, 2):
-        estado_key, estado_label = calcular_estado(
-            act['completada'], act['fecha_limite'], act.get('fecha_completado')
-        )
-        color_hex = COLOR_ESTADO[estado_key]
-        estado_fill = PatternFill(start_color=color_hex, end_color=color_hex, fill_type="solid")
-        estado_font = Font(bold=True, color="FFFFFF" if estado_key in ('prematuro', 'tarde') else "000000")
+    if not all(r["ok"] for r in resultados):
+        conn.rollback()
+        return jsonify({"ok": False, "resultados": [
+            r if not r["ok"] else {"ok": False, "error": "Lote no aplicado"} for r in resultados]})
+
+    tablas = {clave[0] for clave, _ in validas}
+    for tabla in sorted(tablas):
+        emitir_evento(c, tabla, "lote")
+    conn.commit()
+    if "actividades" in tablas:
+        actividades_cambiaron()
+    return jsonify({"ok": True, "resultados": resultados})
+
+
+# ============================================================
+# API — EVENTOS
+# ============================================================
+@app.route("/api/eventos")
+def eventos():
+    """Canal Server-Sent Events con los cambios hechos por cualquier usuario.
+
+    Cada mensaje es {"tabla", "accion", "id"}; "resync" pide recargar todo.
+    No consulta la BD: los eventos llegan del hilo LISTEN del worker.
+    Cada conexión ocupa un hilo mientras dure: con un worker de un solo
+    hilo (gunicorn sync) se responde 204 y el navegador consulta por
+    sondeo en lugar de bloquear el worker.
+    """
+    if not request.environ.get("wsgi.multithread"):
+        return app.response_class(status=204)
+    s = canal_eventos.suscribir()
+    if s is None:
+        return jsonify({"error": "Demasiadas conexiones de eventos"}), 503
+
+    def flujo():
+        try:
+            yield "retry: 5000\n\n"
+            while not s.desbordada:
+                try:
+                    evento = s.cola.get(timeout=EVENTOS_LATIDO)
+                except queue.Empty:
+                    yield ": latido\n\n"
+                    continue
+                yield f"data: {json.dumps(evento)}\n\n"
+        finally:
+            canal_eventos.desuscribir(s)
+
+    response = app.response_class(flujo(), mimetype="text/event-stream")
+    response.headers["Cache-Control"] = "no-cache"
+    response.headers["X-Accel-Buffering"] = "no"
+    return response
+
+
+# ============================================================
+# API — DIAGNÓSTICO
+# ============================================================
+@app.route("/api/db/pool")
+def estado_pool():
+    """Estadísticas del pool de conexiones del worker que atiende la petición."""
+    return jsonify(db_pool.stats())
+
+
+@app.route("/metrics")
+def metricas():
+    """Métricas del worker en formato de texto de Prometheus."""
+    lineas = []
+    for metrica in METRICAS:
+        lineas += metrica.exponer()
+    # Estado del pool y del canal de eventos en el momento del scrape
+    for clave, valor in db_pool.stats().items():
+        if isinstance(valor, (int, float)) and clave != "pid":
+            lineas += [f"# TYPE cronograma_db_pool_{clave} gauge", f"cronograma_db_pool_{clave} {valor}"]
+    lineas += ["# TYPE cronograma_eventos_clientes gauge",
+               f"cronograma_eventos_clientes {canal_eventos.clientes()}"]
+    return app.response_class("\n".join(lineas) + "\n",
+                              content_type="text/plain; version=0.0.4; charset=utf-8")
+
+
+# ============================================================
+# GANTT
+# ============================================================
+# Geometría del diagrama, compartida por /api/gantt y la hoja Gantt del
+# Excel. El periodo va del primer día del mes de la primera actividad al
+# último día del mes de la última; cada barra son dos desplazamientos en
+# días desde el inicio del periodo (d_ini, d_fin), recortados a él.
+# BARRA_COLORS actualizado: El verde ahora es para Electrónicos
+BARRA_COLORS = {
+    "Director de Proyecto":             "2C3E50", # Azul Oscuro (Ya no es verde)
+    "Director de Procesos Mecanicos":   "FF69B4", # Rosado
+    "Director de Procesos Electronicos":"8DB600", # <--- AQUÍ ESTÁ TU VERDE
+    "Diseñador de Sistemas de Control": "9B59B6", # Morado
+    "Director Financiero":              "D4AF37", # Rojo
+}
+BARRA_OTRO = "95A5A6"
+ESTADO_BAR = {
+    "prematuro": "2196F3",
+    "tiempo":    "4CAF50",
+    "leve":      "FF9800",
+    "tarde":     "F44336",
+    "default":   "FFC107",
+}
+
+CAMPOS_GANTT = ("id", "nombre", "responsable", "fecha_inicio", "fecha_limite", "completada", "estado")
+COLUMNAS_GANTT = ["id", "nombre", "responsable", "d_ini", "d_fin", "color", "estado"]
+
+# Diagramas ya serializados, por (versión de actividades, filtros)
+GANTT_CACHE_BYTES = int(os.environ.get("GANTT_CACHE_BYTES", 8 * 2**20))
+cache_gantt = CacheBytes(GANTT_CACHE_BYTES)
+
+
+def _fecha(valor):
+    return valor if isinstance(valor, date) else date.fromisoformat(str(valor))
+
+
+def fin_de_mes(dia):
+    return date(dia.year + dia.month // 12, dia.month % 12 + 1, 1) - timedelta(days=1)
+
+
+def periodo_gantt(inicio, fin):
+    """(p_start, p_end, total_days): `inicio` y `fin` redondeados a meses completos."""
+    p_start = _fecha(inicio).replace(day=1)
+    p_end = fin_de_mes(_fecha(fin))
+    return p_start, p_end, (p_end - p_start).days + 1
+
+
+def meses_gantt(p_start, p_end):
+    """[(primer día del mes, desplazamiento, días)] de cada mes del periodo."""
+    meses = []
+    cur, col = p_start, 0
+    while cur <= p_end:
+        m_end = min(fin_de_mes(cur), p_end)
+        days_in = (m_end - cur).days + 1
+        meses.append((cur, col, days_in))
+        col += days_in
+        cur = m_end + timedelta(days=1)
+    return meses
+
+
+def barra_gantt(act, p_start, total_days):
+    """(d_ini, d_fin, color) de una actividad; d_ini > d_fin si no hay barra.
+
+    Las completadas se pintan por estado y las demás por responsable.
+    """
+    d_ini = max((_fecha(act["fecha_inicio"]) - p_start).days, 0)
+    d_fin = min((_fecha(act["fecha_limite"]) - p_start).days, total_days - 1)
+    if act["completada"]:
+        color = ESTADO_BAR[act["estado"]]
+    else:
+        color = BARRA_COLORS.get(act["responsable"], BARRA_OTRO)
+    return d_ini, d_fin, color
+
+
+def disenar_gantt(actividades, inicio, fin):
+    """Diagrama compacto para el navegador: periodo, meses y una fila por actividad.
+
+    Cada barra es una lista en el orden de COLUMNAS_GANTT. Sin periodo
+    (ni actividades ni ventana) el diagrama sale vacío.
+    """
+    diagrama = {
+        "inicio": None, "fin": None, "dias": 0, "meses": [],
+        "columnas": COLUMNAS_GANTT, "barras": [],
+        "colores": {"estado": ESTADO_BAR, "responsable": BARRA_COLORS, "otro": BARRA_OTRO},
+    }
+    if inicio is None:
+        return diagrama
+    p_start, p_end, total_days = periodo_gantt(inicio, fin)
+    diagrama.update(
+        inicio=p_start.isoformat(), fin=p_end.isoformat(), dias=total_days,
+        meses=[[mes.isoformat(), col, dias] for mes, col, dias in meses_gantt(p_start, p_end)],
+    )
+    for act in actividades:
+        diagrama["barras"].append([act["id"], act["nombre"], act["responsable"],
+                                   *barra_gantt(act, p_start, total_days), act["estado"]])
+    return diagrama
+
+
+@app.route("/api/gantt")
+@condicional("actividades")
+def gantt():
+    """Diagrama de Gantt ya calculado, sin mandar las actividades completas.
+
+    Parámetros opcionales:
+      desde=AAAA-MM-DD / hasta=AAAA-MM-DD  ventana: actividades que la tocan;
+                                           el periodo es la ventana redondeada a meses
+      responsable=X                        solo las actividades de un cargo
+    El resultado se guarda por versión de actividades y filtros: se calcula
+    una vez por cambio de datos y no una vez por petición.
+    """
+    try:
+        desde, hasta = (date.fromisoformat(request.args[k]) if request.args.get(k) else None
+                        for k in ("desde", "hasta"))
+    except ValueError:
+        return jsonify({"error": "Fecha no válida (use AAAA-MM-DD)"}), 400
+    if desde and hasta and desde > hasta:
+        return jsonify({"error": "desde debe ser anterior a hasta"}), 400
+    responsable = request.args.get("responsable")
+    if responsable and responsable not in CARGOS_VALIDOS:
+        return jsonify({"error": f"Responsable no válido: {responsable}"}), 400
+
+    clave = (g.versiones.get("actividades", (0,))[0], desde, hasta, responsable)
+    cuerpo = cache_gantt.get(clave)
+    if cuerpo is None:
+        where, params = [], []
+        if desde:
+            where.append("fecha_limite >= %s")
+            params.append(desde)
+        if hasta:
+            where.append("fecha_inicio <= %s")
+            params.append(hasta)
+        if responsable:
+            where.append("responsable = %s")
+            params.append(responsable)
+        sql = f"SELECT {', '.join(CAMPOS_GANTT)} FROM actividades"
+        if where:
+            sql += " WHERE " + " AND ".join(where)
+        sql += " ORDER BY fecha_limite ASC, id ASC"
+
+        c = get_db().cursor(cursor_factory=RealDictCursor)
+        c.execute(sql, params)
+        filas = c.fetchall()
+        inicio = desde or min((_fecha(f["fecha_inicio"]) for f in filas), default=hasta)
+        fin = hasta or max((_fecha(f["fecha_limite"]) for f in filas), default=desde)
+        cuerpo = json.dumps(disenar_gantt(filas, inicio, fin), ensure_ascii=False,
+                            separators=(",", ":")).encode()
+        cache_gantt.set(clave, cuerpo)
+
+    return respuesta_json(cuerpo)
 
-        ws_act.cell(row=row_num, column=1, value=act['nombre']).border = border
-        ws_act.cell(row=row_num, column=2, value=act['responsable']).border = border
-        ws_act.cell(row=row_num, column=3, value=str(act['fecha_inicio'])).border = border
-        ws_act.cell(row=row_num, column=4, value=str(act['fecha_limite'])).border = border
-        ws_act.cell(row=row_num, column=5, value=str(act['fecha_completado']) if act.get('fecha_completado') else '').border = border
 
-        celda_estado = ws_act.cell(row=row_num, column=6, value=estado_label)
-        celda_estado.border = border
-        celda_estado.fill = estado_fill
-        celda_estado.font = estado_font
-        celda_estado.alignment = Alignment(horizontal="center")
+# ============================================================
+# EXPORTAR A EXCEL
+# ============================================================
+# El libro se genera en modo write-only: cada fila se escribe a disco en
+# cuanto se agrega, las filas se leen de la BD con cursores de servidor por
+# bloques y el .xlsx terminado se envía desde un archivo temporal. La memoria
+# no depende del número de actividades ni de gastos.
+EXPORT_CHUNK = int(os.environ.get("EXPORT_CHUNK", 2000))   # filas por fetchmany
+PROGRESO_CADA = 500                                         # filas entre reportes de avance
+
+XLSX_MIMETYPE = 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+
+# Libros ya generados, por versión de datos. Un libro más grande que todo el
+# límite no se guarda y se sigue enviando desde el archivo temporal.
+EXPORT_CACHE_BYTES = int(os.environ.get("EXPORT_CACHE_BYTES", 32 * 2**20))
+cache_export = CacheBytes(EXPORT_CACHE_BYTES)
+
+
+class ArchivoTemporal(io.FileIO):
+    """Archivo de solo lectura que se borra del disco al cerrarse.
+
+    send_file lo envía por bloques y el servidor WSGI lo cierra al terminar
+    la respuesta (call_on_close no corre con respuestas direct_passthrough).
+    """
+
+    def __init__(self, ruta):
+        super().__init__(ruta, "rb")
+
+    def close(self):
+        super().close()
+        try:
+            os.remove(self.name)
+        except OSError:
+            pass
+
+
+def filas_servidor(conn, nombre, sql, params=None):
+    """Itera un SELECT con un cursor de servidor (con nombre), por bloques."""
+    c = conn.cursor(name=nombre, cursor_factory=RealDictCursor)
+    try:
+        c.execute(sql, params)
+        while True:
+            filas = c.fetchmany(EXPORT_CHUNK)
+            if not filas:
+                break
+            yield from filas
+    finally:
+        c.close()
+
+
+def version_export(conn):
+    """Abre una transacción de instantánea y devuelve el ETag de sus datos.
+
+    Debe ser lo primero que se ejecute en la transacción: la versión y las
+    filas exportadas quedan así en la misma instantánea. Lo leído antes en
+    la petición (el rol del usuario) se descarta con un rollback.
+    """
+    conn.rollback()
+    conn.cursor().execute(SQL_MOTOR["lectura_consistente"])
+    versiones = leer_versiones(conn, ("actividades", "finanzas"))
+    return "xlsx-" + "-".join(str(versiones.get(t, (0,))[0]) for t in ("actividades", "finanzas"))
+
+
+def generar_excel(conn, destino, progreso=None):
+    """Escribe el cronograma completo en `destino` (ruta o archivo binario)."""
+    t0 = time.perf_counter()
+    c = conn.cursor()
+    c.execute("SELECT MIN(fecha_inicio), MAX(fecha_limite) FROM actividades")
+    # En SQLite los agregados llegan como texto (sin tipo declarado)
+    rango = [v if v is None or isinstance(v, date) else date.fromisoformat(v) for v in c.fetchone()]
+
+    escribir_excel(
+        destino,
+        lambda: filas_servidor(conn, "export_actividades",
+                               f"SELECT {', '.join(CAMPOS_ACTIVIDAD)} FROM actividades "
+                               "ORDER BY fecha_limite ASC, id ASC"),
+        lambda: filas_servidor(conn, "export_finanzas",
+                               f"SELECT {', '.join(CAMPOS_FINANZA)} FROM finanzas "
+                               "ORDER BY fecha_compra DESC, id DESC"),
+        rango if rango[0] is not None else None,
+        progreso,
+    )
+    metricas_export.observar(time.perf_counter() - t0, "peticion" if has_request_context() else "job")
+
+
+# Colores por estado (coinciden con leyenda de la app)
+COLOR_ESTADO = {
+    'default':   'FFC107',   # Amarillo  — En ejecución
+    'prematuro': '2196F3',   # Azul      — Completado prematuro
+    'tiempo':    '4CAF50',   # Verde     — Completado a tiempo
+    'leve':      'FF9800',   # Naranja   — Retraso leve
+    'tarde':     'F44336',   # Rojo      — Retraso grave
+}
+
+LABEL_ESTADO = {
+    'default':   '⏳ En ejecución',
+    'prematuro': '🔵 Prematuro',
+    'tiempo':    '🟢 A tiempo',
+    'leve':      '🟠 Retraso leve',
+    'tarde':     '🔴 Retraso grave',
+}
+
+# Paleta de la hoja Gantt
+G_BG        = "0D1B3E"
+G_HEADER    = "1A2E5C"
+G_WHITE     = "FFFFFF"
+G_SIDEBAR   = "1E3A6E"
+G_ODD       = "0F2347"
+G_EVEN      = "112A54"
+G_MONTH     = "243F72"
+
+
+@functools.lru_cache(maxsize=None)
+def cargar_openpyxl():
+    """Importa openpyxl la primera vez que se exporta o importa un libro."""
+    global openpyxl, WriteOnlyCell, Font, PatternFill, Alignment, Border, Side, NamedStyle
+    global get_column_letter, CellRange
+    import openpyxl
+    from openpyxl.cell import WriteOnlyCell
+    from openpyxl.styles import Font, PatternFill, Alignment, Border, Side, NamedStyle
+    from openpyxl.utils import get_column_letter
+    from openpyxl.worksheet.cell_range import CellRange
+
+
+@functools.lru_cache(maxsize=None)
+def estilos_excel():
+    """Registro de estilos del libro: nombre → atributos (font, fill, ...).
+
+    Los objetos Font/PatternFill/Border/Alignment se crean una sola vez por
+    proceso; cada libro los registra como NamedStyle y las celdas solo
+    referencian el nombre, en lugar de construir estilos celda por celda.
+    """
+    cargar_openpyxl()
+    def solido(color):
+        return PatternFill("solid", start_color=color, end_color=color)
+
+    borde = Border(left=Side(style='thin'), right=Side(style='thin'),
+                   top=Side(style='thin'), bottom=Side(style='thin'))
+    centro = Alignment(horizontal="center", vertical="center")
+    bb = Border(bottom=Side(style="thin", color="243F72"))
+
+    estilos = {
+        "utb_header": dict(fill=solido("003B71"), font=Font(bold=True, color="FFFFFF", size=11),
+                           alignment=centro, border=borde),
+        "utb_celda":  dict(border=borde),
+
+        "g_titulo":   dict(fill=solido(G_BG), font=Font(name="Arial", bold=True, size=15, color=G_WHITE),
+                           alignment=centro),
+        "g_header":   dict(fill=solido(G_HEADER), font=Font(name="Arial", bold=True, size=10, color=G_WHITE),
+                           alignment=centro),
+        "g_mes":      dict(fill=solido(G_MONTH), font=Font(name="Arial", bold=True, size=10, color=G_WHITE),
+                           alignment=centro),
+        "g_dia":      dict(fill=solido(G_MONTH), font=Font(name="Arial", size=7, color="AAAAAA"),
+                           alignment=centro),
+        "g_dia_finde": dict(fill=solido(G_MONTH), font=Font(name="Arial", size=7, color="FF6666"),
+                            alignment=centro),
+        "g_nombre":   dict(fill=solido(G_SIDEBAR), font=Font(name="Arial", size=9, color=G_WHITE),
+                           alignment=Alignment(horizontal="left", vertical="center", wrap_text=True, indent=1),
+                           border=bb),
+        "g_resp":     dict(fill=solido(G_SIDEBAR), font=Font(name="Arial", size=8, color="AABBDD", italic=True),
+                           alignment=Alignment(horizontal="left", vertical="center", indent=1),
+                           border=bb),
+        "g_fila_impar": dict(fill=solido(G_ODD), border=Border(bottom=Side(style="thin", color="1A2E5C"))),
+        "g_fila_par":   dict(fill=solido(G_EVEN), border=Border(bottom=Side(style="thin", color="1A2E5C"))),
+        "g_ley_titulo": dict(fill=solido(G_BG), font=Font(name="Arial", bold=True, size=9, color=G_WHITE),
+                             alignment=Alignment(horizontal="left", vertical="center", indent=1)),
+        "g_ley_fondo":  dict(fill=solido(G_BG)),
+    }
+    for key, color in COLOR_ESTADO.items():
+        estilos[f"utb_estado_{key}"] = dict(
+            fill=solido(color), border=borde, alignment=Alignment(horizontal="center"),
+            font=Font(bold=True, color="FFFFFF" if key in ('prematuro', 'tarde') else "000000"))
+    # Barras y cajas de leyenda: un estilo por color (estado o cargo)
+    colores_barra = set(ESTADO_BAR.values()) | set(BARRA_COLORS.values()) | {BARRA_OTRO}
+    for color in colores_barra:
+        estilos[f"g_barra_{color}"] = dict(
+            fill=solido(color), alignment=centro,
+            font=Font(name="Arial", size=7, bold=True, color=G_WHITE))
+        estilos[f"g_ley_{color}"] = dict(
+            fill=solido(color), alignment=centro,
+            font=Font(name="Arial", size=8, bold=True, color=G_WHITE))
+    return estilos
+
+
+def registrar_estilos(wb):
+    for nombre, attrs in estilos_excel().items():
+        wb.add_named_style(NamedStyle(name=nombre, **attrs))
+
+
+def _celda(ws, valor=None, estilo=None):
+    cell = WriteOnlyCell(ws, value=valor)
+    if estilo is not None:
+        cell.style = estilo
+    return cell
+
+
+def _combinar(ws, fila_ini, col_ini, fila_fin, col_fin):
+    # En write-only no existe merge_cells(); el rango se registra directamente
+    # y openpyxl lo escribe al cerrar la hoja.
+    ws.merged_cells.add(CellRange(min_row=fila_ini, min_col=col_ini,
+                                  max_row=fila_fin, max_col=col_fin))
+
+
+def escribir_excel(destino, actividades, finanzas, rango, progreso=None):
+    """Construye el libro en modo write-only.
+
+    `actividades` y `finanzas` son funciones que devuelven un iterador nuevo
+    de filas (dict) cada vez que se llaman: la hoja Gantt recorre las
+    actividades por segunda vez en lugar de guardarlas en memoria. `rango` es
+    (min fecha_inicio, max fecha_limite) o None si no hay actividades.
+    `progreso(hoja, filas)` se llama cada PROGRESO_CADA filas y al cerrar
+    cada hoja.
+    """
+    def avance(hoja, filas, fin=False):
+        if progreso is not None and (fin or filas % PROGRESO_CADA == 0):
+            progreso(hoja, filas)
+
+    cargar_openpyxl()
+    wb = openpyxl.Workbook(write_only=True)
+    registrar_estilos(wb)
 
-        ws_act.cell(row=row_num, column=7, value=act['observaciones'] or "").border = border
+    ws_act = wb.create_sheet("Actividades")
 
+    # En write-only los anchos deben fijarse antes de escribir filas
     ws_act.column_dimensions['A'].width = 40
     ws_act.column_dimensions['B'].width = 30
     ws_act.column_dimensions['C'].width = 15
@@ -623,29 +2989,25 @@ def exportar_excel():
     ws_act.column_dimensions['F'].width = 18
     ws_act.column_dimensions['G'].width = 40
 
+    headers = ["Actividad", "Responsable (Cargo)", "Fecha Inicio", "Fecha Límite", "Fecha Completado", "Estado", "Observaciones"]
+    ws_act.append([_celda(ws_act, h, "utb_header") for h in headers])
+
+    n = 0
+    for n, act in enumerate(actividades(), 1):
+        estado_key = act['estado']
+        ws_act.append([
+            _celda(ws_act, act['nombre'], "utb_celda"),
+            _celda(ws_act, act['responsable'], "utb_celda"),
+            _celda(ws_act, str(act['fecha_inicio']), "utb_celda"),
+            _celda(ws_act, str(act['fecha_limite']), "utb_celda"),
+            _celda(ws_act, str(act['fecha_completado']) if act.get('fecha_completado') else '', "utb_celda"),
+            _celda(ws_act, LABEL_ESTADO[estado_key], f"utb_estado_{estado_key}"),
+            _celda(ws_act, act['observaciones'] or "", "utb_celda"),
+        ])
+        avance("Actividades", n)
+    avance("Actividades", n, fin=True)
+
     ws_fin = wb.create_sheet("Finanzas")
-    
-    fin_headers = ["Fecha", "Concepto", "Categoría", "Proveedor", "Cantidad", "V. Unitario", "V. Total", "Método Pago"]
-    for col_num, header in enumerate(fin_headers, 1):
-        cell = ws_fin.cell(row=1, column=col_num, value=header)
-        cell.fill = header_fill
-        cell.font = header_font
-        cell.alignment = Alignment(horizontal="center", vertical="center")
-        cell.border = border
-
-    c.execute("SELECT * FROM finanzas ORDER BY fecha_compra DESC")
-    finanzas = c.fetchall()
-    conn.close()
-
-    for row_num, fin in enumerate(finanzas, 2):
-        ws_fin.cell(row=row_num, column=1, value=str(fin['fecha_compra'])).border = border
-        ws_fin.cell(row=row_num, column=2, value=fin['concepto']).border = border
-        ws_fin.cell(row=row_num, column=3, value=fin['categoria'] or "").border = border
-        ws_fin.cell(row=row_num, column=4, value=fin['proveedor'] or "").border = border
-        ws_fin.cell(row=row_num, column=5, value=fin['cantidad']).border = border
-        ws_fin.cell(row=row_num, column=6, value=float(fin['valor_unitario'])).border = border
-        ws_fin.cell(row=row_num, column=7, value=float(fin['valor_total'])).border = border
-        ws_fin.cell(row=row_num, column=8, value=fin['metodo_pago'] or "").border = border
 
     ws_fin.column_dimensions['A'].width = 12
     ws_fin.column_dimensions['B'].width = 35
@@ -656,55 +3018,29 @@ def exportar_excel():
     ws_fin.column_dimensions['G'].width = 12
     ws_fin.column_dimensions['H'].width = 15
 
-    # ── HOJA 3: GANTT ────────────────────────────────────────
-    if actividades:
-        from datetime import date, timedelta
+    fin_headers = ["Fecha", "Concepto", "Categoría", "Proveedor", "Cantidad", "V. Unitario", "V. Total", "Método Pago"]
+    ws_fin.append([_celda(ws_fin, h, "utb_header") for h in fin_headers])
+
+    n = 0
+    for n, fin in enumerate(finanzas(), 1):
+        ws_fin.append([
+            _celda(ws_fin, str(fin['fecha_compra']), "utb_celda"),
+            _celda(ws_fin, fin['concepto'], "utb_celda"),
+            _celda(ws_fin, fin['categoria'] or "", "utb_celda"),
+            _celda(ws_fin, fin['proveedor'] or "", "utb_celda"),
+            _celda(ws_fin, fin['cantidad'], "utb_celda"),
+            _celda(ws_fin, float(fin['valor_unitario']), "utb_celda"),
+            _celda(ws_fin, float(fin['valor_total']), "utb_celda"),
+            _celda(ws_fin, fin['metodo_pago'] or "", "utb_celda"),
+        ])
+        avance("Finanzas", n)
+    avance("Finanzas", n, fin=True)
 
+    # ── HOJA 3: GANTT ────────────────────────────────────────
+    if rango:
         ws_g = wb.create_sheet("Gantt")
 
-        G_BG        = "0D1B3E"
-        G_HEADER    = "1A2E5C"
-        G_WHITE     = "FFFFFF"
-        G_SIDEBAR   = "1E3A6E"
-        G_ODD       = "0F2347"
-        G_EVEN      = "112A54"
-        G_MONTH     = "243F72"
-
-        # BARRA_COLORS actualizado: El verde ahora es para Electrónicos
-        BARRA_COLORS = {
-            "Director de Proyecto":             "2C3E50", # Azul Oscuro (Ya no es verde)
-            "Director de Procesos Mecanicos":   "FF69B4", # Rosado
-            "Director de Procesos Electronicos":"8DB600", # <--- AQUÍ ESTÁ TU VERDE
-            "Diseñador de Sistemas de Control": "9B59B6", # Morado
-            "Director Financiero":              "D4AF37", # Rojo
-        }
-        ESTADO_BAR = {
-            "prematuro": "2196F3",
-            "tiempo":    "4CAF50",
-            "leve":      "FF9800",
-            "tarde":     "F44336",
-            "default":   "FFC107",
-        }
-
-        def g_estado(act):
-            if not act["completada"]: return "default"
-            lim  = date.fromisoformat(str(act["fecha_limite"]))
-            comp = date.fromisoformat(str(act["fecha_completado"]))
-            diff = (comp - lim).days
-            if diff < -7: return "prematuro"
-            if diff <= 0: return "tiempo"
-            if diff <= 7: return "leve"
-            return "tarde"
-
-        g_starts = [date.fromisoformat(str(a["fecha_inicio"])) for a in actividades]
-        g_ends   = [date.fromisoformat(str(a["fecha_limite"])) for a in actividades]
-        p_start  = min(g_starts).replace(day=1)
-        p_end    = max(g_ends)
-        if p_end.month == 12:
-            p_end = p_end.replace(year=p_end.year+1, month=1, day=1) - timedelta(days=1)
-        else:
-            p_end = p_end.replace(month=p_end.month+1, day=1) - timedelta(days=1)
-        total_days = (p_end - p_start).days + 1
+        p_start, p_end, total_days = periodo_gantt(*rango)
 
         COL_ACT  = 1
         COL_RESP = 2
@@ -717,111 +3053,82 @@ def exportar_excel():
 
         ws_g.sheet_view.showGridLines = False
 
-        # Título
-        ws_g.row_dimensions[R_TITLE].height = 36
-        t_end = COL_G + total_days - 1
-        ws_g.merge_cells(start_row=R_TITLE, start_column=COL_ACT,
-                         end_row=R_TITLE,   end_column=t_end)
-        tc = ws_g.cell(R_TITLE, COL_ACT,
-                       value="CRONOGRAMA DE PROYECTO — DIAGRAMA DE GANTT · UTB")
-        tc.font      = Font(name="Arial", bold=True, size=15, color=G_WHITE)
-        tc.fill      = PatternFill("solid", start_color=G_BG)
-        tc.alignment = Alignment(horizontal="center", vertical="center")
+        ws_g.column_dimensions[get_column_letter(COL_ACT)].width  = 40
+        ws_g.column_dimensions[get_column_letter(COL_RESP)].width  = 24
+        for d in range(total_days):
+            ws_g.column_dimensions[get_column_letter(COL_G + d)].width = DAY_W
 
+        ws_g.row_dimensions[R_TITLE].height = 36
         ws_g.row_dimensions[R_MONTH].height = 22
         ws_g.row_dimensions[R_DAYS].height  = 16
+        # Altura de las filas de actividades sin guardar una dimensión por fila
+        ws_g.sheet_format.defaultRowHeight = 20
+        ws_g.sheet_format.customHeight = True
+
+        # Título
+        t_end = COL_G + total_days - 1
+        _combinar(ws_g, R_TITLE, COL_ACT, R_TITLE, t_end)
+        ws_g.append([_celda(ws_g, "CRONOGRAMA DE PROYECTO — DIAGRAMA DE GANTT · UTB", "g_titulo")])
+
+        fila_meses = [None] * t_end
+        fila_dias  = [None] * t_end
 
         for label, col in [("Actividad", COL_ACT), ("Responsable", COL_RESP)]:
-            ws_g.merge_cells(start_row=R_MONTH, start_column=col,
-                             end_row=R_DAYS,    end_column=col)
-            ch = ws_g.cell(R_MONTH, col, value=label)
-            ch.fill      = PatternFill("solid", start_color=G_HEADER)
-            ch.font      = Font(name="Arial", bold=True, size=10, color=G_WHITE)
-            ch.alignment = Alignment(horizontal="center", vertical="center")
+            _combinar(ws_g, R_MONTH, col, R_DAYS, col)
+            fila_meses[col - 1] = _celda(ws_g, label, "g_header")
 
         # Meses y días
-        cur = p_start
-        col = COL_G
-        while cur <= p_end:
-            if cur.month == 12:
-                nxt = date(cur.year+1, 1, 1)
-            else:
-                nxt = date(cur.year, cur.month+1, 1)
-            m_end   = min(nxt - timedelta(days=1), p_end)
-            days_in = (m_end - cur).days + 1
-
-            ws_g.merge_cells(start_row=R_MONTH, start_column=col,
-                             end_row=R_MONTH,   end_column=col + days_in - 1)
-            mc = ws_g.cell(R_MONTH, col, value=cur.strftime("%B %Y").capitalize())
-            mc.fill      = PatternFill("solid", start_color=G_MONTH)
-            mc.font      = Font(name="Arial", bold=True, size=10, color=G_WHITE)
-            mc.alignment = Alignment(horizontal="center", vertical="center")
+        for cur, desplazamiento, days_in in meses_gantt(p_start, p_end):
+            col = COL_G + desplazamiento
+            _combinar(ws_g, R_MONTH, col, R_MONTH, col + days_in - 1)
+            fila_meses[col - 1] = _celda(ws_g, cur.strftime("%B %Y").capitalize(), "g_mes")
 
             for d in range(days_in):
-                dc_col  = col + d
                 dc_date = cur + timedelta(days=d)
-                dc = ws_g.cell(R_DAYS, dc_col, value=dc_date.day)
-                dc.fill = PatternFill("solid", start_color=G_MONTH)
-                dc.font = Font(name="Arial", size=7,
-                               color="AAAAAA" if dc_date.weekday() < 5 else "FF6666")
-                dc.alignment = Alignment(horizontal="center", vertical="center")
-                ws_g.column_dimensions[get_column_letter(dc_col)].width = DAY_W
-
-            col += days_in
-            cur  = nxt
-
-        ws_g.column_dimensions[get_column_letter(COL_ACT)].width  = 40
-        ws_g.column_dimensions[get_column_letter(COL_RESP)].width  = 24
-
-        bb = Border(bottom=Side(style="thin", color="243F72"))
-
-        for i, act in enumerate(actividades):
-            row    = R_DATA + i
-            bg_row = G_ODD if i % 2 == 0 else G_EVEN
-            ws_g.row_dimensions[row].height = 20
-
-            nc = ws_g.cell(row, COL_ACT, value=act["nombre"])
-            nc.fill      = PatternFill("solid", start_color=G_SIDEBAR)
-            nc.font      = Font(name="Arial", size=9, color=G_WHITE)
-            nc.alignment = Alignment(horizontal="left", vertical="center",
-                                     wrap_text=True, indent=1)
-            nc.border    = bb
-
-            rc = ws_g.cell(row, COL_RESP, value=act["responsable"])
-            rc.fill      = PatternFill("solid", start_color=G_SIDEBAR)
-            rc.font      = Font(name="Arial", size=8, color="AABBDD", italic=True)
-            rc.alignment = Alignment(horizontal="left", vertical="center", indent=1)
-            rc.border    = bb
-
-            for d in range(total_days):
-                gc = ws_g.cell(row, COL_G + d)
-                gc.fill   = PatternFill("solid", start_color=bg_row)
-                gc.border = Border(bottom=Side(style="thin", color="1A2E5C"))
-
-            a_start = date.fromisoformat(str(act["fecha_inicio"]))
-            a_end   = date.fromisoformat(str(act["fecha_limite"]))
-            c_ini   = COL_G + (a_start - p_start).days
-            c_fin   = COL_G + (a_end   - p_start).days
-
-            if act["completada"]:
-                bar_color = ESTADO_BAR[g_estado(act)]
+                fila_dias[col + d - 1] = _celda(
+                    ws_g, dc_date.day, "g_dia" if dc_date.weekday() < 5 else "g_dia_finde")
+
+        ws_g.append(fila_meses)
+        ws_g.append(fila_dias)
+
+        # Celdas vacías compartidas: en write-only cada celda se serializa en el
+        # momento del append, así que una misma instancia puede ocupar todas las
+        # posiciones de fondo o de barra de una fila.
+        fondo = (_celda(ws_g, None, "g_fila_impar"), _celda(ws_g, None, "g_fila_par"))
+        barras = {}
+
+        n_act = 0
+        for i, act in enumerate(actividades()):
+            n_act += 1
+            bg_cell = fondo[i % 2]
+
+            d_ini, d_fin, bar_color = barra_gantt(act, p_start, total_days)
+            bar_cell = barras.get(bar_color)
+            if bar_cell is None:
+                bar_cell = barras[bar_color] = _celda(ws_g, None, f"g_barra_{bar_color}")
+
+            fila = [
+                _celda(ws_g, act["nombre"], "g_nombre"),
+                _celda(ws_g, act["responsable"], "g_resp"),
+            ]
+            if d_ini <= d_fin:
+                fila += [bg_cell] * d_ini
+                fila += [bar_cell] * (d_fin - d_ini + 1)
+                fila += [bg_cell] * (total_days - d_fin - 1)
             else:
-                bar_color = BARRA_COLORS.get(act["responsable"], "95A5A6")
-
-            if c_ini <= c_fin:
-                ws_g.merge_cells(start_row=row, start_column=c_ini,
-                                 end_row=row,   end_column=c_fin)
-                bc = ws_g.cell(row, c_ini)
-                bc.fill      = PatternFill("solid", start_color=bar_color)
-                bc.font      = Font(name="Arial", size=7, bold=True, color=G_WHITE)
-                bc.alignment = Alignment(horizontal="center", vertical="center")
+                fila += [bg_cell] * total_days
+            ws_g.append(fila)
+            avance("Gantt", n_act)
+        avance("Gantt", n_act, fin=True)
 
         # Leyenda
-        ley_row = R_DATA + len(actividades) + 2
+        ws_g.append([])
+        ws_g.append([])
+        ley_row = R_DATA + n_act + 2
         ws_g.row_dimensions[ley_row].height = 18
-        lc = ws_g.cell(ley_row, COL_ACT, value="Actividades Completadas:")
-        lc.font = Font(name="Arial", bold=True, size=9, color=G_WHITE)
-        lc.fill = PatternFill("solid", start_color=G_BG)
+
+        fila_ley = [None] * (COL_G - 1)
+        fila_ley[COL_ACT - 1] = _celda(ws_g, "Actividades Completadas:", "g_ley_titulo")
 
         ley_items = [
             ("Prematuro",     ESTADO_BAR["prematuro"]),
@@ -831,23 +3138,19 @@ def exportar_excel():
         ]
         col_ley = COL_G
         for label, color in ley_items:
-            ws_g.merge_cells(start_row=ley_row, start_column=col_ley,
-                             end_row=ley_row,   end_column=col_ley + 9)
-            box = ws_g.cell(ley_row, col_ley, value=f"  {label}  ")
-            box.fill      = PatternFill("solid", start_color=color)
-            box.font      = Font(name="Arial", size=8, bold=True, color=G_WHITE)
-            box.alignment = Alignment(horizontal="center", vertical="center")
+            _combinar(ws_g, ley_row, col_ley, ley_row, col_ley + 9)
+            fila_ley += [_celda(ws_g, f"  {label}  ", f"g_ley_{color}")] + [None] * 10
             col_ley += 11
+        ws_g.append(fila_ley)
 
         # Leyenda fila 2: Colores por cargo
         ley_row2 = ley_row + 1
         ws_g.row_dimensions[ley_row2].height = 18
 
-        lc2 = ws_g.cell(ley_row2, COL_ACT, value="Actividades en ejecucion:")
-        lc2.font = Font(name="Arial", bold=True, size=9, color=G_WHITE)
-        lc2.fill = PatternFill("solid", start_color=G_BG)
-        lc2.alignment = Alignment(horizontal="left", vertical="center", indent=1)
-        ws_g.cell(ley_row2, COL_RESP).fill = PatternFill("solid", start_color=G_BG)
+        fila_ley2 = [
+            _celda(ws_g, "Actividades en ejecucion:", "g_ley_titulo"),
+            _celda(ws_g, None, "g_ley_fondo"),
+        ]
 
         ley_cargos = [
             ("Dir. Proyecto",    BARRA_COLORS["Director de Proyecto"]),
@@ -858,28 +3161,540 @@ def exportar_excel():
         ]
         col_ley2 = COL_G
         for label, color in ley_cargos:
-            ws_g.merge_cells(start_row=ley_row2, start_column=col_ley2,
-                             end_row=ley_row2,   end_column=col_ley2 + 9)
-            box = ws_g.cell(ley_row2, col_ley2, value=f"  {label}  ")
-            box.fill      = PatternFill("solid", start_color=color)
-            box.font      = Font(name="Arial", size=8, bold=True, color=G_WHITE)
-            box.alignment = Alignment(horizontal="center", vertical="center")
+            _combinar(ws_g, ley_row2, col_ley2, ley_row2, col_ley2 + 9)
+            fila_ley2 += [_celda(ws_g, f"  {label}  ", f"g_ley_{color}")] + [None] * 10
             col_ley2 += 11
+        ws_g.append(fila_ley2)
+
+    wb.save(destino)
+
+
+@app.route("/api/exportar/excel")
+def exportar_excel():
+    if not EXCEL_AVAILABLE:
+        return jsonify({"error": "openpyxl no instalado"}), 500
 
-    
+    conn = get_db()
+    etag = version_export(conn)
+
+    if request.if_none_match.contains(etag):
+        response = app.response_class(status=304)
+        response.set_etag(etag)
+        return response
+
+    download_name = f'cronograma_utb_{datetime.now().strftime("%Y%m%d")}.xlsx'
+    blob = cache_export.get(etag)
+    if blob is not None:
+        return send_file(io.BytesIO(blob), mimetype=XLSX_MIMETYPE, as_attachment=True,
+                         download_name=download_name, etag=etag)
+
+    fd, ruta = tempfile.mkstemp(prefix="cronograma_", suffix=".xlsx")
+    os.close(fd)
+    try:
+        generar_excel(conn, ruta)
+        if os.path.getsize(ruta) <= EXPORT_CACHE_BYTES:
+            with open(ruta, "rb") as f:
+                cache_export.set(etag, f.read())
+    except Exception:
+        os.remove(ruta)
+        raise
 
-    output = io.BytesIO()
-    wb.save(output)
-    output.seek(0)
+    return send_file(
+        ArchivoTemporal(ruta),
+        mimetype=XLSX_MIMETYPE,
+        as_attachment=True,
+        download_name=download_name,
+        etag=etag
+    )
 
+
+# ============================================================
+# EXPORTACIÓN EN SEGUNDO PLANO
+# ============================================================
+# Los trabajos corren en un pool de hilos acotado. El estado de cada trabajo
+# vive en EXPORT_JOBS_DIR/<id>/estado.json junto al .xlsx, así que cualquier
+# worker de gunicorn del mismo host puede responder el progreso y la descarga.
+EXPORT_JOBS_DIR     = os.environ.get("EXPORT_JOBS_DIR",
+                                     os.path.join(tempfile.gettempdir(), "cronograma_exports"))
+EXPORT_JOBS_WORKERS = int(os.environ.get("EXPORT_JOBS_WORKERS", 2))
+EXPORT_JOBS_MAX     = int(os.environ.get("EXPORT_JOBS_MAX", 8))       # en cola + en curso, por worker
+EXPORT_JOBS_TTL     = float(os.environ.get("EXPORT_JOBS_TTL", 3600))  # seg. antes de borrar el archivo
+JOB_ID_RE           = re.compile(r"^[0-9a-f]{32}$")
+
+_jobs_executor = None
+_jobs_pid = None
+_jobs_activos = 0
+_jobs_lock = threading.Lock()
+
+
+def _executor_jobs():
+    """Pool de hilos del proceso actual (se recrea después de un fork)."""
+    global _jobs_executor, _jobs_pid
+    if _jobs_pid != os.getpid():
+        _jobs_executor = ThreadPoolExecutor(max_workers=EXPORT_JOBS_WORKERS,
+                                            thread_name_prefix="export")
+        _jobs_pid = os.getpid()
+    return _jobs_executor
+
+
+def _dir_job(job_id):
+    return os.path.join(EXPORT_JOBS_DIR, job_id)
+
+
+def leer_job(job_id):
+    try:
+        with open(os.path.join(_dir_job(job_id), "estado.json"), encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def guardar_job(job_id, estado):
+    # Escritura atómica: quien lee nunca ve un JSON a medias
+    ruta = os.path.join(_dir_job(job_id), "estado.json")
+    tmp = ruta + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(estado, f)
+    os.replace(tmp, ruta)
+
+
+def limpiar_jobs():
+    """Borra los trabajos terminados cuyo archivo ya expiró y los que quedaron
+    abandonados (p. ej. un worker reiniciado a mitad de la exportación)."""
+    ahora = time.time()
+    try:
+        ids = os.listdir(EXPORT_JOBS_DIR)
+    except OSError:
+        return
+    for job_id in ids:
+        estado = leer_job(job_id)
+        if estado is None:
+            continue
+        terminado = estado["estado"] in ("listo", "error")
+        if (terminado and estado["expira"] < ahora) or \
+                estado["creado_en"] + 4 * EXPORT_JOBS_TTL < ahora:
+            shutil.rmtree(_dir_job(job_id), ignore_errors=True)
+
+
+def _ejecutar_job(job_id):
+    global _jobs_activos
+    estado = leer_job(job_id)
+    estado["estado"] = "en_curso"
+
+    def progreso(hoja, filas):
+        estado["hojas"][hoja] = filas
+        guardar_job(job_id, estado)
+
+    ruta = os.path.join(_dir_job(job_id), "cronograma.xlsx")
+    conn = None
+    try:
+        guardar_job(job_id, estado)
+        conn = db_pool.getconn()
+        etag = version_export(conn)
+        blob = cache_export.get(etag)
+        if blob is not None:
+            with open(ruta, "wb") as f:
+                f.write(blob)
+        else:
+            generar_excel(conn, ruta, progreso)
+            if os.path.getsize(ruta) <= EXPORT_CACHE_BYTES:
+                with open(ruta, "rb") as f:
+                    cache_export.set(etag, f.read())
+        estado.update(estado="listo", etag=etag, bytes=os.path.getsize(ruta))
+    except Exception as e:
+        estado.update(estado="error", error=str(e))
+    finally:
+        if conn is not None:
+            db_pool.putconn(conn)
+        estado["terminado_en"] = time.time()
+        estado["expira"] = estado["terminado_en"] + EXPORT_JOBS_TTL
+        guardar_job(job_id, estado)
+        with _jobs_lock:
+            _jobs_activos -= 1
+
+
+@app.route("/api/exportar/jobs", methods=["POST"])
+def crear_job_export():
+    global _jobs_activos
+    if not EXCEL_AVAILABLE:
+        return jsonify({"ok": False, "error": "openpyxl no instalado"}), 500
+
+    limpiar_jobs()
+    with _jobs_lock:
+        if _jobs_activos >= EXPORT_JOBS_MAX:
+            return jsonify({"ok": False, "error": "Demasiadas exportaciones en curso, intenta más tarde"}), 429
+        _jobs_activos += 1
+
+    job_id = uuid.uuid4().hex
+    os.makedirs(_dir_job(job_id), exist_ok=True)
+    guardar_job(job_id, {
+        "id": job_id,
+        "estado": "en_cola",
+        "hojas": {},
+        "creado_en": time.time(),
+        "expira": time.time() + EXPORT_JOBS_TTL,
+    })
+    _executor_jobs().submit(_ejecutar_job, job_id)
+    return jsonify({"ok": True, "id": job_id}), 202
+
+
+@app.route("/api/exportar/jobs/<job_id>")
+def estado_job_export(job_id):
+    estado = leer_job(job_id) if JOB_ID_RE.match(job_id) else None
+    if estado is None:
+        return jsonify({"error": "Exportación no encontrada"}), 404
+    if estado["estado"] == "listo":
+        estado["descarga"] = f"/api/exportar/jobs/{job_id}/archivo"
+    return jsonify(estado)
+
+
+@app.route("/api/exportar/jobs/<job_id>/archivo")
+def descargar_job_export(job_id):
+    estado = leer_job(job_id) if JOB_ID_RE.match(job_id) else None
+    if estado is None or estado["estado"] != "listo":
+        return jsonify({"error": "Exportación no disponible"}), 404
+    creado = datetime.fromtimestamp(estado["creado_en"])
     return send_file(
-        output,
-        mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+        os.path.join(_dir_job(job_id), "cronograma.xlsx"),
+        mimetype=XLSX_MIMETYPE,
         as_attachment=True,
-        download_name=f'cronograma_utb_{datetime.now().strftime("%Y%m%d")}.xlsx'
+        download_name=f'cronograma_utb_{creado.strftime("%Y%m%d")}.xlsx',
+        etag=estado["etag"],
     )
 
 
+# ============================================================
+# IMPORTAR DESDE EXCEL / CSV
+# ============================================================
+# Acepta las hojas "Actividades" y "Finanzas" con las mismas columnas que
+# genera /api/exportar/excel (o un CSV con esos encabezados). Las filas se
+# validan en Python por bloques, cada bloque válido se envía con COPY a una
+# tabla temporal y al final un INSERT ... SELECT la fusiona con la tabla real
+# omitiendo las filas que ya existen. La memoria no depende del tamaño del
+# archivo: el xlsx se lee en modo read-only y sólo se guarda un bloque.
+IMPORT_CHUNK       = int(os.environ.get("IMPORT_CHUNK", 5000))      # filas por COPY
+IMPORT_MAX_MB      = int(os.environ.get("IMPORT_MAX_MB", 50))
+IMPORT_MAX_ERRORES = 200                                              # errores detallados en la respuesta
+
+PRIORIDADES = ("alta", "media", "baja")
+
+# Encabezado normalizado → columna de la tabla temporal (None = se ignora)
+COLUMNAS_IMPORT = {
+    "actividades": {
+        "actividad": "nombre", "nombre": "nombre",
+        "responsablecargo": "responsable", "responsable": "responsable",
+        "fechainicio": "fecha_inicio", "fechalimite": "fecha_limite",
+        "fechacompletado": "fecha_completado", "observaciones": "observaciones",
+        "descripcion": "descripcion", "prioridad": "prioridad", "estado": None,
+    },
+    "finanzas": {
+        "fecha": "fecha_compra", "fechacompra": "fecha_compra",
+        "concepto": "concepto", "categoria": "categoria", "proveedor": "proveedor",
+        "cantidad": "cantidad", "vunitario": "valor_unitario", "valorunitario": "valor_unitario",
+        "vtotal": None, "valortotal": None, "metodopago": "metodo_pago",
+        "responsable": "responsable", "observaciones": "observaciones", "factura": "factura",
+    },
+}
+OBLIGATORIAS_IMPORT = {
+    "actividades": ("nombre", "responsable", "fecha_inicio", "fecha_limite"),
+    "finanzas": ("fecha_compra", "concepto", "valor_unitario"),
+}
+# Columnas de la tabla temporal, en el orden del COPY
+STAGING_IMPORT = {
+    "actividades": ("fila", "nombre", "descripcion", "responsable", "fecha_inicio",
+                    "fecha_limite", "prioridad", "fecha_completado", "observaciones"),
+    "finanzas": ("fila", "fecha_compra", "concepto", "categoria", "proveedor", "cantidad",
+                 "valor_unitario", "valor_total", "metodo_pago", "responsable",
+                 "observaciones", "factura"),
+}
+# Rol que puede importar cada tabla
+ROL_IMPORT = {"actividades": "coordinador", "finanzas": "director_financiero"}
+
+# La clave natural de cada tabla decide qué fila ya existe. Si el archivo
+# repite una clave, sólo se inserta la última de esas filas (la de mayor
+# `fila`); las anteriores cuentan como omitidas. Las dos comparaciones usan
+# índices: idx_*_clave en la tabla real (migración 0007) y el que cargar_hoja
+# crea en la temporal sobre CLAVE_IMPORT + fila.
+CLAVE_IMPORT = {
+    "actividades": ("nombre", "responsable", "fecha_inicio", "fecha_limite"),
+    "finanzas": ("fecha_compra", "concepto", "cantidad", "valor_unitario", "proveedor"),
+}
+MERGE_IMPORT = {
+    "actividades": """
+        INSERT INTO actividades
+            (nombre, descripcion, responsable, fecha_inicio, fecha_limite, prioridad,
+             completada, fecha_completado, observaciones, completada_por, creada_por)
+        SELECT i.nombre, i.descripcion, i.responsable, i.fecha_inicio, i.fecha_limite, i.prioridad,
+               i.fecha_completado IS NOT NULL, i.fecha_completado, i.observaciones,
+               CASE WHEN i.fecha_completado IS NOT NULL THEN %(usuario)s END, %(usuario)s
+        FROM imp_actividades i
+        WHERE NOT EXISTS (
+            SELECT 1 FROM actividades a
+            WHERE a.nombre = i.nombre AND a.responsable = i.responsable
+              AND a.fecha_inicio = i.fecha_inicio AND a.fecha_limite = i.fecha_limite
+        )
+        AND NOT EXISTS (
+            SELECT 1 FROM imp_actividades j
+            WHERE j.nombre = i.nombre AND j.responsable = i.responsable
+              AND j.fecha_inicio = i.fecha_inicio AND j.fecha_limite = i.fecha_limite
+              AND j.fila > i.fila
+        )
+        ORDER BY i.fila
+    """,
+    "finanzas": """
+        INSERT INTO finanzas
+            (fecha_compra, concepto, categoria, proveedor, cantidad, valor_unitario,
+             valor_total, metodo_pago, responsable, observaciones, factura, creado_por)
+        SELECT i.fecha_compra, i.concepto, i.categoria, i.proveedor, i.cantidad, i.valor_unitario,
+               i.valor_total, i.metodo_pago, i.responsable, i.observaciones, i.factura, %(usuario)s
+        FROM imp_finanzas i
+        WHERE NOT EXISTS (
+            SELECT 1 FROM finanzas f
+            WHERE f.fecha_compra = i.fecha_compra AND f.concepto = i.concepto
+              AND f.proveedor IS NOT DISTINCT FROM i.proveedor
+              AND f.cantidad = i.cantidad AND f.valor_unitario = i.valor_unitario
+        )
+        AND NOT EXISTS (
+            SELECT 1 FROM imp_finanzas j
+            WHERE j.fecha_compra = i.fecha_compra AND j.concepto = i.concepto
+              AND j.proveedor IS NOT DISTINCT FROM i.proveedor
+              AND j.cantidad = i.cantidad AND j.valor_unitario = i.valor_unitario
+              AND j.fila > i.fila
+        )
+        ORDER BY i.fila
+    """,
+}
+
+
+def normalizar_encabezado(texto):
+    sin_tildes = unicodedata.normalize("NFKD", str(texto or "")).encode("ascii", "ignore").decode()
+    return re.sub(r"[^a-z0-9]", "", sin_tildes.lower())
+
+
+def leer_fecha(valor):
+    """date desde una celda: fecha de Excel, 'YYYY-MM-DD' o 'DD/MM/YYYY'."""
+    if isinstance(valor, datetime):
+        return valor.date()
+    if isinstance(valor, date):
+        return valor
+    texto = str(valor).strip()
+    try:
+        return date.fromisoformat(texto[:10])
+    except ValueError:
+        pass
+    for formato in ("%Y-%m-%d", "%d/%m/%Y", "%d-%m-%Y"):
+        try:
+            return datetime.strptime(texto, formato).date()
+        except ValueError:
+            pass
+    raise ValueError(f"Fecha no válida: {texto}")
+
+
+def leer_numero(valor):
+    """float desde una celda; acepta coma decimal ("1,5") en textos."""
+    if isinstance(valor, str):
+        valor = valor.strip().lstrip("$").strip()
+        if "," in valor and "." not in valor:
+            valor = valor.replace(",", ".")
+    return float(valor)
+
+
+def _texto(valor, campo, largo=None):
+    texto = "" if valor is None else str(valor).strip()
+    if largo and len(texto) > largo:
+        raise ValueError(f"{campo} supera {largo} caracteres")
+    return texto
+
+
+def validar_fila_import(tabla, d):
+    """Tupla lista para COPY (sin el número de fila) o ValueError."""
+    for campo in OBLIGATORIAS_IMPORT[tabla]:
+        if d.get(campo) in (None, ""):
+            raise ValueError(f"Falta {campo}")
+
+    if tabla == "actividades":
+        inicio = leer_fecha(d["fecha_inicio"])
+        limite = leer_fecha(d["fecha_limite"])
+        if limite < inicio:
+            raise ValueError("La fecha límite es anterior a la de inicio")
+        responsable = _texto(d["responsable"], "responsable")
+        if responsable not in CARGOS_VALIDOS:
+            raise ValueError(f"Responsable no válido: {responsable}")
+        prioridad = _texto(d.get("prioridad"), "prioridad").lower() or "media"
+        if prioridad not in PRIORIDADES:
+            raise ValueError(f"Prioridad no válida: {prioridad}")
+        completado = leer_fecha(d["fecha_completado"]) if d.get("fecha_completado") not in (None, "") else None
+        return (_texto(d["nombre"], "nombre", 300), _texto(d.get("descripcion"), "descripcion"),
+                responsable, inicio, limite, prioridad, completado,
+                _texto(d.get("observaciones"), "observaciones"))
+
+    try:
+        cantidad = leer_numero(d.get("cantidad") or 1)
+        valor_unitario = round(leer_numero(d["valor_unitario"]), 2)
+    except (TypeError, ValueError):
+        raise ValueError("Cantidad o valor unitario no numéricos")
+    if cantidad <= 0 or cantidad != int(cantidad) or valor_unitario <= 0:
+        raise ValueError("Cantidad (entera) y valor unitario deben ser positivos")
+    cantidad = int(cantidad)
+    return (leer_fecha(d["fecha_compra"]), _texto(d["concepto"], "concepto", 300),
+            _texto(d.get("categoria"), "categoria", 100), _texto(d.get("proveedor"), "proveedor", 200),
+            cantidad, valor_unitario, round(valor_unitario * cantidad, 2),
+            _texto(d.get("metodo_pago"), "metodo_pago", 50), _texto(d.get("responsable"), "responsable", 100),
+            _texto(d.get("observaciones"), "observaciones"), _texto(d.get("factura"), "factura", 100))
+
+
+def filas_csv(archivo):
+    """Filas de un CSV (UTF-8, separado por ',' o ';') como listas de valores."""
+    texto = io.TextIOWrapper(archivo, encoding="utf-8-sig", newline="")
+    primera = texto.readline()
+    separador = ";" if primera.count(";") > primera.count(",") else ","
+    yield next(csv.reader([primera], delimiter=separador), [])
+    yield from csv.reader(texto, delimiter=separador)
+
+
+def cargar_hoja(c, tabla, filas):
+    """Valida y copia una hoja a su tabla temporal. Devuelve el informe."""
+    informe = {"filas": 0, "validas": 0, "errores": [], "total_errores": 0}
+    filas = iter(filas)
+    encabezados = next(filas, None) or []
+    mapa = COLUMNAS_IMPORT[tabla]
+    columnas = [mapa.get(normalizar_encabezado(h)) for h in encabezados]
+    faltan = [col for col in OBLIGATORIAS_IMPORT[tabla] if col not in columnas]
+    if faltan:
+        informe["error"] = f"Faltan columnas: {', '.join(faltan)}"
+        return informe
+
+    staging = STAGING_IMPORT[tabla]
+    if ES_SQLITE:
+        # Sin ON COMMIT DROP ni COPY: la tabla temporal vive con la conexión
+        # del hilo (se rehace en cada importación) y se llena con executemany
+        c.execute(f"DROP TABLE IF EXISTS temp.imp_{tabla}")
+        c.execute(f"""
+            CREATE TEMP TABLE imp_{tabla} AS
+            SELECT 0 AS fila, {', '.join(staging[1:])} FROM {tabla} WHERE 0
+        """)
+        insert_sql = (f"INSERT INTO imp_{tabla} ({', '.join(staging)}) "
+                      f"VALUES ({', '.join(['%s'] * len(staging))})")
+        pendientes = []
+        agregar = pendientes.append
+
+        def volcar():
+            c.executemany(insert_sql, pendientes)
+            pendientes.clear()
+    else:
+        c.execute(f"""
+            CREATE TEMP TABLE imp_{tabla} ON COMMIT DROP AS
+            SELECT 0 AS fila, {', '.join(staging[1:])} FROM {tabla} WITH NO DATA
+        """)
+        # NULL '\N' para distinguir NULL (fecha_completado vacía) de texto vacío
+        copy_sql = f"COPY imp_{tabla} ({', '.join(staging)}) FROM STDIN WITH (FORMAT csv, NULL '\\N')"
+        bloque = io.StringIO()
+        escritor = csv.writer(bloque)
+
+        def agregar(fila):
+            escritor.writerow(["\\N" if v is None else v for v in fila])
+
+        def volcar():
+            bloque.seek(0)
+            c.copy_expert(copy_sql, bloque)
+            bloque.seek(0)
+            bloque.truncate()
+
+    en_bloque = 0
+    for numero, valores in enumerate(filas, 2):
+        if not any(v not in (None, "") for v in valores):
+            continue
+        informe["filas"] += 1
+        datos = {col: v for col, v in zip(columnas, valores) if col}
+        try:
+            fila = validar_fila_import(tabla, datos)
+        except ValueError as e:
+            informe["total_errores"] += 1
+            if len(informe["errores"]) < IMPORT_MAX_ERRORES:
+                informe["errores"].append({"fila": numero, "error": str(e)})
+            continue
+        agregar((numero,) + fila)
+        informe["validas"] += 1
+        en_bloque += 1
+        if en_bloque >= IMPORT_CHUNK:
+            volcar()
+            en_bloque = 0
+    if en_bloque:
+        volcar()
+    # El índice se crea ya cargada la tabla (más barato que mantenerlo fila a
+    # fila) y ANALYZE le da estadísticas al planificador para el merge
+    c.execute(f"CREATE INDEX imp_{tabla}_clave ON imp_{tabla} ({', '.join(CLAVE_IMPORT[tabla])}, fila)")
+    c.execute(f"ANALYZE imp_{tabla}")
+    return informe
+
+
+@app.route("/api/importar", methods=["POST"])
+def importar():
+    """Importa actividades y/o gastos desde un .xlsx o .csv (campo "archivo").
+
+    Un .xlsx puede traer las hojas "Actividades" y "Finanzas" (se importan
+    las que el rol del usuario permite, o sólo la de ?tabla=); un .csv
+    necesita ?tabla=actividades|finanzas. Si alguna fila tiene errores no se
+    importa nada, salvo con ?parcial=1 (se importan las válidas). Las filas
+    iguales a registros existentes se omiten, así reimportar un export no
+    duplica datos; si el archivo repite una fila, gana la última.
+    Respuesta: {"ok", "hojas": {tabla: {filas, validas, insertadas, omitidas,
+    errores: [{fila, error}], total_errores}}}.
+    """
+    if request.content_length and request.content_length > IMPORT_MAX_MB * 1024 * 1024:
+        return jsonify({"ok": False, "error": f"Archivo mayor a {IMPORT_MAX_MB} MB"}), 413
+    archivo = request.files.get("archivo")
+    if archivo is None or not archivo.filename:
+        return jsonify({"ok": False, "error": "Falta el archivo"}), 400
+
+    tabla = request.args.get("tabla")
+    if tabla is not None and tabla not in COLUMNAS_IMPORT:
+        return jsonify({"ok": False, "error": f"Tabla no válida: {tabla}"}), 400
+    permitidas = [t for t in COLUMNAS_IMPORT
+                  if (tabla is None or t == tabla) and g.usuario and g.usuario["rol"] == ROL_IMPORT[t]]
+    if not permitidas:
+        return jsonify({"ok": False, "error": "No tiene permiso para importar"}), 403
+
+    nombre = archivo.filename.lower()
+    if nombre.endswith(".csv"):
+        if tabla is None:
+            return jsonify({"ok": False, "error": "Indica ?tabla=actividades o ?tabla=finanzas"}), 400
+        hojas = {tabla: filas_csv(archivo.stream)}
+    elif nombre.endswith(".xlsx"):
+        if not EXCEL_AVAILABLE:
+            return jsonify({"ok": False, "error": "openpyxl no instalado"}), 500
+        cargar_openpyxl()
+        try:
+            wb = openpyxl.load_workbook(archivo.stream, read_only=True, data_only=True)
+        except Exception:
+            return jsonify({"ok": False, "error": "El archivo no es un .xlsx válido"}), 400
+        hojas = {t: wb[t.capitalize()].iter_rows(values_only=True)
+                 for t in permitidas if t.capitalize() in wb.sheetnames}
+        if not hojas:
+            return jsonify({"ok": False, "error": "El libro no tiene hojas que pueda importar"}), 400
+    else:
+        return jsonify({"ok": False, "error": "Formato no soportado (use .xlsx o .csv)"}), 400
+
+    parcial = request.args.get("parcial") == "1"
+    conn = get_db()
+    c = conn.cursor()
+    informes = {tabla: cargar_hoja(c, tabla, filas) for tabla, filas in hojas.items()}
+    if any("error" in inf or (inf["total_errores"] and not parcial) for inf in informes.values()):
+        conn.rollback()
+        return jsonify({"ok": False, "hojas": informes})
+
+    for tabla, inf in informes.items():
+        c.execute(MERGE_IMPORT[tabla], {"usuario": g.usuario["user"]})
+        inf["insertadas"] = c.rowcount
+        inf["omitidas"] = inf["validas"] - c.rowcount
+        if c.rowcount:
+            emitir_evento(c, tabla, "importar")
+    conn.commit()
+    if "actividades" in informes:
+        actividades_cambiaron()
+    return jsonify({"ok": True, "hojas": informes})
+
+
 # ============================================================
 # ADMIN — BORRAR USUARIOS
 # ============================================================
@@ -889,7 +3704,6 @@ def delete_users_page():
     c = conn.cursor(cursor_factory=RealDictCursor)
     c.execute("SELECT id, username, nombre, cargo, creado_en FROM usuarios ORDER BY creado_en ASC")
     usuarios = c.fetchall()
-    conn.close()
 
     rows_html = ""
     for u in usuarios:
@@ -966,8 +3780,9 @@ def delete_user(user_id):
     conn = get_db()
     c = conn.cursor()
     c.execute("DELETE FROM usuarios WHERE id = %s", (user_id,))
+    emitir_evento(c, "usuarios", "eliminar", user_id)
     conn.commit()
-    conn.close()
+    usuarios_cambiaron()
     return f"""<!DOCTYPE html>
 <html lang="es">
 <head>
@@ -993,5 +3808,6 @@ def delete_user(user_id):
 # INICIO
 # ============================================================
 if __name__ == "__main__":
+    preparar_bd()
     port = int(os.environ.get("PORT", 5000))
     app.run(host="0.0.0.0", port=port, debug=False)
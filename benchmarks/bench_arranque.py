@@ -0,0 +1,130 @@
+"""
+CRONOGRAMA UTB — benchmark de arranque en frío
+
+Mide, cada vez en un intérprete nuevo:
+  import_ms       → `import app`
+  primera_ms      → desde el lanzamiento del proceso hasta la respuesta a
+                    GET / (test client de Flask, sin red)
+  openpyxl_ms     → cargar_openpyxl(): lo que paga la primera exportación
+                    o importación de un libro, ya fuera del arranque
+Con --gunicorn mide además el tiempo hasta la primera respuesta HTTP de un
+`gunicorn app:app` real (lee gunicorn.conf.py: app precargada en el maestro).
+
+No necesita base de datos: importar app.py no abre conexiones.
+
+Uso:
+    python benchmarks/bench_arranque.py                 # 10 repeticiones
+    python benchmarks/bench_arranque.py --repeticiones 30
+    python benchmarks/bench_arranque.py --gunicorn
+    python benchmarks/bench_arranque.py --detalle       # imports más pesados
+"""
+
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import time
+import urllib.request
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+REPETICIONES = 10
+GUNICORN_TIMEOUT = 30
+
+MEDIR = """
+import time
+t0 = time.perf_counter()
+import app
+t1 = time.perf_counter()
+r = app.app.test_client().get("/")
+assert r.status_code == 200, r.status_code
+t2 = time.perf_counter()
+app.cargar_openpyxl()
+t3 = time.perf_counter()
+print((t1 - t0) * 1000, (t3 - t2) * 1000)
+"""
+
+
+def entorno():
+    env = dict(os.environ)
+    # El arranque no debe depender de que haya una base disponible
+    env.pop("DATABASE_URL", None)
+    return env
+
+
+def medir_proceso():
+    t0 = time.perf_counter()
+    salida = subprocess.run([sys.executable, "-c", MEDIR], cwd=RAIZ, env=entorno(),
+                            capture_output=True, text=True, check=True).stdout
+    total = (time.perf_counter() - t0) * 1000
+    import_ms, openpyxl_ms = map(float, salida.split()[-2:])
+    # El proceso sigue vivo después de responder mientras carga openpyxl
+    return import_ms, total - openpyxl_ms, openpyxl_ms
+
+
+def puerto_libre():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def medir_gunicorn():
+    puerto = puerto_libre()
+    url = f"http://127.0.0.1:{puerto}/"
+    t0 = time.perf_counter()
+    proc = subprocess.Popen([sys.executable, "-m", "gunicorn", "app:app", "-b", f"127.0.0.1:{puerto}"],
+                            cwd=RAIZ, env=entorno(),
+                            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        while time.perf_counter() - t0 < GUNICORN_TIMEOUT:
+            try:
+                with urllib.request.urlopen(url, timeout=1) as r:
+                    if r.status == 200:
+                        return (time.perf_counter() - t0) * 1000
+            except OSError:
+                time.sleep(0.01)
+        raise RuntimeError("gunicorn no respondió")
+    finally:
+        proc.terminate()
+        proc.wait()
+
+
+def detalle():
+    err = subprocess.run([sys.executable, "-X", "importtime", "-c", "import app"], cwd=RAIZ,
+                         env=entorno(), capture_output=True, text=True, check=True).stderr
+    filas = []
+    for linea in err.splitlines():
+        partes = linea.split("|")
+        # Sólo los imports hechos directamente por app.py (nivel 1)
+        if len(partes) == 3 and partes[2].startswith("   ") and not partes[2].startswith("    "):
+            filas.append((int(partes[1]), partes[2].strip()))
+    print(f"\n{'módulo':<28} {'ms':>8}")
+    for us, modulo in sorted(filas, reverse=True)[:10]:
+        print(f"{modulo:<28} {us / 1000:>8.1f}")
+
+
+def main(argv):
+    repeticiones = REPETICIONES
+    if "--repeticiones" in argv:
+        i = argv.index("--repeticiones")
+        repeticiones = int(argv[i + 1])
+        del argv[i:i + 2]
+
+    medidas = [medir_proceso() for _ in range(repeticiones)]
+    print(f"{'':>12} {'mediana':>9} {'p90':>9}")
+    for nombre, valores in zip(("import_ms", "primera_ms", "openpyxl_ms"), zip(*medidas)):
+        valores = sorted(valores)
+        p90 = valores[min(len(valores) - 1, int(len(valores) * 0.9))]
+        print(f"{nombre:>12} {statistics.median(valores):>9.1f} {p90:>9.1f}")
+
+    if "--gunicorn" in argv:
+        tiempos = [medir_gunicorn() for _ in range(max(1, repeticiones // 3))]
+        print(f"{'gunicorn_ms':>12} {statistics.median(tiempos):>9.1f} {max(tiempos):>9.1f}")
+
+    if "--detalle" in argv:
+        detalle()
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
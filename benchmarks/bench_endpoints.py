@@ -0,0 +1,457 @@
+"""
+CRONOGRAMA UTB — benchmark de las rutas de la API
+
+Siembra actividades y finanzas en varios tamaños, recorre las rutas con el
+test client de Flask (sin red ni gunicorn) y reporta por escenario la
+latencia p50/p95/p99, el throughput secuencial, las consultas SQL por
+petición y el pico de memoria Python (tracemalloc, medido en la pasada de
+calentamiento, que no cuenta para la latencia). Las consultas se cuentan con
+la métrica cronograma_db_consultas_por_peticion de la propia app, es decir,
+con los mismos cursores medidos que en producción.
+
+Las tablas se VACÍAN antes de sembrar, así que nunca usa DATABASE_URL:
+    BENCH_DATABASE_URL=postgresql://...  → una base descartable ya creada
+    --embebido                           → levanta un cluster temporal con
+                                           initdb/pg_ctl (PATH o PG_BIN) y
+                                           lo borra al terminar
+    --sqlite                             → base SQLite en un directorio
+                                           temporal (no necesita PostgreSQL)
+En todos los casos el esquema se crea/actualiza con las migraciones.
+
+Uso:
+    python benchmarks/bench_endpoints.py --sqlite 1000 10000
+    python benchmarks/bench_endpoints.py --embebido                 # 1000 10000 100000
+    python benchmarks/bench_endpoints.py --embebido 500 5000
+    python benchmarks/bench_endpoints.py --embebido --repeticiones 50 --solo finanzas
+    python benchmarks/bench_endpoints.py --embebido --json base.json
+    python benchmarks/bench_endpoints.py --embebido --comparar base.json --umbral 25
+
+Con --comparar se informa la variación de p50 contra un resultado anterior
+(--json) y el proceso termina con código 1 si algún escenario empeoró más
+del umbral (%), para usarlo antes de desplegar. base_sqlite.json y
+base_sqlite.txt son la línea base con --sqlite 1000 10000.
+"""
+
+import csv
+import io
+import json
+import os
+import resource
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, RAIZ)
+
+from bench_json import SEMBRAR_ACTIVIDADES, SEMBRAR_FINANZAS  # noqa: E402
+
+TAMANOS = [1000, 10000, 100000]
+REPETICIONES = 20
+# La exportación completa y la importación grande son mucho más lentas que
+# el resto: menos repeticiones
+REPETICIONES_EXPORT = 3
+LENTOS = ("exportar_excel", "exportar_job", "importar_csv_100k")
+UMBRAL = 20.0
+IMPORT_FILAS = 1000
+IMPORT_GRANDE = 100_000
+JOB_TIMEOUT = 300
+
+USUARIOS = [
+    ("bench", "Bench Coordinador", "Director de Proyecto"),
+    ("benchfin", "Bench Finanzas", "Director Financiero"),
+]
+CLAVE = "bench"
+
+
+# Siembra equivalente a la de bench_json para SQLite (sin generate_series
+# ni arreglos): mismas fechas, cargos y estados en función de i.
+SEMBRAR_ACTIVIDADES_SQLITE = """
+    WITH RECURSIVE s(i) AS (SELECT 1 UNION ALL SELECT i + 1 FROM s WHERE i < %(n)s)
+    INSERT INTO actividades
+        (nombre, descripcion, responsable, fecha_inicio, fecha_limite, prioridad,
+         completada, fecha_completado, observaciones, creada_por)
+    SELECT 'Actividad ' || i, 'Descripción de la actividad ' || i,
+           json_extract(%(cargos)s, '$[' || (i %% 5) || ']'),
+           date('2025-01-01', '+' || (i %% 150) || ' days'),
+           date('2025-01-01', '+' || (i %% 150 + 1 + i %% 29) || ' days'),
+           json_extract('["alta", "media", "baja"]', '$[' || (i %% 3) || ']'),
+           i %% 2 = 0,
+           CASE WHEN i %% 2 = 0 THEN date('2025-01-01', '+' || (i %% 150 + i %% 37) || ' days') END,
+           CASE WHEN i %% 2 = 0 THEN 'Observación de cierre' END, 'bench'
+    FROM s
+"""
+
+SEMBRAR_FINANZAS_SQLITE = """
+    WITH RECURSIVE s(i) AS (SELECT 1 UNION ALL SELECT i + 1 FROM s WHERE i < %(n)s)
+    INSERT INTO finanzas
+        (fecha_compra, concepto, categoria, proveedor, cantidad, valor_unitario,
+         valor_total, metodo_pago, responsable, creado_por)
+    SELECT date('2025-01-01', '+' || (i %% 180) || ' days'), 'Compra ' || i,
+           json_extract('["Materiales", "Electrónica", "Servicios"]', '$[' || (i %% 3) || ']'),
+           'Proveedor ' || (i %% 50), 1 + i %% 9, 1000 + (i %% 5000) * 97.31,
+           (1 + i %% 9) * (1000 + (i %% 5000) * 97.31), 'Transferencia', 'bench', 'bench'
+    FROM s
+"""
+
+VACIAR_SQLITE = (
+    "DELETE FROM actividades", "DELETE FROM finanzas", "DELETE FROM eliminados",
+    "DELETE FROM finanzas_resumen", "DELETE FROM usuarios",
+    "DELETE FROM sqlite_sequence WHERE name IN ('actividades', 'finanzas', 'usuarios')",
+)
+
+
+# ---------- base embebida ----------
+def binario_pg(nombre):
+    if os.environ.get("PG_BIN"):
+        return os.path.join(os.environ["PG_BIN"], nombre)
+    ruta = shutil.which(nombre)
+    if ruta is None:
+        sys.exit(f"No se encontró {nombre}: instala PostgreSQL o define PG_BIN")
+    return ruta
+
+
+def levantar_embebido():
+    """Cluster temporal escuchando sólo en un socket unix del directorio."""
+    directorio = tempfile.mkdtemp(prefix="cronograma_bench_")
+    datos = os.path.join(directorio, "datos")
+    subprocess.run([binario_pg("initdb"), "-D", datos, "-A", "trust", "-U", "postgres",
+                    "--no-sync", "-E", "UTF8"], check=True, stdout=subprocess.DEVNULL)
+    subprocess.run([binario_pg("pg_ctl"), "-D", datos, "-w", "-l", os.path.join(directorio, "log"),
+                    "-o", f"-k {directorio} -c listen_addresses='' -F", "start"],
+                   check=True, stdout=subprocess.DEVNULL)
+
+    def detener():
+        subprocess.run([binario_pg("pg_ctl"), "-D", datos, "-m", "immediate", "stop"],
+                       stdout=subprocess.DEVNULL)
+        shutil.rmtree(directorio, ignore_errors=True)
+    return f"postgresql://postgres@/postgres?host={directorio}", detener
+
+
+def crear_sqlite():
+    directorio = tempfile.mkdtemp(prefix="cronograma_bench_")
+    return f"sqlite:///{os.path.join(directorio, 'bench.db')}", \
+        lambda: shutil.rmtree(directorio, ignore_errors=True)
+
+
+# ---------- siembra ----------
+def sembrar(app_mod, n):
+    from werkzeug.security import generate_password_hash
+
+    conn = app_mod.db_pool.getconn()
+    try:
+        c = conn.cursor()
+        if app_mod.ES_SQLITE:
+            for sql in VACIAR_SQLITE:
+                c.execute(sql)
+        else:
+            c.execute("""
+                TRUNCATE actividades, finanzas, finanzas_resumen, eliminados, usuarios
+                RESTART IDENTITY
+            """)
+        for user, nombre, cargo in USUARIOS:
+            c.execute("INSERT INTO usuarios (username, nombre, cargo, rol, password) VALUES (%s, %s, %s, %s, %s)",
+                      (user, nombre, cargo, app_mod.cargo_a_rol(cargo), generate_password_hash(CLAVE)))
+        if app_mod.ES_SQLITE:
+            c.execute(SEMBRAR_ACTIVIDADES_SQLITE, {"n": n, "cargos": json.dumps(app_mod.CARGOS_VALIDOS)})
+            c.execute(SEMBRAR_FINANZAS_SQLITE, {"n": n})
+        else:
+            c.execute(SEMBRAR_ACTIVIDADES, {"n": n, "cargos": app_mod.CARGOS_VALIDOS})
+            c.execute(SEMBRAR_FINANZAS, {"n": n})
+        conn.commit()
+        if app_mod.ES_SQLITE:
+            c.execute("ANALYZE")
+    finally:
+        app_mod.db_pool.putconn(conn)
+    if not app_mod.ES_SQLITE:
+        # VACUUM no puede ir dentro de una transacción
+        conn = app_mod.db_pool.getconn()
+        try:
+            conn.autocommit = True
+            conn.cursor().execute("VACUUM ANALYZE actividades, finanzas")
+        finally:
+            conn.autocommit = False
+            app_mod.db_pool.putconn(conn)
+    app_mod.cache_stats.clear()
+    app_mod.cache_roles.clear()
+    app_mod.cache_export.clear()
+    app_mod.cache_gantt.clear()
+
+
+def csv_import(n, prefijo="Importada"):
+    salida = io.StringIO()
+    w = csv.writer(salida)
+    w.writerow(["Actividad", "Responsable (Cargo)", "Fecha Inicio", "Fecha Límite",
+                "Fecha Completado", "Estado", "Observaciones"])
+    for i in range(n):
+        w.writerow([f"{prefijo} {i}", "Director de Proyecto", "2025-02-01", f"2025-03-{1 + i % 28:02d}",
+                    "", "", ""])
+    return salida.getvalue().encode()
+
+
+# ---------- escenarios ----------
+# (nombre, función(cliente, ctx, i) → respuesta). Las escrituras dependen de
+# las filas creadas por el escenario anterior: --solo debe incluir el de crear.
+def escenarios():
+    hoy = "2025-03-15"
+
+    def h(ctx, rol="bench"):
+        return {"Authorization": f"Bearer {ctx['tokens'][rol]}"}
+
+    def act_creada(ctx, i):
+        return ctx["act_creadas"][i]
+
+    def fin_creada(ctx, i):
+        return ctx["fin_creadas"][i]
+
+    def crear_act(cli, ctx, i):
+        r = cli.post("/api/actividades", headers=h(ctx), json={
+            "nombre": f"Bench {i}", "responsable": "Director de Proyecto",
+            "fecha_inicio": "2025-03-01", "fecha_limite": "2025-03-20"})
+        ctx["act_creadas"].append(r.get_json()["actividad"]["id"])
+        return r
+
+    def crear_fin(cli, ctx, i):
+        r = cli.post("/api/finanzas", headers=h(ctx, "benchfin"), json={
+            "fecha_compra": hoy, "concepto": f"Bench {i}", "categoria": "Materiales",
+            "proveedor": "Bench", "cantidad": 2, "valor_unitario": 1500})
+        ctx["fin_creadas"].append(r.get_json()["finanza"]["id"])
+        return r
+
+    def lote(cli, ctx, i):
+        ops = [{"tabla": "actividades", "op": "crear", "datos": {
+                    "nombre": f"Lote {i}-{k}", "responsable": "Director de Proyecto",
+                    "fecha_inicio": "2025-03-01", "fecha_limite": "2025-03-20"}} for k in range(50)]
+        return cli.post("/api/batch", headers=h(ctx), json={"operaciones": ops})
+
+    def export_job(cli, ctx, i):
+        # Como export_frio: sin vaciar la caché el trabajo sólo copiaría el blob
+        ctx["app"].cache_export.clear()
+        r = cli.post("/api/exportar/jobs", headers=h(ctx))
+        job = r.get_json()["id"]
+        limite = time.monotonic() + JOB_TIMEOUT
+        while time.monotonic() < limite:
+            estado = cli.get(f"/api/exportar/jobs/{job}").get_json()
+            if estado["estado"] in ("listo", "error"):
+                break
+            time.sleep(0.02)
+        return cli.get(f"/api/exportar/jobs/{job}/archivo")
+
+    def export_frio(cli, ctx, i):
+        ctx["app"].cache_export.clear()
+        return cli.get("/api/exportar/excel", headers=h(ctx))
+
+    def gantt_frio(cli, ctx, i):
+        ctx["app"].cache_gantt.clear()
+        return cli.get("/api/gantt", headers=h(ctx))
+
+    def etag(cli, ctx, ruta):
+        if ruta not in ctx["etags"]:
+            ctx["etags"][ruta] = cli.get(ruta, headers=h(ctx)).headers.get("ETag")
+        return {**h(ctx), "If-None-Match": ctx["etags"][ruta]}
+
+    def delta(cli, ctx, i):
+        if "token_delta" not in ctx:
+            ctx["token_delta"] = cli.get("/api/actividades?since=0", headers=h(ctx)).get_json()["token"]
+        return cli.get(f"/api/actividades?since={ctx['token_delta']}", headers=h(ctx))
+
+    get = lambda ruta, rol="bench": lambda cli, ctx, i: cli.get(ruta, headers=h(ctx, rol))  # noqa: E731
+
+    return [
+        ("index", get("/")),
+        ("usuarios_count", get("/api/usuarios/count")),
+        ("usuarios_listar", get("/api/usuarios/listar")),
+        ("login", lambda cli, ctx, i: cli.post("/api/usuarios/login", json={"user": "bench", "pass": CLAVE})),
+        ("actividades_lista", get("/api/actividades")),
+        ("actividades_304", lambda cli, ctx, i: cli.get("/api/actividades", headers=etag(cli, ctx, "/api/actividades"))),
+        ("actividades_pagina", get("/api/actividades?limit=50")),
+        ("actividades_estado", get("/api/actividades?estado=tarde&limit=50")),
+        ("actividades_campos", get("/api/actividades?fields=nombre,responsable&limit=50")),
+        ("actividades_delta", delta),
+        ("actividades_stats", get("/api/actividades/stats?agrupar=responsable")),
+        ("actividad_una", lambda cli, ctx, i: cli.get(f"/api/actividades/{1 + i}", headers=h(ctx))),
+        ("finanzas_lista", get("/api/finanzas", "benchfin")),
+        ("finanzas_pagina", get("/api/finanzas?limit=50", "benchfin")),
+        ("finanza_una", lambda cli, ctx, i: cli.get(f"/api/finanzas/{1 + i}", headers=h(ctx, "benchfin"))),
+        ("finanzas_total", get("/api/finanzas/total", "benchfin")),
+        ("finanzas_resumen", get("/api/finanzas/resumen", "benchfin")),
+        # Búsqueda: un término que aparece en todas las filas y uno selectivo
+        ("buscar_amplio", get("/api/buscar?q=actividad")),
+        ("buscar_selectivo", get("/api/buscar?q=compra%20417&tipo=finanzas")),
+        # Gantt: cálculo completo, desde la caché por versión y con ventana
+        ("gantt", gantt_frio),
+        ("gantt_cache", get("/api/gantt")),
+        ("gantt_ventana", get("/api/gantt?desde=2025-03-01&hasta=2025-03-31&responsable=Director%20de%20Proyecto")),
+        ("db_pool", get("/api/db/pool")),
+        ("exportar_excel", export_frio),
+        ("exportar_excel_cache", get("/api/exportar/excel")),
+        ("exportar_job", export_job),
+        # Escrituras: cada una trabaja sobre las filas creadas por la anterior
+        ("actividad_crear", crear_act),
+        ("actividad_editar", lambda cli, ctx, i: cli.put(
+            f"/api/actividades/{act_creada(ctx, i)}", headers=h(ctx), json={
+                "nombre": f"Bench {i} editada", "responsable": "Director de Proyecto",
+                "fecha_inicio": "2025-03-01", "fecha_limite": "2025-03-25"})),
+        ("actividad_completar", lambda cli, ctx, i: cli.put(
+            f"/api/actividades/{act_creada(ctx, i)}/completar", headers=h(ctx),
+            json={"fecha_completado": hoy, "observaciones": "bench"})),
+        ("actividad_eliminar", lambda cli, ctx, i: cli.delete(
+            f"/api/actividades/{act_creada(ctx, i)}", headers=h(ctx))),
+        ("finanza_crear", crear_fin),
+        ("finanza_editar", lambda cli, ctx, i: cli.put(
+            f"/api/finanzas/{fin_creada(ctx, i)}", headers=h(ctx, "benchfin"), json={
+                "fecha_compra": hoy, "concepto": f"Bench {i} editada", "cantidad": 3,
+                "valor_unitario": 1500})),
+        ("finanza_eliminar", lambda cli, ctx, i: cli.delete(
+            f"/api/finanzas/{fin_creada(ctx, i)}", headers=h(ctx, "benchfin"))),
+        ("lote_50", lote),
+        ("importar_csv", lambda cli, ctx, i: cli.post(
+            "/api/importar?tabla=actividades", headers=h(ctx), content_type="multipart/form-data",
+            data={"archivo": (io.BytesIO(ctx["csv"]), "bench.csv")})),
+        # Un archivo distinto por repetición: las 100k filas se insertan todas.
+        # Va al final porque cada pasada agrega IMPORT_GRANDE actividades.
+        ("importar_csv_100k", lambda cli, ctx, i: cli.post(
+            "/api/importar?tabla=actividades", headers=h(ctx), content_type="multipart/form-data",
+            data={"archivo": (io.BytesIO(ctx["csv_grande"][i]), "bench.csv")})),
+    ]
+
+
+def percentil(valores, p):
+    valores = sorted(valores)
+    k = (len(valores) - 1) * p / 100
+    i = int(k)
+    return valores[i] if i + 1 >= len(valores) else valores[i] + (valores[i + 1] - valores[i]) * (k - i)
+
+
+def medir(cli, ctx, fn, repeticiones):
+    """La pasada 0 calienta (pool, cachés, imports) y mide el pico de memoria."""
+    tracemalloc.start()
+    fn(cli, ctx, 0).get_data()
+    pico = tracemalloc.get_traced_memory()[1] / 2**20
+    tracemalloc.stop()
+
+    # Consultas de las peticiones del escenario según la métrica de la app.
+    # Como en /metrics, las de los trabajos en segundo plano no se cuentan.
+    consultas = ctx["app"].metricas_db_consultas
+    tiempos, por_peticion = [], []
+    for i in range(1, repeticiones + 1):
+        antes = consultas.suma()
+        t0 = time.perf_counter()
+        r = fn(cli, ctx, i)
+        r.get_data()
+        tiempos.append(time.perf_counter() - t0)
+        por_peticion.append(consultas.suma() - antes)
+        if r.status_code >= 400:
+            raise RuntimeError(f"HTTP {r.status_code}: {r.get_data(as_text=True)[:200]}")
+    return {
+        "p50_ms": percentil(tiempos, 50) * 1000,
+        "p95_ms": percentil(tiempos, 95) * 1000,
+        "p99_ms": percentil(tiempos, 99) * 1000,
+        "req_s": repeticiones / sum(tiempos),
+        "consultas": statistics.median(por_peticion),
+        "pico_MB": pico,
+    }
+
+
+def imprimir(n, resultados, base=None):
+    print(f"\n== {n} filas por tabla ==")
+    print(f"{'escenario':<22} {'p50_ms':>9} {'p95_ms':>9} {'p99_ms':>9} {'req/s':>8} "
+          f"{'consultas':>9} {'pico_MB':>8}" + (f" {'Δp50':>7}" if base else ""))
+    for nombre, r in resultados.items():
+        linea = (f"{nombre:<22} {r['p50_ms']:>9.2f} {r['p95_ms']:>9.2f} {r['p99_ms']:>9.2f} "
+                 f"{r['req_s']:>8.1f} {r['consultas']:>9.0f} {r['pico_MB']:>8.2f}")
+        anterior = (base or {}).get(str(n), {}).get(nombre)
+        if anterior:
+            linea += f" {variacion(anterior, r):>+6.0f}%"
+        print(linea)
+
+
+def variacion(anterior, actual):
+    return (actual["p50_ms"] / anterior["p50_ms"] - 1) * 100
+
+
+def opcion(argv, nombre, defecto=None):
+    if nombre not in argv:
+        return defecto
+    i = argv.index(nombre)
+    valor = argv[i + 1]
+    del argv[i:i + 2]
+    return valor
+
+
+def main(argv):
+    repeticiones = int(opcion(argv, "--repeticiones", REPETICIONES))
+    solo = opcion(argv, "--solo")
+    archivo_json = opcion(argv, "--json")
+    comparar = opcion(argv, "--comparar")
+    umbral = float(opcion(argv, "--umbral", UMBRAL))
+    embebido = "--embebido" in argv
+    if embebido:
+        argv.remove("--embebido")
+    en_sqlite = "--sqlite" in argv
+    if en_sqlite:
+        argv.remove("--sqlite")
+    tamanos = sorted(int(a) for a in argv) or TAMANOS
+
+    detener = None
+    if embebido:
+        dsn, detener = levantar_embebido()
+    elif en_sqlite:
+        dsn, detener = crear_sqlite()
+    else:
+        dsn = os.environ.get("BENCH_DATABASE_URL")
+        if not dsn:
+            sys.exit("Define BENCH_DATABASE_URL (base descartable: se vacía) o usa --embebido o --sqlite")
+    # app.py lee DATABASE_URL al importarse
+    os.environ["DATABASE_URL"] = dsn
+
+    try:
+        import app as app_mod
+        app_mod.migrar()
+        cli = app_mod.app.test_client()
+        lista = [e for e in escenarios() if not solo or solo in e[0]]
+        base = json.load(open(comparar)) if comparar else None
+        todos, peores = {}, []
+
+        for n in tamanos:
+            sembrar(app_mod, n)
+            ctx = {
+                "app": app_mod, "etags": {}, "act_creadas": [], "fin_creadas": [],
+                "csv": csv_import(IMPORT_FILAS),
+                # Se arman antes de medir: generarlos no cuenta en la latencia
+                "csv_grande": [csv_import(IMPORT_GRANDE, f"Grande {k}")
+                               for k in range(REPETICIONES_EXPORT + 1)]
+                              if any(nombre == "importar_csv_100k" for nombre, _ in lista) else [],
+                "tokens": {u: app_mod.emitir_token(u, app_mod.cargo_a_rol(cargo)) for u, _, cargo in USUARIOS},
+            }
+            resultados = {}
+            for nombre, fn in lista:
+                reps = REPETICIONES_EXPORT if nombre in LENTOS else repeticiones
+                resultados[nombre] = medir(cli, ctx, fn, reps)
+            imprimir(n, resultados, base)
+            todos[str(n)] = resultados
+            for nombre, r in resultados.items():
+                anterior = (base or {}).get(str(n), {}).get(nombre)
+                if anterior and variacion(anterior, r) > umbral:
+                    peores.append(f"{nombre} ({n} filas): {variacion(anterior, r):+.0f}%")
+
+        print(f"\nRSS máximo del proceso: {resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024:.0f} MB")
+        if archivo_json:
+            with open(archivo_json, "w") as f:
+                json.dump(todos, f, indent=2)
+        if peores:
+            print(f"\nEmpeoraron más de {umbral:.0f}% en p50:")
+            for linea in peores:
+                print(f"  {linea}")
+            sys.exit(1)
+    finally:
+        if detener:
+            detener()
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,124 @@
+"""
+CRONOGRAMA UTB — benchmark de la exportación a Excel
+
+Genera el libro con datos sintéticos (sin base de datos) para varios tamaños
+y mide tiempo y RSS máximo del proceso; con --tracemalloc también el pico de
+memoria Python (mucho más lento). Cada tamaño corre en un subproceso aparte
+para que el RSS no se arrastre.
+
+Uso:
+    python benchmarks/bench_export.py                 # 1000 10000 100000
+    python benchmarks/bench_export.py 500 5000
+    python benchmarks/bench_export.py --tracemalloc 1000
+
+Con la exportación en modo write-only el pico de memoria debe mantenerse
+prácticamente plano mientras el número de filas crece.
+"""
+
+import os
+import random
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import date, timedelta
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, RAIZ)
+
+TAMANOS = [1000, 10000, 100000]
+# Rango fijo del proyecto: el Gantt tiene siempre el mismo número de días
+INICIO = date(2025, 1, 1)
+DIAS_PROYECTO = 180
+
+
+def actividades_sinteticas(n, semilla=1):
+    from app import CARGOS_VALIDOS, ESTADOS
+    rnd = random.Random(semilla)
+    for i in range(n):
+        ini = INICIO + timedelta(days=rnd.randrange(DIAS_PROYECTO - 30))
+        lim = ini + timedelta(days=rnd.randrange(1, 30))
+        estado = rnd.choice(ESTADOS)
+        completada = estado != "default"
+        yield {
+            "id": i + 1,
+            "nombre": f"Actividad {i + 1}",
+            "responsable": rnd.choice(CARGOS_VALIDOS),
+            "fecha_inicio": ini,
+            "fecha_limite": lim,
+            "completada": completada,
+            "fecha_completado": lim if completada else None,
+            "observaciones": "Observación de cierre " * 3 if completada else None,
+            "estado": estado,
+        }
+
+
+def finanzas_sinteticas(n, semilla=2):
+    rnd = random.Random(semilla)
+    for i in range(n):
+        unit = round(rnd.uniform(1000, 500000), 2)
+        cant = rnd.randrange(1, 10)
+        yield {
+            "id": i + 1,
+            "fecha_compra": INICIO + timedelta(days=rnd.randrange(DIAS_PROYECTO)),
+            "concepto": f"Compra {i + 1}",
+            "categoria": rnd.choice(["Materiales", "Electrónica", "Servicios"]),
+            "proveedor": f"Proveedor {rnd.randrange(50)}",
+            "cantidad": cant,
+            "valor_unitario": unit,
+            "valor_total": unit * cant,
+            "metodo_pago": "Transferencia",
+        }
+
+
+def medir(n, con_tracemalloc):
+    from app import escribir_excel
+
+    rango = (INICIO, INICIO + timedelta(days=DIAS_PROYECTO - 1))
+    fd, ruta = tempfile.mkstemp(suffix=".xlsx")
+    os.close(fd)
+    try:
+        if con_tracemalloc:
+            tracemalloc.start()
+        t0 = time.perf_counter()
+        escribir_excel(
+            ruta,
+            lambda: actividades_sinteticas(n),
+            lambda: finanzas_sinteticas(n),
+            rango,
+        )
+        segundos = time.perf_counter() - t0
+        pico = tracemalloc.get_traced_memory()[1] / 2**20 if con_tracemalloc else float("nan")
+        tracemalloc.stop()
+        tamano = os.path.getsize(ruta)
+    finally:
+        os.remove(ruta)
+
+    rss_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    print(f"{n}\t{segundos:.2f}\t{pico:.1f}\t{rss_kb / 1024:.1f}\t{tamano / 2**20:.2f}")
+
+
+def main(argv):
+    con_tracemalloc = "--tracemalloc" in argv
+    argv = [a for a in argv if a != "--tracemalloc"]
+    if len(argv) == 2 and argv[0] == "--medir":
+        medir(int(argv[1]), con_tracemalloc)
+        return
+
+    tamanos = [int(a) for a in argv] or TAMANOS
+    print(f"{'filas':>8} {'seg':>8} {'pico_py_MB':>11} {'rss_MB':>8} {'xlsx_MB':>8}")
+    for n in tamanos:
+        cmd = [sys.executable, os.path.abspath(__file__), "--medir", str(n)]
+        if con_tracemalloc:
+            cmd.append("--tracemalloc")
+        out = subprocess.run(
+            cmd, capture_output=True, text=True, check=True,
+        ).stdout.strip().splitlines()[-1]
+        filas, seg, pico, rss, tam = out.split("\t")
+        print(f"{filas:>8} {seg:>8} {pico:>11} {rss:>8} {tam:>8}")
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
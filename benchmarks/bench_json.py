@@ -0,0 +1,119 @@
+"""
+CRONOGRAMA UTB — benchmark del JSON de las listas (Python vs PostgreSQL)
+
+Compara los dos caminos de /api/actividades y /api/finanzas para la lista
+completa: filas a dicts + conversión en Python + json.dumps, contra
+json_agg armado en PostgreSQL y enviado como texto. Necesita DATABASE_URL
+con el esquema ya migrado (flask migrar). Las filas sintéticas se insertan dentro
+de una transacción que se revierte al final: la base queda como estaba.
+
+Uso:
+    python benchmarks/bench_json.py                 # 1000 10000 100000
+    python benchmarks/bench_json.py 500 5000
+    python benchmarks/bench_json.py --repeticiones 10 20000
+
+Se informa la mediana de las repeticiones, el tamaño de la respuesta y el
+pico de memoria Python (tracemalloc) de cada camino.
+"""
+
+import os
+import statistics
+import sys
+import time
+import tracemalloc
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, RAIZ)
+
+TAMANOS = [1000, 10000, 100000]
+REPETICIONES = 5
+
+SEMBRAR_ACTIVIDADES = """
+    INSERT INTO actividades
+        (nombre, descripcion, responsable, fecha_inicio, fecha_limite, prioridad,
+         completada, fecha_completado, observaciones, creada_por)
+    SELECT 'Actividad ' || i, 'Descripción de la actividad ' || i,
+           (%(cargos)s::text[])[1 + i %% 5],
+           DATE '2025-01-01' + (i %% 150), DATE '2025-01-01' + (i %% 150) + 1 + (i %% 29),
+           (ARRAY['alta', 'media', 'baja'])[1 + i %% 3],
+           i %% 2 = 0, CASE WHEN i %% 2 = 0 THEN DATE '2025-01-01' + (i %% 150) + (i %% 37) END,
+           CASE WHEN i %% 2 = 0 THEN 'Observación de cierre' END, 'bench'
+    FROM generate_series(1, %(n)s) AS i
+"""
+
+SEMBRAR_FINANZAS = """
+    INSERT INTO finanzas
+        (fecha_compra, concepto, categoria, proveedor, cantidad, valor_unitario,
+         valor_total, metodo_pago, responsable, creado_por)
+    SELECT DATE '2025-01-01' + (i %% 180), 'Compra ' || i,
+           (ARRAY['Materiales', 'Electrónica', 'Servicios'])[1 + i %% 3],
+           'Proveedor ' || (i %% 50), 1 + i %% 9, 1000 + (i %% 5000) * 97.31,
+           (1 + i %% 9) * (1000 + (i %% 5000) * 97.31), 'Transferencia', 'bench', 'bench'
+    FROM generate_series(1, %(n)s) AS i
+"""
+
+
+def medir(conn, tabla, en_bd, repeticiones):
+    from app import (CAMPOS_ACTIVIDAD, CAMPOS_FINANZA, lista_json,
+                     serializar_actividad, serializar_finanza)
+
+    if tabla == "actividades":
+        cols, orden, serializar = CAMPOS_ACTIVIDAD, "fecha_limite ASC, id ASC", serializar_actividad
+    else:
+        cols, orden, serializar = CAMPOS_FINANZA, "fecha_compra DESC, id DESC", serializar_finanza
+    sql = f"SELECT {', '.join(cols)} FROM {tabla} ORDER BY {orden}"
+
+    tiempos = []
+    for _ in range(repeticiones):
+        t0 = time.perf_counter()
+        texto = lista_json(conn, sql, [], cols, orden, serializar, en_bd=en_bd)
+        texto.encode()
+        tiempos.append(time.perf_counter() - t0)
+
+    tracemalloc.start()
+    lista_json(conn, sql, [], cols, orden, serializar, en_bd=en_bd).encode()
+    pico = tracemalloc.get_traced_memory()[1] / 2**20
+    tracemalloc.stop()
+    return statistics.median(tiempos), len(texto.encode()) / 2**20, pico
+
+
+def main(argv):
+    import psycopg2
+    from app import DATABASE_URL, SCHEMA, CARGOS_VALIDOS, app
+
+    repeticiones = REPETICIONES
+    if "--repeticiones" in argv:
+        i = argv.index("--repeticiones")
+        repeticiones = int(argv[i + 1])
+        del argv[i:i + 2]
+    tamanos = sorted(int(a) for a in argv) or TAMANOS
+
+    if not DATABASE_URL:
+        sys.exit("Define DATABASE_URL (con el esquema ya inicializado)")
+    conn = psycopg2.connect(DATABASE_URL, options=f"-c search_path={SCHEMA},public")
+
+    print(f"{'tabla':>12} {'filas':>8} {'py_ms':>9} {'bd_ms':>9} {'x':>6} "
+          f"{'MB':>7} {'py_pico_MB':>11} {'bd_pico_MB':>11}")
+    with app.app_context():
+        try:
+            c = conn.cursor()
+            sembradas = 0
+            for n in tamanos:
+                # Se siembra sólo la diferencia con el tamaño anterior
+                c.execute(SEMBRAR_ACTIVIDADES, {"n": n - sembradas, "cargos": CARGOS_VALIDOS})
+                c.execute(SEMBRAR_FINANZAS, {"n": n - sembradas})
+                sembradas = n
+                for tabla in ("actividades", "finanzas"):
+                    py_s, mb, py_pico = medir(conn, tabla, False, repeticiones)
+                    bd_s, _, bd_pico = medir(conn, tabla, True, repeticiones)
+                    c.execute(f"SELECT COUNT(*) FROM {tabla}")
+                    filas = c.fetchone()[0]
+                    print(f"{tabla:>12} {filas:>8} {py_s * 1000:>9.1f} {bd_s * 1000:>9.1f} "
+                          f"{py_s / bd_s:>6.2f} {mb:>7.2f} {py_pico:>11.1f} {bd_pico:>11.1f}")
+        finally:
+            conn.rollback()
+            conn.close()
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
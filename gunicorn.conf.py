@@ -0,0 +1,42 @@
+"""
+CRONOGRAMA UTB — configuración de gunicorn (se lee sola desde el directorio
+de trabajo: `gunicorn app:app`).
+
+Importar app.py no abre conexiones ni hilos (pool, canal de eventos y
+trabajos de exportación se crean en el primer uso de cada proceso), así que
+la app se precarga en el maestro y los workers arrancan con fork, sin volver
+a importar Flask. El chequeo de esquema corre una sola vez, en el maestro,
+antes de crear los workers.
+
+gunicorn se considera producción (PRODUCCION=1) salvo que se indique lo
+contrario: sin SECRET_KEY no arranca. Con PRODUCCION=0 y sin SECRET_KEY el
+maestro genera una clave aleatoria antes de cargar la app, así que todos los
+workers firman los tokens con la misma.
+"""
+
+import os
+
+os.environ.setdefault("PRODUCCION", "1")
+if not os.environ.get("SECRET_KEY"):
+    if os.environ["PRODUCCION"] == "1":
+        raise SystemExit("Falta SECRET_KEY (o use PRODUCCION=0 fuera de producción)")
+    os.environ["SECRET_KEY"] = os.urandom(32).hex()
+    print("⚠️ SECRET_KEY no definida: se usa una clave aleatoria; "
+          "las sesiones se pierden al reiniciar.")
+
+preload_app = os.environ.get("GUNICORN_PRELOAD", "1") == "1"
+
+# Cada pestaña abierta mantiene una conexión a /api/eventos que ocupa un hilo
+# mientras dure, así que hacen falta workers con hilos: hasta
+# EVENTOS_MAX_CLIENTES conexiones de eventos más GUNICORN_HILOS_API hilos para
+# el resto de la API. Con gthread el timeout vigila al worker, no a cada
+# petición; debe superar el latido de los eventos (EVENTOS_LATIDO).
+worker_class = "gthread"
+threads = (int(os.environ.get("EVENTOS_MAX_CLIENTES", 50))
+           + int(os.environ.get("GUNICORN_HILOS_API", 8)))
+timeout = max(60, 2 * int(os.environ.get("EVENTOS_LATIDO", 25)))
+
+
+def on_starting(server):
+    from app import preparar_bd
+    preparar_bd()
@@ -0,0 +1,59 @@
+-- =============================================
+-- 0001 — Esquema inicial (usuarios, actividades, finanzas)
+-- Equivale al init_db original y a las tablas de schema.sql
+-- =============================================
+
+-- Usuarios con rol (el rol se deriva del cargo, ver cargo_a_rol)
+CREATE TABLE IF NOT EXISTS usuarios (
+    id        SERIAL PRIMARY KEY,
+    username  VARCHAR(100) UNIQUE NOT NULL,
+    nombre    VARCHAR(200) NOT NULL,
+    cargo     VARCHAR(100) NOT NULL,
+    rol       VARCHAR(50) DEFAULT 'miembro',
+    password  VARCHAR(255) NOT NULL,
+    creado_en TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+-- Actividades del cronograma, con detalles y observaciones de cierre
+CREATE TABLE IF NOT EXISTS actividades (
+    id                 SERIAL PRIMARY KEY,
+    nombre             VARCHAR(300) NOT NULL,
+    descripcion        TEXT,
+    detalles           TEXT,
+    responsable        VARCHAR(200) NOT NULL,
+    fecha_inicio       DATE NOT NULL,
+    fecha_limite       DATE NOT NULL,
+    prioridad          VARCHAR(20) DEFAULT 'media',
+    completada         BOOLEAN DEFAULT FALSE,
+    fecha_completado   DATE,
+    observaciones      TEXT,
+    completada_por     VARCHAR(100),
+    creada_por         VARCHAR(100),
+    creada_en          TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+-- Gastos del proyecto
+CREATE TABLE IF NOT EXISTS finanzas (
+    id              SERIAL PRIMARY KEY,
+    fecha_compra    DATE NOT NULL,
+    concepto        VARCHAR(300) NOT NULL,
+    categoria       VARCHAR(100),
+    proveedor       VARCHAR(200),
+    cantidad        INTEGER DEFAULT 1,
+    valor_unitario  DECIMAL(12,2) NOT NULL,
+    valor_total     DECIMAL(12,2) NOT NULL,
+    metodo_pago     VARCHAR(50),
+    responsable     VARCHAR(100),
+    observaciones   TEXT,
+    factura         VARCHAR(100),
+    creado_por      VARCHAR(100),
+    creado_en       TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    modificado_por  VARCHAR(100),
+    modificado_en   TIMESTAMP
+);
+
+-- Índices para consultas frecuentes
+CREATE INDEX IF NOT EXISTS idx_act_fecha_limite ON actividades(fecha_limite);
+CREATE INDEX IF NOT EXISTS idx_act_completada ON actividades(completada);
+CREATE INDEX IF NOT EXISTS idx_usuarios_user ON usuarios(username);
+CREATE INDEX IF NOT EXISTS idx_finanzas_fecha ON finanzas(fecha_compra);
@@ -0,0 +1,23 @@
+-- =============================================
+-- 0002 — Estado materializado e índices de paginación
+-- =============================================
+
+-- Estado de una actividad según fecha_completado vs fecha_limite (misma
+-- lógica que la leyenda de la app, ver ESTADOS en app.py). Columna generada:
+-- se recalcula sola en cada INSERT/UPDATE.
+ALTER TABLE actividades ADD COLUMN IF NOT EXISTS estado VARCHAR(10)
+    GENERATED ALWAYS AS (
+        CASE
+            WHEN NOT COALESCE(completada, FALSE) OR fecha_completado IS NULL THEN 'default'
+            WHEN fecha_completado - fecha_limite < -7 THEN 'prematuro'
+            WHEN fecha_completado - fecha_limite <= 0 THEN 'tiempo'
+            WHEN fecha_completado - fecha_limite <= 7 THEN 'leve'
+            ELSE 'tarde'
+        END
+    ) STORED;
+
+-- Índices del keyset de paginación
+CREATE INDEX IF NOT EXISTS idx_act_limite_id ON actividades(fecha_limite, id);
+CREATE INDEX IF NOT EXISTS idx_finanzas_fecha_id ON finanzas(fecha_compra, id);
+-- Filtro por estado + orden del listado en un solo índice
+CREATE INDEX IF NOT EXISTS idx_act_estado ON actividades(estado, fecha_limite, id);
@@ -0,0 +1,62 @@
+-- =============================================
+-- 0003 — Resumen financiero mantenido por trigger (deltas por fila)
+-- =============================================
+
+CREATE TABLE IF NOT EXISTS finanzas_resumen (
+    dimension   VARCHAR(20)  NOT NULL,
+    clave       VARCHAR(200) NOT NULL,
+    total       DECIMAL(14,2) NOT NULL DEFAULT 0,
+    registros   INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (dimension, clave)
+);
+
+CREATE OR REPLACE FUNCTION cronograma.finanzas_resumen_delta(f cronograma.finanzas, signo INTEGER)
+RETURNS VOID AS $$
+    INSERT INTO cronograma.finanzas_resumen AS r (dimension, clave, total, registros)
+    VALUES ('total',       '',                                signo * f.valor_total, signo),
+           ('mes',         to_char(f.fecha_compra, 'YYYY-MM'), signo * f.valor_total, signo),
+           ('categoria',   COALESCE(f.categoria, ''),         signo * f.valor_total, signo),
+           ('proveedor',   COALESCE(f.proveedor, ''),         signo * f.valor_total, signo),
+           ('responsable', COALESCE(f.responsable, ''),       signo * f.valor_total, signo)
+    ON CONFLICT (dimension, clave) DO UPDATE
+       SET total = r.total + EXCLUDED.total,
+           registros = r.registros + EXCLUDED.registros;
+    DELETE FROM cronograma.finanzas_resumen
+     WHERE registros <= 0 AND dimension <> 'total';
+$$ LANGUAGE SQL;
+
+CREATE OR REPLACE FUNCTION cronograma.finanzas_resumen_trg()
+RETURNS TRIGGER AS $$
+BEGIN
+    IF TG_OP IN ('UPDATE', 'DELETE') THEN
+        PERFORM cronograma.finanzas_resumen_delta(OLD, -1);
+    END IF;
+    IF TG_OP IN ('INSERT', 'UPDATE') THEN
+        PERFORM cronograma.finanzas_resumen_delta(NEW, 1);
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS trg_finanzas_resumen ON finanzas;
+CREATE TRIGGER trg_finanzas_resumen
+AFTER INSERT OR UPDATE OR DELETE ON finanzas
+FOR EACH ROW EXECUTE FUNCTION finanzas_resumen_trg();
+
+-- Carga inicial desde los gastos existentes (sin escrituras concurrentes)
+LOCK TABLE finanzas IN SHARE MODE;
+DELETE FROM finanzas_resumen;
+INSERT INTO finanzas_resumen (dimension, clave, total, registros)
+SELECT 'total', '', COALESCE(SUM(valor_total), 0), COUNT(*) FROM finanzas
+UNION ALL
+SELECT 'mes', to_char(fecha_compra, 'YYYY-MM'), SUM(valor_total), COUNT(*)
+  FROM finanzas GROUP BY 2
+UNION ALL
+SELECT 'categoria', COALESCE(categoria, ''), SUM(valor_total), COUNT(*)
+  FROM finanzas GROUP BY 2
+UNION ALL
+SELECT 'proveedor', COALESCE(proveedor, ''), SUM(valor_total), COUNT(*)
+  FROM finanzas GROUP BY 2
+UNION ALL
+SELECT 'responsable', COALESCE(responsable, ''), SUM(valor_total), COUNT(*)
+  FROM finanzas GROUP BY 2;
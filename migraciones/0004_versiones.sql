@@ -0,0 +1,43 @@
+-- =============================================
+-- 0004 — Versión de datos por tabla (ETag / Last-Modified)
+-- =============================================
+
+-- Cada sentencia que modifica la tabla suma 1 (modificado_en en UTC, se usa
+-- como Last-Modified)
+CREATE TABLE IF NOT EXISTS versiones (
+    tabla          VARCHAR(50) PRIMARY KEY,
+    version        BIGINT NOT NULL DEFAULT 0,
+    modificado_en  TIMESTAMP NOT NULL DEFAULT (now() AT TIME ZONE 'UTC')
+);
+
+CREATE OR REPLACE FUNCTION cronograma.versiones_trg()
+RETURNS TRIGGER AS $$
+BEGIN
+    INSERT INTO cronograma.versiones AS v (tabla, version, modificado_en)
+    VALUES (TG_TABLE_NAME, 1, clock_timestamp() AT TIME ZONE 'UTC')
+    ON CONFLICT (tabla) DO UPDATE
+       SET version = v.version + 1,
+           modificado_en = clock_timestamp() AT TIME ZONE 'UTC';
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Una por cada tabla de TABLAS_VERSIONADAS
+DROP TRIGGER IF EXISTS trg_actividades_version ON actividades;
+CREATE TRIGGER trg_actividades_version
+AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON actividades
+FOR EACH STATEMENT EXECUTE FUNCTION versiones_trg();
+
+DROP TRIGGER IF EXISTS trg_finanzas_version ON finanzas;
+CREATE TRIGGER trg_finanzas_version
+AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON finanzas
+FOR EACH STATEMENT EXECUTE FUNCTION versiones_trg();
+
+DROP TRIGGER IF EXISTS trg_usuarios_version ON usuarios;
+CREATE TRIGGER trg_usuarios_version
+AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON usuarios
+FOR EACH STATEMENT EXECUTE FUNCTION versiones_trg();
+
+INSERT INTO versiones (tabla)
+VALUES ('actividades'), ('finanzas'), ('usuarios')
+ON CONFLICT DO NOTHING;
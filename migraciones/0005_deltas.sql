@@ -0,0 +1,57 @@
+-- =============================================
+-- 0005 — Sincronización por deltas (requiere PostgreSQL 13+)
+-- =============================================
+
+-- Cada fila guarda la transacción que la modificó por última vez y los
+-- DELETE dejan una lápida en `eliminados`
+CREATE OR REPLACE FUNCTION cronograma.marcar_cambio_trg()
+RETURNS TRIGGER AS $$
+BEGIN
+    NEW.cambio_xid := pg_current_xact_id();
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TABLE IF NOT EXISTS eliminados (
+    tabla         VARCHAR(50) NOT NULL,
+    id            INTEGER NOT NULL,
+    cambio_xid    xid8 NOT NULL DEFAULT pg_current_xact_id(),
+    eliminado_en  TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (tabla, id)
+);
+CREATE INDEX IF NOT EXISTS idx_eliminados_cambio ON eliminados(tabla, cambio_xid);
+
+CREATE OR REPLACE FUNCTION cronograma.lapida_trg()
+RETURNS TRIGGER AS $$
+BEGIN
+    INSERT INTO cronograma.eliminados AS e (tabla, id)
+    VALUES (TG_TABLE_NAME, OLD.id)
+    ON CONFLICT (tabla, id) DO UPDATE
+       SET cambio_xid = pg_current_xact_id(), eliminado_en = CURRENT_TIMESTAMP;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+-- actividades
+ALTER TABLE actividades ADD COLUMN IF NOT EXISTS cambio_xid xid8;
+CREATE INDEX IF NOT EXISTS idx_actividades_cambio ON actividades(cambio_xid);
+DROP TRIGGER IF EXISTS trg_actividades_cambio ON actividades;
+CREATE TRIGGER trg_actividades_cambio
+BEFORE INSERT OR UPDATE ON actividades
+FOR EACH ROW EXECUTE FUNCTION marcar_cambio_trg();
+DROP TRIGGER IF EXISTS trg_actividades_lapida ON actividades;
+CREATE TRIGGER trg_actividades_lapida
+AFTER DELETE ON actividades
+FOR EACH ROW EXECUTE FUNCTION lapida_trg();
+
+-- finanzas
+ALTER TABLE finanzas ADD COLUMN IF NOT EXISTS cambio_xid xid8;
+CREATE INDEX IF NOT EXISTS idx_finanzas_cambio ON finanzas(cambio_xid);
+DROP TRIGGER IF EXISTS trg_finanzas_cambio ON finanzas;
+CREATE TRIGGER trg_finanzas_cambio
+BEFORE INSERT OR UPDATE ON finanzas
+FOR EACH ROW EXECUTE FUNCTION marcar_cambio_trg();
+DROP TRIGGER IF EXISTS trg_finanzas_lapida ON finanzas;
+CREATE TRIGGER trg_finanzas_lapida
+AFTER DELETE ON finanzas
+FOR EACH ROW EXECUTE FUNCTION lapida_trg();
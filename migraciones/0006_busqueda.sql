@@ -0,0 +1,25 @@
+-- =============================================
+-- 0006 — Búsqueda de texto completo (/api/buscar)
+-- =============================================
+
+-- tsvector generado con la configuración 'spanish' (raíces y stopwords del
+-- español) y pesos por campo para ordenar por relevancia:
+--   A → nombre / concepto, B → descripción, detalles, proveedor, categoría,
+--   C → observaciones, factura.
+-- Agregar la columna reescribe la tabla una vez.
+ALTER TABLE actividades ADD COLUMN IF NOT EXISTS busqueda tsvector
+    GENERATED ALWAYS AS (
+        setweight(to_tsvector('spanish', COALESCE(nombre, '')), 'A') ||
+        setweight(to_tsvector('spanish', COALESCE(descripcion, '') || ' ' || COALESCE(detalles, '')), 'B') ||
+        setweight(to_tsvector('spanish', COALESCE(observaciones, '')), 'C')
+    ) STORED;
+CREATE INDEX IF NOT EXISTS idx_act_busqueda ON actividades USING GIN (busqueda);
+
+-- La factura es un código: 'simple' no le quita sufijos
+ALTER TABLE finanzas ADD COLUMN IF NOT EXISTS busqueda tsvector
+    GENERATED ALWAYS AS (
+        setweight(to_tsvector('spanish', COALESCE(concepto, '')), 'A') ||
+        setweight(to_tsvector('spanish', COALESCE(proveedor, '') || ' ' || COALESCE(categoria, '')), 'B') ||
+        setweight(to_tsvector('simple', COALESCE(factura, '')), 'C')
+    ) STORED;
+CREATE INDEX IF NOT EXISTS idx_finanzas_busqueda ON finanzas USING GIN (busqueda);
@@ -0,0 +1,10 @@
+-- =============================================
+-- 0007 — Índices por clave natural (importación)
+-- =============================================
+
+-- /api/importar omite las filas que ya existen comparando la clave natural
+-- de cada tabla (ver MERGE_IMPORT en app.py). Sin estos índices esa
+-- comparación recorre la tabla entera por cada fila importada.
+CREATE INDEX IF NOT EXISTS idx_act_clave ON actividades(nombre, responsable, fecha_inicio, fecha_limite);
+-- proveedor va al final: admite NULL y se compara con IS NOT DISTINCT FROM
+CREATE INDEX IF NOT EXISTS idx_finanzas_clave ON finanzas(fecha_compra, concepto, cantidad, valor_unitario, proveedor);
@@ -0,0 +1,62 @@
+-- =============================================
+-- 0002 (SQLite) — Búsqueda de texto completo (/api/buscar)
+-- =============================================
+
+-- Índices FTS5 de contenido externo: guardan sólo el índice invertido y
+-- leen el texto de la tabla original. SQLite no trae raíces del español:
+-- se busca por prefijo y sin distinguir tildes (remove_diacritics).
+CREATE VIRTUAL TABLE IF NOT EXISTS actividades_busqueda USING fts5(
+    nombre, descripcion, detalles, observaciones,
+    content='actividades', content_rowid='id',
+    tokenize='unicode61 remove_diacritics 2'
+);
+
+CREATE VIRTUAL TABLE IF NOT EXISTS finanzas_busqueda USING fts5(
+    concepto, proveedor, categoria, factura,
+    content='finanzas', content_rowid='id',
+    tokenize='unicode61 remove_diacritics 2'
+);
+
+-- actividades (el UPDATE de cambio_xid no reindexa: sólo columnas de texto)
+CREATE TRIGGER IF NOT EXISTS trg_actividades_busqueda_ins AFTER INSERT ON actividades
+BEGIN
+    INSERT INTO actividades_busqueda (rowid, nombre, descripcion, detalles, observaciones)
+    VALUES (NEW.id, NEW.nombre, NEW.descripcion, NEW.detalles, NEW.observaciones);
+END;
+CREATE TRIGGER IF NOT EXISTS trg_actividades_busqueda_del AFTER DELETE ON actividades
+BEGIN
+    INSERT INTO actividades_busqueda (actividades_busqueda, rowid, nombre, descripcion, detalles, observaciones)
+    VALUES ('delete', OLD.id, OLD.nombre, OLD.descripcion, OLD.detalles, OLD.observaciones);
+END;
+CREATE TRIGGER IF NOT EXISTS trg_actividades_busqueda_upd
+AFTER UPDATE OF nombre, descripcion, detalles, observaciones ON actividades
+BEGIN
+    INSERT INTO actividades_busqueda (actividades_busqueda, rowid, nombre, descripcion, detalles, observaciones)
+    VALUES ('delete', OLD.id, OLD.nombre, OLD.descripcion, OLD.detalles, OLD.observaciones);
+    INSERT INTO actividades_busqueda (rowid, nombre, descripcion, detalles, observaciones)
+    VALUES (NEW.id, NEW.nombre, NEW.descripcion, NEW.detalles, NEW.observaciones);
+END;
+
+-- finanzas
+CREATE TRIGGER IF NOT EXISTS trg_finanzas_busqueda_ins AFTER INSERT ON finanzas
+BEGIN
+    INSERT INTO finanzas_busqueda (rowid, concepto, proveedor, categoria, factura)
+    VALUES (NEW.id, NEW.concepto, NEW.proveedor, NEW.categoria, NEW.factura);
+END;
+CREATE TRIGGER IF NOT EXISTS trg_finanzas_busqueda_del AFTER DELETE ON finanzas
+BEGIN
+    INSERT INTO finanzas_busqueda (finanzas_busqueda, rowid, concepto, proveedor, categoria, factura)
+    VALUES ('delete', OLD.id, OLD.concepto, OLD.proveedor, OLD.categoria, OLD.factura);
+END;
+CREATE TRIGGER IF NOT EXISTS trg_finanzas_busqueda_upd
+AFTER UPDATE OF concepto, proveedor, categoria, factura ON finanzas
+BEGIN
+    INSERT INTO finanzas_busqueda (finanzas_busqueda, rowid, concepto, proveedor, categoria, factura)
+    VALUES ('delete', OLD.id, OLD.concepto, OLD.proveedor, OLD.categoria, OLD.factura);
+    INSERT INTO finanzas_busqueda (rowid, concepto, proveedor, categoria, factura)
+    VALUES (NEW.id, NEW.concepto, NEW.proveedor, NEW.categoria, NEW.factura);
+END;
+
+-- Índice inicial con las filas existentes
+INSERT INTO actividades_busqueda (actividades_busqueda) VALUES ('rebuild');
+INSERT INTO finanzas_busqueda (finanzas_busqueda) VALUES ('rebuild');
@@ -0,0 +1,8 @@
+-- =============================================
+-- 0003 (SQLite) — Índices por clave natural (importación)
+-- =============================================
+
+-- Igual que migraciones/0007: /api/importar busca cada fila importada por
+-- su clave natural para omitir las que ya existen.
+CREATE INDEX IF NOT EXISTS idx_act_clave ON actividades (nombre, responsable, fecha_inicio, fecha_limite);
+CREATE INDEX IF NOT EXISTS idx_finanzas_clave ON finanzas (fecha_compra, concepto, cantidad, valor_unitario, proveedor);
@@ -1,18 +1,19 @@
 -- =============================================
 -- CRONOGRAMA UTB — schema.sql
--- Base de datos SQLite
--- Ejecutar solo si quieres crear la BD
--- manualmente (app.py lo hace automático)
+-- Base de datos SQLite (DATABASE_URL=sqlite:///...)
+-- app.py la aplica como migración 1 (flask migrar);
+-- equivale a migraciones/0001..0005 de PostgreSQL
 -- =============================================
 
--- Tabla de usuarios (máximo 5)
+-- Usuarios con rol (máximo 5; el rol se deriva del cargo)
 CREATE TABLE IF NOT EXISTS usuarios (
     id        INTEGER PRIMARY KEY AUTOINCREMENT,
-    user      TEXT    UNIQUE NOT NULL,       -- nombre de usuario único
+    username  TEXT    UNIQUE NOT NULL,       -- nombre de usuario único
     nombre    TEXT    NOT NULL,              -- nombre completo
     cargo     TEXT    NOT NULL,              -- cargo en el proyecto
+    rol       TEXT    DEFAULT 'miembro',
     password  TEXT    NOT NULL,              -- contraseña hasheada (werkzeug)
-    creado_en TEXT    DEFAULT (datetime('now'))
+    creado_en TIMESTAMP DEFAULT CURRENT_TIMESTAMP
 );
 
 -- Tabla de actividades del cronograma
@@ -20,24 +21,59 @@ CREATE TABLE IF NOT EXISTS actividades (
     id               INTEGER PRIMARY KEY AUTOINCREMENT,
     nombre           TEXT    NOT NULL,           -- nombre de la actividad
     descripcion      TEXT,                        -- descripción opcional
+    detalles         TEXT,
     responsable      TEXT    NOT NULL,            -- persona a cargo
-    fecha_inicio     TEXT    NOT NULL,            -- formato YYYY-MM-DD
-    fecha_limite     TEXT    NOT NULL,            -- formato YYYY-MM-DD
+    fecha_inicio     DATE    NOT NULL,            -- formato YYYY-MM-DD
+    fecha_limite     DATE    NOT NULL,            -- formato YYYY-MM-DD
 
     prioridad        TEXT    DEFAULT 'media',     -- alta / media / baja
 
     -- Estado de completado
-    completada       INTEGER DEFAULT 0,           -- 0=no, 1=sí
-    fecha_completado TEXT,                        -- fecha real de completado YYYY-MM-DD
+    completada       BOOLEAN DEFAULT 0,           -- 0=no, 1=sí
+    fecha_completado DATE,                        -- fecha real de completado YYYY-MM-DD
+    observaciones    TEXT,                        -- observaciones de cierre
     completada_por   TEXT,                        -- user que marcó como completada
 
     -- Auditoría
     creada_por       TEXT,                        -- user que creó la actividad
-    creada_en        TEXT    DEFAULT (datetime('now'))
+    creada_en        TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+
+    -- Color de la leyenda, ver LÓGICA DE COLORES
+    estado           TEXT GENERATED ALWAYS AS (
+        CASE
+            WHEN NOT COALESCE(completada, 0) OR fecha_completado IS NULL THEN 'default'
+            WHEN julianday(fecha_completado) - julianday(fecha_limite) < -7 THEN 'prematuro'
+            WHEN julianday(fecha_completado) - julianday(fecha_limite) <= 0 THEN 'tiempo'
+            WHEN julianday(fecha_completado) - julianday(fecha_limite) <= 7 THEN 'leve'
+            ELSE 'tarde'
+        END
+    ) STORED,
+    cambio_xid       INTEGER                      -- ver SINCRONIZACIÓN POR DELTAS
+);
+
+-- Gastos del proyecto
+CREATE TABLE IF NOT EXISTS finanzas (
+    id              INTEGER PRIMARY KEY AUTOINCREMENT,
+    fecha_compra    DATE    NOT NULL,
+    concepto        TEXT    NOT NULL,
+    categoria       TEXT,
+    proveedor       TEXT,
+    cantidad        INTEGER DEFAULT 1,
+    valor_unitario  DECIMAL(12,2) NOT NULL,
+    valor_total     DECIMAL(12,2) NOT NULL,
+    metodo_pago     TEXT,
+    responsable     TEXT,
+    observaciones   TEXT,
+    factura         TEXT,
+    creado_por      TEXT,
+    creado_en       TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    modificado_por  TEXT,
+    modificado_en   TIMESTAMP,
+    cambio_xid      INTEGER
 );
 
 -- =============================================
--- LÓGICA DE COLORES (se calcula en JavaScript)
+-- LÓGICA DE COLORES (columna estado)
 -- =============================================
 -- Comparación: fecha_completado vs fecha_limite
 -- diff = dias entre fecha_completado y fecha_limite
@@ -52,4 +88,208 @@ CREATE TABLE IF NOT EXISTS actividades (
 -- Índices para consultas frecuentes
 CREATE INDEX IF NOT EXISTS idx_act_fecha_limite   ON actividades (fecha_limite);
 CREATE INDEX IF NOT EXISTS idx_act_completada     ON actividades (completada);
-CREATE INDEX IF NOT EXISTS idx_usuarios_user      ON usuarios    (user);
\ No newline at end of file
+CREATE INDEX IF NOT EXISTS idx_usuarios_user      ON usuarios    (username);
+CREATE INDEX IF NOT EXISTS idx_finanzas_fecha     ON finanzas    (fecha_compra);
+-- Keyset de paginación y filtro por estado
+CREATE INDEX IF NOT EXISTS idx_act_limite_id      ON actividades (fecha_limite, id);
+CREATE INDEX IF NOT EXISTS idx_finanzas_fecha_id  ON finanzas    (fecha_compra, id);
+CREATE INDEX IF NOT EXISTS idx_act_estado         ON actividades (estado, fecha_limite, id);
+
+-- =============================================
+-- RESUMEN FINANCIERO (deltas por fila)
+-- =============================================
+CREATE TABLE IF NOT EXISTS finanzas_resumen (
+    dimension   TEXT    NOT NULL,
+    clave       TEXT    NOT NULL,
+    total       DECIMAL(14,2) NOT NULL DEFAULT 0,
+    registros   INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (dimension, clave)
+);
+
+CREATE TRIGGER IF NOT EXISTS trg_finanzas_resumen_ins
+AFTER INSERT ON finanzas
+BEGIN
+    INSERT INTO finanzas_resumen (dimension, clave, total, registros)
+    VALUES ('total',       '',                              NEW.valor_total, 1),
+           ('mes',         strftime('%Y-%m', NEW.fecha_compra), NEW.valor_total, 1),
+           ('categoria',   COALESCE(NEW.categoria, ''),     NEW.valor_total, 1),
+           ('proveedor',   COALESCE(NEW.proveedor, ''),     NEW.valor_total, 1),
+           ('responsable', COALESCE(NEW.responsable, ''),   NEW.valor_total, 1)
+    ON CONFLICT (dimension, clave) DO UPDATE
+       SET total = ROUND(total + excluded.total, 2),
+           registros = registros + excluded.registros;
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_finanzas_resumen_del
+AFTER DELETE ON finanzas
+BEGIN
+    INSERT INTO finanzas_resumen (dimension, clave, total, registros)
+    VALUES ('total',       '',                              -OLD.valor_total, -1),
+           ('mes',         strftime('%Y-%m', OLD.fecha_compra), -OLD.valor_total, -1),
+           ('categoria',   COALESCE(OLD.categoria, ''),     -OLD.valor_total, -1),
+           ('proveedor',   COALESCE(OLD.proveedor, ''),     -OLD.valor_total, -1),
+           ('responsable', COALESCE(OLD.responsable, ''),   -OLD.valor_total, -1)
+    ON CONFLICT (dimension, clave) DO UPDATE
+       SET total = ROUND(total + excluded.total, 2),
+           registros = registros + excluded.registros;
+    DELETE FROM finanzas_resumen WHERE registros <= 0 AND dimension <> 'total';
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_finanzas_resumen_upd
+AFTER UPDATE OF fecha_compra, categoria, proveedor, responsable, valor_total ON finanzas
+BEGIN
+    INSERT INTO finanzas_resumen (dimension, clave, total, registros)
+    VALUES ('total',       '',                              -OLD.valor_total, -1),
+           ('mes',         strftime('%Y-%m', OLD.fecha_compra), -OLD.valor_total, -1),
+           ('categoria',   COALESCE(OLD.categoria, ''),     -OLD.valor_total, -1),
+           ('proveedor',   COALESCE(OLD.proveedor, ''),     -OLD.valor_total, -1),
+           ('responsable', COALESCE(OLD.responsable, ''),   -OLD.valor_total, -1)
+    ON CONFLICT (dimension, clave) DO UPDATE
+       SET total = ROUND(total + excluded.total, 2),
+           registros = registros + excluded.registros;
+    INSERT INTO finanzas_resumen (dimension, clave, total, registros)
+    VALUES ('total',       '',                              NEW.valor_total, 1),
+           ('mes',         strftime('%Y-%m', NEW.fecha_compra), NEW.valor_total, 1),
+           ('categoria',   COALESCE(NEW.categoria, ''),     NEW.valor_total, 1),
+           ('proveedor',   COALESCE(NEW.proveedor, ''),     NEW.valor_total, 1),
+           ('responsable', COALESCE(NEW.responsable, ''),   NEW.valor_total, 1)
+    ON CONFLICT (dimension, clave) DO UPDATE
+       SET total = ROUND(total + excluded.total, 2),
+           registros = registros + excluded.registros;
+    DELETE FROM finanzas_resumen WHERE registros <= 0 AND dimension <> 'total';
+END;
+
+INSERT OR IGNORE INTO finanzas_resumen (dimension, clave) VALUES ('total', '');
+
+-- =============================================
+-- VERSIÓN DE DATOS POR TABLA (ETag / Last-Modified)
+-- =============================================
+-- SQLite sólo tiene triggers por fila: la versión sube una vez por fila
+-- modificada (basta con que cambie). modificado_en en UTC.
+CREATE TABLE IF NOT EXISTS versiones (
+    tabla          TEXT    PRIMARY KEY,
+    version        INTEGER NOT NULL DEFAULT 0,
+    modificado_en  TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+);
+
+INSERT OR IGNORE INTO versiones (tabla) VALUES ('actividades'), ('finanzas'), ('usuarios');
+
+CREATE TRIGGER IF NOT EXISTS trg_actividades_version_ins AFTER INSERT ON actividades
+BEGIN
+    UPDATE versiones SET version = version + 1, modificado_en = strftime('%Y-%m-%d %H:%M:%f', 'now')
+    WHERE tabla = 'actividades';
+END;
+-- El UPDATE de cambio_xid que hacen los triggers de abajo no cuenta
+CREATE TRIGGER IF NOT EXISTS trg_actividades_version_upd AFTER UPDATE ON actividades
+WHEN NEW.cambio_xid IS OLD.cambio_xid
+BEGIN
+    UPDATE versiones SET version = version + 1, modificado_en = strftime('%Y-%m-%d %H:%M:%f', 'now')
+    WHERE tabla = 'actividades';
+END;
+CREATE TRIGGER IF NOT EXISTS trg_actividades_version_del AFTER DELETE ON actividades
+BEGIN
+    UPDATE versiones SET version = version + 1, modificado_en = strftime('%Y-%m-%d %H:%M:%f', 'now')
+    WHERE tabla = 'actividades';
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_finanzas_version_ins AFTER INSERT ON finanzas
+BEGIN
+    UPDATE versiones SET version = version + 1, modificado_en = strftime('%Y-%m-%d %H:%M:%f', 'now')
+    WHERE tabla = 'finanzas';
+END;
+CREATE TRIGGER IF NOT EXISTS trg_finanzas_version_upd AFTER UPDATE ON finanzas
+WHEN NEW.cambio_xid IS OLD.cambio_xid
+BEGIN
+    UPDATE versiones SET version = version + 1, modificado_en = strftime('%Y-%m-%d %H:%M:%f', 'now')
+    WHERE tabla = 'finanzas';
+END;
+CREATE TRIGGER IF NOT EXISTS trg_finanzas_version_del AFTER DELETE ON finanzas
+BEGIN
+    UPDATE versiones SET version = version + 1, modificado_en = strftime('%Y-%m-%d %H:%M:%f', 'now')
+    WHERE tabla = 'finanzas';
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_usuarios_version_ins AFTER INSERT ON usuarios
+BEGIN
+    UPDATE versiones SET version = version + 1, modificado_en = strftime('%Y-%m-%d %H:%M:%f', 'now')
+    WHERE tabla = 'usuarios';
+END;
+CREATE TRIGGER IF NOT EXISTS trg_usuarios_version_upd AFTER UPDATE ON usuarios
+BEGIN
+    UPDATE versiones SET version = version + 1, modificado_en = strftime('%Y-%m-%d %H:%M:%f', 'now')
+    WHERE tabla = 'usuarios';
+END;
+CREATE TRIGGER IF NOT EXISTS trg_usuarios_version_del AFTER DELETE ON usuarios
+BEGIN
+    UPDATE versiones SET version = version + 1, modificado_en = strftime('%Y-%m-%d %H:%M:%f', 'now')
+    WHERE tabla = 'usuarios';
+END;
+
+-- =============================================
+-- SINCRONIZACIÓN POR DELTAS
+-- =============================================
+-- En vez del xid de PostgreSQL, cambio_xid es un contador global: con un
+-- solo escritor a la vez crece en orden de commit. Los DELETE dejan una
+-- lápida en `eliminados`.
+CREATE TABLE IF NOT EXISTS secuencia_cambios (
+    id     INTEGER PRIMARY KEY CHECK (id = 1),
+    valor  INTEGER NOT NULL
+);
+INSERT OR IGNORE INTO secuencia_cambios (id, valor) VALUES (1, 0);
+
+CREATE TABLE IF NOT EXISTS eliminados (
+    tabla         TEXT    NOT NULL,
+    id            INTEGER NOT NULL,
+    cambio_xid    INTEGER NOT NULL,
+    eliminado_en  TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (tabla, id)
+);
+CREATE INDEX IF NOT EXISTS idx_eliminados_cambio ON eliminados (tabla, cambio_xid);
+
+-- actividades
+CREATE INDEX IF NOT EXISTS idx_actividades_cambio ON actividades (cambio_xid);
+CREATE TRIGGER IF NOT EXISTS trg_actividades_cambio_ins AFTER INSERT ON actividades
+BEGIN
+    UPDATE secuencia_cambios SET valor = valor + 1 WHERE id = 1;
+    UPDATE actividades SET cambio_xid = (SELECT valor FROM secuencia_cambios WHERE id = 1)
+    WHERE id = NEW.id;
+END;
+CREATE TRIGGER IF NOT EXISTS trg_actividades_cambio_upd AFTER UPDATE ON actividades
+WHEN NEW.cambio_xid IS OLD.cambio_xid
+BEGIN
+    UPDATE secuencia_cambios SET valor = valor + 1 WHERE id = 1;
+    UPDATE actividades SET cambio_xid = (SELECT valor FROM secuencia_cambios WHERE id = 1)
+    WHERE id = NEW.id;
+END;
+CREATE TRIGGER IF NOT EXISTS trg_actividades_lapida AFTER DELETE ON actividades
+BEGIN
+    UPDATE secuencia_cambios SET valor = valor + 1 WHERE id = 1;
+    INSERT INTO eliminados (tabla, id, cambio_xid)
+    VALUES ('actividades', OLD.id, (SELECT valor FROM secuencia_cambios WHERE id = 1))
+    ON CONFLICT (tabla, id) DO UPDATE
+       SET cambio_xid = excluded.cambio_xid, eliminado_en = CURRENT_TIMESTAMP;
+END;
+
+-- finanzas
+CREATE INDEX IF NOT EXISTS idx_finanzas_cambio ON finanzas (cambio_xid);
+CREATE TRIGGER IF NOT EXISTS trg_finanzas_cambio_ins AFTER INSERT ON finanzas
+BEGIN
+    UPDATE secuencia_cambios SET valor = valor + 1 WHERE id = 1;
+    UPDATE finanzas SET cambio_xid = (SELECT valor FROM secuencia_cambios WHERE id = 1)
+    WHERE id = NEW.id;
+END;
+CREATE TRIGGER IF NOT EXISTS trg_finanzas_cambio_upd AFTER UPDATE ON finanzas
+WHEN NEW.cambio_xid IS OLD.cambio_xid
+BEGIN
+    UPDATE secuencia_cambios SET valor = valor + 1 WHERE id = 1;
+    UPDATE finanzas SET cambio_xid = (SELECT valor FROM secuencia_cambios WHERE id = 1)
+    WHERE id = NEW.id;
+END;
+CREATE TRIGGER IF NOT EXISTS trg_finanzas_lapida AFTER DELETE ON finanzas
+BEGIN
+    UPDATE secuencia_cambios SET valor = valor + 1 WHERE id = 1;
+    INSERT INTO eliminados (tabla, id, cambio_xid)
+    VALUES ('finanzas', OLD.id, (SELECT valor FROM secuencia_cambios WHERE id = 1))
+    ON CONFLICT (tabla, id) DO UPDATE
+       SET cambio_xid = excluded.cambio_xid, eliminado_en = CURRENT_TIMESTAMP;
+END;
@@ -17,6 +17,135 @@ function capitalizar(str) {
   return str.charAt(0).toUpperCase() + str.slice(1);
 }
 
+// Columnas que necesitan las vistas de lista (sin textos largos)
+const CAMPOS_LISTA_ACT = 'id,nombre,descripcion,responsable,fecha_inicio,fecha_limite,prioridad,completada,fecha_completado,completada_por,creada_por,estado';
+const CAMPOS_LISTA_FIN = 'id,fecha_compra,concepto,categoria,proveedor,cantidad,valor_unitario,valor_total,metodo_pago,responsable';
+
+// GET con validadores: se reenvía el ETag de la última respuesta y con un
+// 304 se reutiliza el cuerpo ya recibido
+const cacheGET = new Map();
+const CACHE_GET_MAX = 50;
+
+function fetchJSON(url) {
+  const previo = cacheGET.get(url);
+  const headers = previo ? { 'If-None-Match': previo.etag } : {};
+  return fetch(url, { headers, cache: 'no-store' })
+    .then(r => {
+      if (r.status === 304 && previo) return previo.data;
+      return r.json().then(data => {
+        const etag = r.headers.get('ETag');
+        if (r.ok && etag) {
+          cacheGET.delete(url);
+          cacheGET.set(url, { etag, data });
+          if (cacheGET.size > CACHE_GET_MAX) cacheGET.delete(cacheGET.keys().next().value);
+        }
+        return data;
+      });
+    });
+}
+
+// Cabeceras de las peticiones de escritura: el token de sesión identifica
+// al usuario en el servidor
+function headersSesion(json = true) {
+  const h = json ? { 'Content-Type': 'application/json' } : {};
+  if (me && me.token) h.Authorization = `Bearer ${me.token}`;
+  return h;
+}
+
+// Copias locales sincronizadas por deltas: el servidor devuelve sólo lo que
+// cambió desde el último token y los ids eliminados
+const copiaAct = { filas: new Map(), token: '0' };
+const copiaFin = { filas: new Map(), token: '0' };
+
+function sincronizar(url, copia, campos) {
+  return fetchJSON(`${url}?since=${encodeURIComponent(copia.token)}&fields=${campos}`)
+    .then(d => {
+      if (d.completo) copia.filas.clear();
+      d.eliminados.forEach(id => copia.filas.delete(id));
+      d.items.forEach(fila => copia.filas.set(fila.id, fila));
+      copia.token = d.token;
+      return [...copia.filas.values()];
+    });
+}
+
+// ==================== EVENTOS EN VIVO ====================
+// El servidor avisa por SSE cuando otro usuario cambia algo; se recarga sólo
+// la tabla afectada (por deltas) agrupando los avisos de ráfagas
+// Si el servidor no ofrece eventos (204, 503 o sin EventSource) se consulta
+// por sondeo cada SONDEO_MS; las listas piden sólo los deltas.
+const SONDEO_MS = 30000;
+let fuenteEventos = null;
+let sondeoEventos = null;
+let recargaPendiente = null;
+const tablasPendientes = new Set();
+
+function sondearCambios() {
+  if (sondeoEventos) return;
+  sondeoEventos = setInterval(() => {
+    ['actividades', 'finanzas'].forEach(t => tablasPendientes.add(t));
+    aplicarEventos();
+  }, SONDEO_MS);
+}
+
+function conectarEventos() {
+  if (fuenteEventos || sondeoEventos) return;
+  if (!window.EventSource) return sondearCambios();
+  fuenteEventos = new EventSource('/api/eventos');
+  fuenteEventos.onerror = () => {
+    // El navegador reintenta solo salvo que la conexión quede cerrada
+    if (fuenteEventos && fuenteEventos.readyState === EventSource.CLOSED) {
+      fuenteEventos = null;
+      sondearCambios();
+    }
+  };
+  fuenteEventos.onmessage = e => {
+    const ev = JSON.parse(e.data);
+    if (ev.accion === 'resync') ['actividades', 'finanzas', 'usuarios'].forEach(t => tablasPendientes.add(t));
+    else tablasPendientes.add(ev.tabla);
+    clearTimeout(recargaPendiente);
+    recargaPendiente = setTimeout(aplicarEventos, 300);
+  };
+}
+
+function desconectarEventos() {
+  if (fuenteEventos) fuenteEventos.close();
+  fuenteEventos = null;
+  clearInterval(sondeoEventos);
+  sondeoEventos = null;
+  clearTimeout(recargaPendiente);
+  tablasPendientes.clear();
+}
+
+function aplicarEventos() {
+  if (!me) return;
+  const tablas = new Set(tablasPendientes);
+  tablasPendientes.clear();
+  const usuarios = tablas.has('usuarios') ? cargarUsuarios() : Promise.resolve();
+  usuarios.then(() => {
+    if (tablas.has('actividades') || tablas.has('usuarios')) cargarActividades();
+    if (tablas.has('finanzas')) cargarFinanzas();
+  });
+}
+
+// Las escrituras devuelven la fila resultante: se aplica a la copia local y
+// se redibuja sin volver a pedir la lista
+function aplicarFila(copia, fila, campos, pintar) {
+  const proyectada = {};
+  campos.split(',').forEach(k => { if (k in fila) proyectada[k] = fila[k]; });
+  copia.filas.set(fila.id, proyectada);
+  pintar();
+}
+
+function quitarFila(copia, id, pintar) {
+  copia.filas.delete(id);
+  pintar();
+}
+
+function reiniciarCopias() {
+  [copiaAct, copiaFin].forEach(c => { c.filas.clear(); c.token = '0'; });
+  cacheGET.clear();
+}
+
 // ==================== TABS LOGIN ====================
 function switchTab(t) {
   document.querySelectorAll('.auth-tab').forEach((b, i) =>
@@ -120,15 +249,20 @@ function entrarApp() {
   } else {
     document.getElementById('btnNuevaActividad').style.display = '';
   }
+  const puedeImportar = me.rol === 'coordinador' || me.rol === 'director_financiero';
+  document.getElementById('btnImportar').style.display = puedeImportar ? '' : 'none';
   cargarUsuarios().then(() => {
     cargarActividades();
     cargarFinanzas();
   });
+  conectarEventos();
 }
 
 function logout() {
   me = null;
   usuariosCache = [];
+  desconectarEventos();
+  reiniciarCopias();
   localStorage.removeItem('utb_session');
   document.getElementById('loginScreen').style.display = 'flex';
   document.getElementById('appScreen').style.display = 'none';
@@ -139,8 +273,7 @@ function logout() {
 
 // ==================== CARGAR USUARIOS (para selects) ====================
 function cargarUsuarios() {
-  return fetch('/api/usuarios/listar')
-    .then(r => r.json())
+  return fetchJSON('/api/usuarios/listar')
     .then(usuarios => {
       usuariosCache = usuarios;
       llenarSelectResponsable('aResp');
@@ -180,6 +313,8 @@ function cambiarTab(tab) {
 
 // ==================== ESTADO DE ACTIVIDADES ====================
 function getEstado(act) {
+  // El servidor ya lo calcula (columna actividades.estado)
+  if (act.estado) return act.estado;
   if (!act.completada) return 'default';
   const lim = new Date(act.fecha_limite + 'T00:00:00');
   const comp = new Date(act.fecha_completado + 'T00:00:00');
@@ -264,8 +399,7 @@ function guardarActividad() {
     responsable,
     fecha_inicio: fechaInicio,
     fecha_limite: fechaLimite,
-    prioridad: document.getElementById('aPrio').value,
-    creada_por: me.user
+    prioridad: document.getElementById('aPrio').value
   };
 
   const url = editId !== null ? `/api/actividades/${editId}` : '/api/actividades';
@@ -273,14 +407,15 @@ function guardarActividad() {
 
   fetch(url, {
     method,
-    headers: { 'Content-Type': 'application/json' },
+    headers: headersSesion(),
     body: JSON.stringify(payload)
   })
     .then(r => r.json())
     .then(d => {
       if (d.ok) {
         cerrarModal('modalAct');
-        cargarActividades();
+        aplicarFila(copiaAct, d.actividad, CAMPOS_LISTA_ACT, pintarActividades);
+        cargarEstadisticas();
       } else alert(`❌ ${d.error}`);
     });
 }
@@ -324,7 +459,7 @@ function confirmarCompletar() {
 
   fetch(`/api/actividades/${pendiente}/completar`, {
     method: 'PUT',
-    headers: { 'Content-Type': 'application/json' },
+    headers: headersSesion(),
     body: JSON.stringify({
       fecha_completado: fechaComp,
       observaciones: obs,
@@ -335,7 +470,8 @@ function confirmarCompletar() {
     .then(d => {
       if (d.ok) {
         cerrarConfirm();
-        cargarActividades();
+        aplicarFila(copiaAct, d.actividad, CAMPOS_LISTA_ACT, pintarActividades);
+        cargarEstadisticas();
       } else alert(`❌ ${d.error}`);
     });
 }
@@ -422,9 +558,14 @@ function verDetalles(id) {
 // ==================== ELIMINAR ====================
 function eliminarActividad(id) {
   if (!confirm('¿Eliminar esta actividad? Esta acción no se puede deshacer.')) return;
-  fetch(`/api/actividades/${id}`, { method: 'DELETE' })
+  fetch(`/api/actividades/${id}`, { method: 'DELETE', headers: headersSesion(false) })
     .then(r => r.json())
-    .then(d => { if (d.ok) cargarActividades(); });
+    .then(d => {
+      if (d.ok) {
+        quitarFila(copiaAct, id, pintarActividades);
+        cargarEstadisticas();
+      }
+    });
 }
 
 // ==================== FILTRAR ====================
@@ -432,16 +573,13 @@ function filtrar(e, btn) {
   filtroAct = e;
   document.querySelectorAll('.fb').forEach(b => b.classList.remove('active'));
   btn.classList.add('active');
-  cargarActividades();
+  pintarActividades();
 }
 
 // ==================== CARGAR ACTIVIDADES ====================
-function cargarActividades() {
-  fetch('/api/actividades')
-    .then(r => r.json())
-    .then(acts => {
-      const cnt = { total: acts.length, default: 0, prematuro: 0, tiempo: 0, leve: 0, tarde: 0 };
-      acts.forEach(a => { const e = getEstado(a); cnt[e] = (cnt[e] || 0) + 1; });
+function cargarEstadisticas() {
+  return fetchJSON('/api/actividades/stats')
+    .then(cnt => {
 
       document.getElementById('statsGrid').innerHTML = `
         <div class="stat s-tot"><div class="sn">${cnt.total}</div><div class="sl">Total</div></div>
@@ -450,63 +588,73 @@ function cargarActividades() {
         <div class="stat s-vd"><div class="sn">${cnt.tiempo}</div><div class="sl">🟢 A tiempo</div></div>
         <div class="stat s-na"><div class="sn">${cnt.leve}</div><div class="sl">🟠 Retraso leve</div></div>
         <div class="stat s-ro"><div class="sn">${cnt.tarde}</div><div class="sl">🔴 Retraso grave</div></div>`;
+    });
+}
 
-      const filtradas = filtroAct === 'todas' ? acts : acts.filter(a => getEstado(a) === filtroAct);
-      const cont = document.getElementById('actList');
+function cargarActividades() {
+  cargarEstadisticas();
+  sincronizar('/api/actividades', copiaAct, CAMPOS_LISTA_ACT).then(pintarActividades);
+}
 
-      if (!filtradas.length) {
-        cont.innerHTML = '<div class="empty"><div class="ei">📭</div><p>No hay actividades en esta categoría</p></div>';
-        return;
-      }
+// Dibuja la lista desde la copia local (sin pedir nada al servidor)
+function pintarActividades() {
+  const filtradas = [...copiaAct.filas.values()]
+    .filter(a => filtroAct === 'todas' || getEstado(a) === filtroAct)
+    .sort((a, b) => (a.fecha_limite || '').localeCompare(b.fecha_limite || '') || a.id - b.id);
+  const cont = document.getElementById('actList');
 
-      cont.innerHTML = filtradas.map(a => {
-        const e = getEstado(a);
-        const done = a.completada;
-        const esResponsable = a.responsable === me.cargo;
-        const usuResp = usuariosCache.find(u => u.cargo === a.responsable);
-        const nombreResp = usuResp ? capitalizar(usuResp.nombre) : a.responsable;
-
-        const bComp = done
-          ? `<button class="btn-a btn-lock" disabled title="Ya completada">✅</button>`
-          : esResponsable
-            ? `<button class="btn-a btn-comp" onclick='solicitarCompletar(${JSON.stringify(a)})' title="Completar">✔</button>`
-            : `<button class="btn-a btn-lock" disabled title="Solo el responsable puede completarla">🔒</button>`;
-
-        const esCoordinador = me.rol === 'coordinador';
-        const bEdit = done
-          ? `<button class="btn-a btn-lock" disabled title="Bloqueado">🔒</button>`
-          : esCoordinador
-            ? `<button class="btn-a btn-edit" onclick="abrirModalActividad(${a.id})" title="Editar">✏️</button>`
-            : `<button class="btn-a btn-lock" disabled title="Solo el Director de Proyecto puede editar">🔒</button>`;
-
-        const compInfo = done
-          ? `<div class="a-meta">✅ Completada el ${ff(a.fecha_completado)} por ${capitalizar(a.completada_por)}</div>`
-          : '';
-
-        return `
-          <div class="a-row ${EROW[e]}" onclick="verDetalles(${a.id})">
-            <div>
-              <div class="a-nom ${done ? 'done' : ''}">${a.nombre}</div>
-              ${a.descripcion ? `<div class="a-desc">${a.descripcion}</div>` : ''}
-              <div class="a-meta">${PRIO[a.prioridad] || ''} · Creada por ${capitalizar(a.creada_por) || '-'}</div>
-              ${compInfo}
-            </div>
-            <div style="font-weight:600;color:#444;font-size:.88rem;">
-              ${nombreResp}<br>
-              <small style="color:#888;font-weight:400">${a.responsable}</small>
-            </div>
-            <div style="font-size:.86rem;color:#666;">${ff(a.fecha_inicio)}</div>
-            <div style="font-size:.86rem;font-weight:600;">${ff(a.fecha_limite)}</div>
-            <div><span class="badge ${EBADGE[e]}">${ELABEL[e]}</span></div>
-            <div class="acc" onclick="event.stopPropagation()">
-              <button class="btn-a btn-view" onclick="verDetalles(${a.id})" title="Ver detalles">👁️</button>
-              ${bComp}
-              ${bEdit}
-              <button class="btn-a btn-del" onclick="eliminarActividad(${a.id})" title="Eliminar">🗑</button>
-            </div>
-          </div>`;
-      }).join('');
-    });
+  if (!filtradas.length) {
+    cont.innerHTML = '<div class="empty"><div class="ei">📭</div><p>No hay actividades en esta categoría</p></div>';
+    return;
+  }
+
+  cont.innerHTML = filtradas.map(a => {
+    const e = getEstado(a);
+    const done = a.completada;
+    const esResponsable = a.responsable === me.cargo;
+    const usuResp = usuariosCache.find(u => u.cargo === a.responsable);
+    const nombreResp = usuResp ? capitalizar(usuResp.nombre) : a.responsable;
+
+    const bComp = done
+      ? `<button class="btn-a btn-lock" disabled title="Ya completada">✅</button>`
+      : esResponsable
+        ? `<button class="btn-a btn-comp" onclick='solicitarCompletar(${JSON.stringify(a)})' title="Completar">✔</button>`
+        : `<button class="btn-a btn-lock" disabled title="Solo el responsable puede completarla">🔒</button>`;
+
+    const esCoordinador = me.rol === 'coordinador';
+    const bEdit = done
+      ? `<button class="btn-a btn-lock" disabled title="Bloqueado">🔒</button>`
+      : esCoordinador
+        ? `<button class="btn-a btn-edit" onclick="abrirModalActividad(${a.id})" title="Editar">✏️</button>`
+        : `<button class="btn-a btn-lock" disabled title="Solo el Director de Proyecto puede editar">🔒</button>`;
+
+    const compInfo = done
+      ? `<div class="a-meta">✅ Completada el ${ff(a.fecha_completado)} por ${capitalizar(a.completada_por)}</div>`
+      : '';
+
+    return `
+      <div class="a-row ${EROW[e]}" onclick="verDetalles(${a.id})">
+        <div>
+          <div class="a-nom ${done ? 'done' : ''}">${a.nombre}</div>
+          ${a.descripcion ? `<div class="a-desc">${a.descripcion}</div>` : ''}
+          <div class="a-meta">${PRIO[a.prioridad] || ''} · Creada por ${capitalizar(a.creada_por) || '-'}</div>
+          ${compInfo}
+        </div>
+        <div style="font-weight:600;color:#444;font-size:.88rem;">
+          ${nombreResp}<br>
+          <small style="color:#888;font-weight:400">${a.responsable}</small>
+        </div>
+        <div style="font-size:.86rem;color:#666;">${ff(a.fecha_inicio)}</div>
+        <div style="font-size:.86rem;font-weight:600;">${ff(a.fecha_limite)}</div>
+        <div><span class="badge ${EBADGE[e]}">${ELABEL[e]}</span></div>
+        <div class="acc" onclick="event.stopPropagation()">
+          <button class="btn-a btn-view" onclick="verDetalles(${a.id})" title="Ver detalles">👁️</button>
+          ${bComp}
+          ${bEdit}
+          <button class="btn-a btn-del" onclick="eliminarActividad(${a.id})" title="Eliminar">🗑</button>
+        </div>
+      </div>`;
+  }).join('');
 }
 
 // ==================== FINANZAS ====================
@@ -515,11 +663,10 @@ function abrirModalFinanza(id = null) {
   llenarSelectResponsable('fResponsable');
 
   if (id !== null) {
-    fetch(`/api/finanzas`)
+    fetch(`/api/finanzas/${id}`)
       .then(r => r.json())
-      .then(finanzas => {
-        const fin = finanzas.find(f => f.id === id);
-        if (!fin) return;
+      .then(fin => {
+        if (fin.error) return;
 
         document.getElementById('mFinTitle').textContent = '✏️ Editar Gasto';
         document.getElementById('fFecha').value = fin.fecha_compra;
@@ -585,75 +732,157 @@ function guardarFinanza() {
 
   fetch(url, {
     method,
-    headers: { 'Content-Type': 'application/json' },
+    headers: headersSesion(),
     body: JSON.stringify(payload)
   })
     .then(r => r.json())
     .then(d => {
       if (d.ok) {
         cerrarModal('modalFin');
-        cargarFinanzas();
+        aplicarFila(copiaFin, d.finanza, CAMPOS_LISTA_FIN, pintarFinanzas);
+        cargarTotalFinanzas();
       } else alert(`❌ ${d.error}`);
     });
 }
 
 function eliminarFinanza(id) {
   if (!confirm('¿Eliminar este gasto? Esta acción no se puede deshacer.')) return;
-  fetch(`/api/finanzas/${id}`, { method: 'DELETE' })
+  fetch(`/api/finanzas/${id}`, { method: 'DELETE', headers: headersSesion(false) })
     .then(r => r.json())
-    .then(d => { if (d.ok) cargarFinanzas(); });
+    .then(d => {
+      if (d.ok) {
+        quitarFila(copiaFin, id, pintarFinanzas);
+        cargarTotalFinanzas();
+      }
+    });
+}
+
+function cargarTotalFinanzas() {
+  return fetchJSON('/api/finanzas/total')
+    .then(d => {
+      document.getElementById('finTotal').textContent =
+        `$${d.total.toLocaleString('es-CO', { minimumFractionDigits: 2, maximumFractionDigits: 2 })}`;
+    });
 }
 
 function cargarFinanzas() {
-  fetch('/api/finanzas')
-    .then(r => r.json())
-    .then(finanzas => {
-      const cont = document.getElementById('finList');
+  cargarTotalFinanzas();
+  sincronizar('/api/finanzas', copiaFin, CAMPOS_LISTA_FIN).then(pintarFinanzas);
+}
 
-      const total = finanzas.reduce((sum, f) => sum + f.valor_total, 0);
-      document.getElementById('finTotal').textContent =
-        `$${total.toLocaleString('es-CO', { minimumFractionDigits: 2, maximumFractionDigits: 2 })}`;
+// Dibuja la lista desde la copia local (sin pedir nada al servidor)
+function pintarFinanzas() {
+  const finanzas = [...copiaFin.filas.values()]
+    .sort((a, b) => (b.fecha_compra || '').localeCompare(a.fecha_compra || '') || b.id - a.id);
+  const cont = document.getElementById('finList');
 
-      if (!finanzas.length) {
-        cont.innerHTML = '<div class="empty"><div class="ei">💰</div><p>No hay gastos registrados</p></div>';
-        return;
-      }
+  if (!finanzas.length) {
+    cont.innerHTML = '<div class="empty"><div class="ei">💰</div><p>No hay gastos registrados</p></div>';
+    return;
+  }
 
-      const esDirectorFin = me.rol === 'director_financiero';
-
-      cont.innerHTML = finanzas.map(f => {
-        const usuResp = usuariosCache.find(u => u.cargo === f.responsable);
-        const nombreResp = usuResp ? capitalizar(usuResp.nombre) : (f.responsable || '-');
-
-        const bEdit = esDirectorFin
-          ? `<button class="btn-a btn-edit" onclick="abrirModalFinanza(${f.id})" title="Editar">✏️</button>`
-          : `<button class="btn-a btn-lock" disabled title="Solo Director Financiero">🔒</button>`;
-
-        const bDel = esDirectorFin
-          ? `<button class="btn-a btn-del" onclick="eliminarFinanza(${f.id})" title="Eliminar">🗑</button>`
-          : '';
-
-        return `
-          <div class="f-row">
-            <div style="font-size:.85rem;color:#666;">${ff(f.fecha_compra)}</div>
-            <div style="font-weight:600;color:#333;">${f.concepto}</div>
-            <div style="font-size:.82rem;color:#666;">${f.categoria || '-'}</div>
-            <div style="font-size:.82rem;color:#666;">${f.proveedor || '-'}</div>
-            <div style="text-align:center;font-weight:600;">${f.cantidad}</div>
-            <div style="text-align:right;color:#00843D;font-weight:600;">$${f.valor_unitario.toLocaleString()}</div>
-            <div style="text-align:right;color:#003B71;font-weight:700;font-size:1rem;">$${f.valor_total.toLocaleString()}</div>
-            <div class="acc">
-              ${bEdit}
-              ${bDel}
-            </div>
-          </div>`;
-      }).join('');
-    });
+  const esDirectorFin = me.rol === 'director_financiero';
+
+  cont.innerHTML = finanzas.map(f => {
+    const usuResp = usuariosCache.find(u => u.cargo === f.responsable);
+    const nombreResp = usuResp ? capitalizar(usuResp.nombre) : (f.responsable || '-');
+
+    const bEdit = esDirectorFin
+      ? `<button class="btn-a btn-edit" onclick="abrirModalFinanza(${f.id})" title="Editar">✏️</button>`
+      : `<button class="btn-a btn-lock" disabled title="Solo Director Financiero">🔒</button>`;
+
+    const bDel = esDirectorFin
+      ? `<button class="btn-a btn-del" onclick="eliminarFinanza(${f.id})" title="Eliminar">🗑</button>`
+      : '';
+
+    return `
+      <div class="f-row">
+        <div style="font-size:.85rem;color:#666;">${ff(f.fecha_compra)}</div>
+        <div style="font-weight:600;color:#333;">${f.concepto}</div>
+        <div style="font-size:.82rem;color:#666;">${f.categoria || '-'}</div>
+        <div style="font-size:.82rem;color:#666;">${f.proveedor || '-'}</div>
+        <div style="text-align:center;font-weight:600;">${f.cantidad}</div>
+        <div style="text-align:right;color:#00843D;font-weight:600;">$${f.valor_unitario.toLocaleString()}</div>
+        <div style="text-align:right;color:#003B71;font-weight:700;font-size:1rem;">$${f.valor_total.toLocaleString()}</div>
+        <div class="acc">
+          ${bEdit}
+          ${bDel}
+        </div>
+      </div>`;
+  }).join('');
 }
 
 // ==================== EXPORTAR EXCEL ====================
 function exportarExcel() {
-  window.location.href = '/api/exportar/excel';
+  const btn = document.querySelector('.btn-export');
+  const textoOriginal = btn.textContent;
+  const restaurar = () => { btn.disabled = false; btn.textContent = textoOriginal; };
+
+  btn.disabled = true;
+  btn.textContent = '⏳ Preparando...';
+
+  fetch('/api/exportar/jobs', { method: 'POST', headers: headersSesion(false) })
+    .then(r => r.json())
+    .then(d => {
+      if (!d.ok) {
+        // Sin cola disponible: exportación directa
+        restaurar();
+        window.location.href = '/api/exportar/excel';
+        return;
+      }
+      const consultar = () => fetch(`/api/exportar/jobs/${d.id}`)
+        .then(r => r.json())
+        .then(job => {
+          if (job.estado === 'listo') {
+            restaurar();
+            window.location.href = job.descarga;
+          } else if (job.estado === 'error' || job.error) {
+            restaurar();
+            alert(`❌ ${job.error || 'Error al exportar'}`);
+          } else {
+            const filas = Object.values(job.hojas || {}).reduce((s, n) => s + n, 0);
+            btn.textContent = `⏳ Exportando... ${filas} filas`;
+            setTimeout(consultar, 1000);
+          }
+        });
+      consultar();
+    })
+    .catch(() => { restaurar(); alert('❌ Error de conexión'); });
+}
+
+// ==================== IMPORTAR ====================
+// Un .xlsx con las hojas del export (se importan las que el rol permite) o
+// un .csv de la pestaña actual
+function importarArchivo(input) {
+  const archivo = input.files[0];
+  input.value = '';
+  if (!archivo) return;
+  const datos = new FormData();
+  datos.append('archivo', archivo);
+  const tabla = archivo.name.toLowerCase().endsWith('.csv') ? `?tabla=${tabActual}` : '';
+
+  fetch(`/api/importar${tabla}`, { method: 'POST', headers: headersSesion(false), body: datos })
+    .then(r => r.json())
+    .then(d => {
+      if (!d.hojas) {
+        alert(`❌ ${d.error}`);
+        return;
+      }
+      const lineas = Object.entries(d.hojas).map(([hoja, inf]) => {
+        if (inf.error) return `${capitalizar(hoja)}: ${inf.error}`;
+        const errores = inf.errores.slice(0, 5).map(e => `  Fila ${e.fila}: ${e.error}`);
+        const resumen = d.ok
+          ? `${inf.insertadas} importadas, ${inf.omitidas} ya existían`
+          : `${inf.total_errores} filas con errores`;
+        return [`${capitalizar(hoja)}: ${resumen}`, ...errores].join('\n');
+      });
+      alert(`${d.ok ? '✅' : '❌'} ${lineas.join('\n\n')}`);
+      if (d.ok) {
+        cargarActividades();
+        cargarFinanzas();
+      }
+    })
+    .catch(() => alert('❌ Error de conexión'));
 }
 
 // ==================== INIT ====================
@@ -663,7 +892,9 @@ document.addEventListener('DOMContentLoaded', () => {
   if (sesionGuardada) {
     try {
       me = JSON.parse(sesionGuardada);
-      entrarApp();
+      // Sesiones guardadas antes de existir el token: pedir login de nuevo
+      if (me.token) entrarApp();
+      else { me = null; localStorage.removeItem('utb_session'); }
     } catch (e) {
       localStorage.removeItem('utb_session');
     }